@@ -0,0 +1,374 @@
+"""Alinhadores simulados: executáveis no lugar de clustalw, muscle, clustalo, mafft, probcons e t_coffee
+
+Aceitam as mesmas linhas de comando montadas por alinhadores.make_* e produzem uma saída válida (clustal ou
+fasta, em arquivo ou no stdout, conforme as flags de cada alinhador) completando as sequências com gaps. O tempo
+de execução, a memória ocupada, o ruído no stderr e a taxa de falhas são configuráveis, para testar a
+concorrência, o cache de árvores guia e o pipeline em fluxo sem os alinhadores de verdade (ver benchmark.py).
+
+Os sorteios (variação do tempo, ruído, falhas) dependem só da semente, do alinhador, do nome do fasta e dos
+parâmetros: a mesma chamada tem sempre o mesmo resultado.
+
+Uso:
+    python alinhador_simulado.py --instalar /tmp/simulados --segundos 0.2 --falha 0.05
+    PATH=/tmp/simulados:$PATH python main.py --algoritmo clustalo
+
+    with simulados(segundos=0.1):  # em Python: instala em uma pasta temporária e ajusta o PATH
+        align_sequence('muscle', ...)
+"""
+import argparse
+import json
+import os
+import random
+import stat
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+ALINHADORES = ('clustalw', 'muscle', 'clustalo', 'mafft', 'probcons', 't_coffee')
+
+ARQUIVO_CONFIGURACAO = 'simulacao.json'
+# JSON com valores que substituem os do arquivo de configuração, para ajustes sem reinstalar
+VARIAVEL_CONFIGURACAO = 'NMFSTP_SIMULACAO'
+
+CONFIGURACAO_PADRAO = {
+    'segundos': 0.0,  # tempo fixo de cada execução
+    'segundos_por_celula': 0.0,  # mais este tempo por célula (sequências² x comprimento), como o custo de um alinhador
+    'variacao': 0.0,  # variação relativa do tempo (0.2: ±20%)
+    'ocupar_cpu': False,  # espera ocupada em vez de sleep
+    'memoria_mb': 0,  # memória alocada (e tocada) durante a execução
+    'ruido_stderr': 0.0,  # probabilidade de escrever um aviso no stderr (align_sequence trata como erro)
+    'falha': 0.0,  # probabilidade de terminar com código 1, sem saída
+    'progresso_stderr': False,  # como os alinhadores reais: progresso no stderr sem as flags de silêncio
+    'semente': 0,
+}
+
+# Parâmetros (args, kwargs) com que cada alinhador escreve clustal, como em sort_params
+PARAMETROS_CLUSTAL = {
+    'clustalw': ((), {'OUTPUT': 'CLUSTAL'}),
+    'muscle': (('clw', 'quiet'), {}),
+    'clustalo': ((), {'outfmt': 'clu'}),
+    'mafft': (('clustalout', 'quiet'), {}),
+    'probcons': (('clustalw',), {}),
+    't_coffee': ((), {'output': 'clustalw'}),
+}
+
+
+def _valor(token: str) -> tuple:
+    """'-KEY=valor', '--key=valor' ou '-key valor' (um único elemento, como em make_muscle) -> (key, valor)"""
+    token = token.lstrip('-')
+    for separador in ('=', ' '):
+        if separador in token:
+            chave, valor = token.split(separador, 1)
+            return chave, valor
+
+    return token, None
+
+
+def _opcoes_com_valor(tokens: list) -> dict:
+    """Opções no estilo '-op 2' / '--op 2' (mafft, probcons, t_coffee): a próxima palavra é o valor se não for uma opção"""
+    opcoes = {}
+    i = 0
+    while i < len(tokens):
+        chave = tokens[i].lstrip('-')
+        if i + 1 < len(tokens) and not tokens[i + 1].startswith('-'):
+            opcoes[chave] = tokens[i + 1]
+            i += 2
+        else:
+            opcoes[chave] = None
+            i += 1
+
+    return opcoes
+
+
+def interpretar(alinhador: str, argv: list) -> dict:
+    """Entrada, saída e formato de uma linha de comando de alinhadores.make_*
+
+    Returns:
+        dict: entrada, saida (None: stdout), clustal, silencioso, sobrescrever, arvore_saida, arvore_entrada
+    """
+    comando = {'saida': None, 'clustal': False, 'silencioso': False, 'sobrescrever': True,
+               'arvore_saida': None, 'arvore_entrada': None}
+
+    match alinhador:
+        case 'clustalw':
+            opcoes = {chave.upper(): valor for chave, valor in map(_valor, argv)}
+            comando['entrada'] = opcoes.get('INFILE')
+            comando['saida'] = opcoes.get('OUTFILE')
+            comando['clustal'] = opcoes.get('OUTPUT', 'CLUSTAL').upper() == 'CLUSTAL'
+            comando['silencioso'] = 'QUIET' in opcoes
+            comando['arvore_entrada'] = opcoes.get('USETREE')
+            # Como o clustalw: a árvore guia vai para o lado do fasta, se não for informada
+            if comando['arvore_entrada'] is None and comando['entrada']:
+                comando['arvore_saida'] = opcoes.get('NEWTREE') or os.path.splitext(comando['entrada'])[0] + '.dnd'
+
+        case 'muscle':
+            opcoes = {}
+            i = 0
+            while i < len(argv):
+                if argv[i] in ('-in', '-out') and i + 1 < len(argv):
+                    opcoes[argv[i][1:]] = argv[i + 1]
+                    i += 2
+                else:
+                    chave, valor = _valor(argv[i])
+                    opcoes[chave] = valor
+                    i += 1
+            comando['entrada'] = opcoes.get('in')
+            comando['saida'] = opcoes.get('out')
+            comando['clustal'] = 'clw' in opcoes or 'clwstrict' in opcoes
+            comando['silencioso'] = 'quiet' in opcoes
+
+        case 'clustalo':
+            opcoes = {}
+            i = 0
+            while i < len(argv):
+                if argv[i] in ('-i', '-o') and i + 1 < len(argv):
+                    opcoes[argv[i][1:]] = argv[i + 1]
+                    i += 2
+                else:
+                    chave, valor = _valor(argv[i])
+                    opcoes[chave] = valor
+                    i += 1
+            comando['entrada'] = opcoes.get('i') or opcoes.get('infile')
+            comando['saida'] = opcoes.get('o') or opcoes.get('outfile')
+            comando['clustal'] = opcoes.get('outfmt') in ('clu', 'clustal', 'aln')
+            comando['silencioso'] = 'v' not in opcoes and 'verbose' not in opcoes
+            comando['sobrescrever'] = 'force' in opcoes
+            comando['arvore_saida'] = opcoes.get('guidetree-out')
+            comando['arvore_entrada'] = opcoes.get('guidetree-in')
+
+        case 'mafft' | 'probcons':
+            # O fasta é o último argumento
+            opcoes = _opcoes_com_valor(argv[:-1])
+            comando['entrada'] = argv[-1] if argv else None
+            comando['clustal'] = ('clustalout' if alinhador == 'mafft' else 'clustalw') in opcoes
+            comando['silencioso'] = 'quiet' in opcoes if alinhador == 'mafft' else 'v' not in opcoes
+
+        case 't_coffee':
+            opcoes = _opcoes_com_valor(argv[1:])
+            comando['entrada'] = argv[0] if argv else None
+            comando['saida'] = opcoes.get('outfile')
+            comando['clustal'] = (opcoes.get('output') or 'clustalw').lower().startswith('clustal')
+            comando['silencioso'] = 'quiet' in opcoes
+
+        case _:
+            raise ValueError(f'Alinhador desconhecido: {alinhador}')
+
+    return comando
+
+
+def ler_fasta(path: str) -> list:
+    """(nome, sequência) de cada registro; o nome é a primeira palavra do cabeçalho"""
+    sequencias = []
+    with open(path) as f:
+        for linha in f:
+            linha = linha.strip()
+            if linha.startswith('>'):
+                sequencias.append([(linha[1:].split() or [''])[0], []])
+            elif linha and sequencias:
+                sequencias[-1][1].append(linha)
+
+    return [(nome, ''.join(partes)) for nome, partes in sequencias]
+
+
+def alinhar(sequencias: list) -> list:
+    """Alinhamento trivial: as sequências completadas com gaps até o mesmo comprimento"""
+    comprimento = max((len(seq) for _, seq in sequencias), default=0)
+    return [(nome, seq.ljust(comprimento, '-')) for nome, seq in sequencias]
+
+
+def formatar_clustal(alinhamento: list, largura_bloco: int = 60) -> str:
+    largura = max(len(nome) for nome, _ in alinhamento) + 6
+    linhas = ['CLUSTAL W (simulado) multiple sequence alignment', '', '']
+
+    for inicio in range(0, len(alinhamento[0][1]), largura_bloco):
+        blocos = [seq[inicio:inicio + largura_bloco] for _, seq in alinhamento]
+        for (nome, _), bloco in zip(alinhamento, blocos):
+            linhas.append(nome.ljust(largura) + bloco)
+        # Linha de conservação: '*' nas colunas iguais em todas as sequências
+        linhas.append(' ' * largura + ''.join('*' if coluna[0] != '-' and len(set(coluna)) == 1 else ' '
+                                              for coluna in zip(*blocos)))
+        linhas.append('')
+
+    return '\n'.join(linhas) + '\n'
+
+
+def formatar_fasta(alinhamento: list, largura_linha: int = 60) -> str:
+    linhas = []
+    for nome, seq in alinhamento:
+        linhas.append(f'>{nome}')
+        linhas.extend(seq[i:i + largura_linha] for i in range(0, len(seq), largura_linha))
+
+    return '\n'.join(linhas) + '\n'
+
+
+def formatar_arvore_guia(nomes: list) -> str:
+    """Árvore guia em newick (uma escada com as sequências na ordem do fasta)"""
+    arvore = f'{nomes[-1]}:0.1'
+    for nome in reversed(nomes[:-1]):
+        arvore = f'({nome}:0.1,{arvore}):0.1'
+
+    return arvore.rsplit(':', 1)[0] + ';\n'
+
+
+def carregar_configuracao(path: str = None) -> dict:
+    """CONFIGURACAO_PADRAO, atualizada pelo arquivo de `instalar` e depois por VARIAVEL_CONFIGURACAO"""
+    configuracao = dict(CONFIGURACAO_PADRAO)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            configuracao.update(json.load(f))
+    if os.environ.get(VARIAVEL_CONFIGURACAO):
+        configuracao.update(json.loads(os.environ[VARIAVEL_CONFIGURACAO]))
+
+    return configuracao
+
+
+def _esperar(segundos: float, ocupar_cpu: bool) -> None:
+    if not ocupar_cpu:
+        time.sleep(segundos)
+        return
+
+    fim = time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        pass
+
+
+def simular(alinhador: str, argv: list, configuracao: dict) -> int:
+    """Executa o alinhador simulado
+
+    Returns:
+        int: código de saída
+    """
+    try:
+        comando = interpretar(alinhador, argv)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    entrada = comando['entrada']
+    if not entrada or not os.path.exists(entrada):
+        print(f'{alinhador}: não foi possível abrir o arquivo de entrada {entrada}', file=sys.stderr)
+        return 1
+    if comando['arvore_entrada'] and not os.path.exists(comando['arvore_entrada']):
+        print(f'{alinhador}: não foi possível abrir a árvore guia {comando["arvore_entrada"]}', file=sys.stderr)
+        return 1
+    if comando['saida'] and os.path.exists(comando['saida']) and not comando['sobrescrever']:
+        # Como o clustalo sem --force
+        print(f'ERROR: Cowardly refusing to overwrite already existing file \'{comando["saida"]}\'. '
+              f'Use --force to force overwriting.', file=sys.stderr)
+        return 1
+
+    # Os caminhos mudam a cada execução (áreas de trabalho): só o nome do fasta e os parâmetros entram na semente
+    parametros = ' '.join(token for token in argv if os.sep not in token)
+    rng = random.Random(f'{configuracao["semente"]}:{alinhador}:{os.path.basename(entrada)}:{parametros}')
+    sorteio_falha, sorteio_ruido, sorteio_tempo = rng.random(), rng.random(), rng.random()
+
+    sequencias = ler_fasta(entrada)
+    alinhamento = alinhar(sequencias)
+    celulas = len(alinhamento) ** 2 * (len(alinhamento[0][1]) if alinhamento else 0)
+
+    memoria = bytearray(int(configuracao['memoria_mb'] * 2 ** 20))
+    for i in range(0, len(memoria), 4096):
+        memoria[i] = 1
+
+    if configuracao['progresso_stderr'] and not comando['silencioso']:
+        print(f'{alinhador} (simulado): {len(sequencias)} sequências', file=sys.stderr)
+
+    segundos = configuracao['segundos'] + configuracao['segundos_por_celula'] * celulas
+    segundos *= 1 + configuracao['variacao'] * (2 * sorteio_tempo - 1)
+    _esperar(max(segundos, 0.0), configuracao['ocupar_cpu'])
+    del memoria
+
+    if sorteio_falha < configuracao['falha']:
+        print(f'{alinhador} (simulado): falha sorteada', file=sys.stderr)
+        return 1
+    if len(sequencias) < 2:
+        print(f'{alinhador}: o arquivo {entrada} tem menos de 2 sequências', file=sys.stderr)
+        return 1
+
+    saida = formatar_clustal(alinhamento) if comando['clustal'] else formatar_fasta(alinhamento)
+    if comando['saida']:
+        with open(comando['saida'], 'w') as f:
+            f.write(saida)
+    else:
+        sys.stdout.write(saida)
+
+    if comando['arvore_saida']:
+        with open(comando['arvore_saida'], 'w') as f:
+            f.write(formatar_arvore_guia([nome for nome, _ in alinhamento]))
+
+    if sorteio_ruido < configuracao['ruido_stderr']:
+        print(f'WARNING: {alinhador} (simulado): aviso sorteado', file=sys.stderr)
+
+    return 0
+
+
+def instalar(pasta: str, **configuracao) -> str:
+    """Cria em `pasta` um executável para cada alinhador e o arquivo de configuração
+
+    Args:
+        pasta (str): Pasta dos executáveis (coloque-a no início do PATH)
+        **configuracao: Valores de CONFIGURACAO_PADRAO
+
+    Returns:
+        str: a pasta
+    """
+    desconhecidas = set(configuracao) - set(CONFIGURACAO_PADRAO)
+    if desconhecidas:
+        raise ValueError(f'Configurações desconhecidas: {sorted(desconhecidas)}')
+
+    os.makedirs(pasta, exist_ok=True)
+    path_configuracao = os.path.join(os.path.abspath(pasta), ARQUIVO_CONFIGURACAO)
+    with open(path_configuracao, 'w') as f:
+        json.dump({**CONFIGURACAO_PADRAO, **configuracao}, f, indent=2)
+
+    for alinhador in ALINHADORES:
+        path = os.path.join(pasta, alinhador)
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.abspath(__file__)}" '
+                    f'--configuracao "{path_configuracao}" {alinhador} "$@"\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    return pasta
+
+
+@contextmanager
+def simulados(pasta: str = None, **configuracao):
+    """Instala os alinhadores simulados e os coloca no início do PATH enquanto o bloco executa
+
+    Args:
+        pasta (str, optional): Pasta dos executáveis. Defaults to uma pasta temporária, apagada no fim.
+        **configuracao: Valores de CONFIGURACAO_PADRAO
+    """
+    temporaria = pasta is None
+    pasta = instalar(pasta or tempfile.mkdtemp(prefix='alinhadores_simulados_'), **configuracao)
+    path_anterior = os.environ.get('PATH', '')
+    os.environ['PATH'] = os.path.abspath(pasta) + os.pathsep + path_anterior
+
+    try:
+        yield pasta
+    finally:
+        os.environ['PATH'] = path_anterior
+        if temporaria:
+            import shutil
+            shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # Chamado pelos executáveis de `instalar`: --configuracao <arquivo> <alinhador> <argumentos do make_*>
+    if len(sys.argv) > 3 and sys.argv[1] == '--configuracao':
+        sys.exit(simular(sys.argv[3], sys.argv[4:], carregar_configuracao(sys.argv[2])))
+
+    parser = argparse.ArgumentParser(description='Instala os alinhadores simulados')
+    parser.add_argument('--instalar', metavar='PASTA', required=True, help='Pasta dos executáveis')
+    for chave, valor in CONFIGURACAO_PADRAO.items():
+        opcao = '--' + chave.replace('_', '-')
+        if isinstance(valor, bool):
+            parser.add_argument(opcao, action='store_true', dest=chave)
+        else:
+            parser.add_argument(opcao, type=type(valor), default=valor, dest=chave)
+    args = vars(parser.parse_args())
+
+    pasta = instalar(args.pop('instalar'), **args)
+    print(f'export PATH={os.path.abspath(pasta)}{os.pathsep}$PATH')
@@ -1,5 +1,3 @@
-from Bio import AlignIO
-
 def make_clustalw(file: str, output: str, *args, **kwargs) -> list:
     """Monta o comando para execução do clustalw em linha de comando
     gera 2 arquivos de saida por padrão
@@ -131,6 +129,8 @@ def make_t_coffee(file: str, outfile: str, *args, **kwargs):
 
 
 def to_clustalw(file: str):
+    from Bio import AlignIO
+
     # Lê o alinhamento em formato FASTA
     alignment = AlignIO.read(file, "fasta")
 
@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+
+PASTAS = ('Entradas', 'tmp', 'Trees', 'Subtrees')
+
+
+def diretorio_tmpfs() -> str:
+    """Diretório em memória (tmpfs) disponível: /dev/shm no Linux, senão o diretório temporário do sistema"""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+
+    return tempfile.gettempdir()
+
+
+class AreaTrabalho:
+    """Área de trabalho isolada de uma execução (ou iteração).
+
+    Cada execução recebe a sua própria árvore de diretórios (Entradas, tmp, Trees, Subtrees), em vez das pastas
+    compartilhadas data/out/tmp, data/out/Trees e data/out/Subtrees, de forma que várias execuções possam
+    rodar ao mesmo tempo no mesmo host. Os arquivos intermediários podem ficar em um tmpfs (/dev/shm) e só os
+    artefatos finais são promovidos para `raiz/<id_execucao>`.
+
+    Args:
+        raiz (str): Pasta persistente das execuções (ex.: data/out/runs)
+        id_execucao (str, optional): Identificador da execução. Defaults to host_pid_timestamp.
+        tmpfs (bool | str, optional): True usa diretorio_tmpfs(); uma string é usada como diretório base
+            dos intermediários; False/None mantém os intermediários em `raiz/<id_execucao>/work`. Defaults to False.
+    """
+
+    def __init__(self, raiz: str, id_execucao: str = None, tmpfs=False):
+        self.raiz = raiz
+        self.id_execucao = id_execucao or f'{socket.gethostname()}_{os.getpid()}_{int(time.time() * 1000)}'
+        self.persistente = os.path.join(raiz, self.id_execucao)
+
+        if tmpfs:
+            base = tmpfs if isinstance(tmpfs, str) else diretorio_tmpfs()
+            self.trabalho = os.path.join(base, 'nmfstp', self.id_execucao)
+        else:
+            self.trabalho = os.path.join(self.persistente, 'work')
+
+        for pasta in PASTAS:
+            os.makedirs(os.path.join(self.trabalho, pasta), exist_ok=True)
+        os.makedirs(self.persistente, exist_ok=True)
+
+        # O estado da execução fica na pasta persistente, para que coletar_lixo encontre as áreas em tmpfs
+        self._gravar_estado('executando')
+
+    @property
+    def entradas(self) -> str:
+        return os.path.join(self.trabalho, 'Entradas')
+
+    @property
+    def tmp(self) -> str:
+        return os.path.join(self.trabalho, 'tmp')
+
+    @property
+    def trees(self) -> str:
+        return os.path.join(self.trabalho, 'Trees')
+
+    @property
+    def subtrees(self) -> str:
+        return os.path.join(self.trabalho, 'Subtrees')
+
+    def _gravar_estado(self, estado: str) -> None:
+        with open(os.path.join(self.persistente, 'estado.json'), 'w') as f:
+            json.dump({
+                'estado': estado,
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'trabalho': self.trabalho,
+                'atualizado': time.time(),
+            }, f)
+
+    def promover(self, origem: str, destino: str = None) -> str:
+        """Copia um arquivo ou pasta da área de trabalho para a pasta persistente da execução
+
+        Args:
+            origem (str): Arquivo ou pasta (ex.: area.trees)
+            destino (str, optional): Caminho relativo dentro da pasta persistente. Defaults to o nome da origem.
+
+        Returns:
+            str: caminho persistente
+        """
+        destino = os.path.join(self.persistente, destino or os.path.basename(os.path.normpath(origem)))
+
+        if os.path.isdir(origem):
+            shutil.copytree(origem, destino, dirs_exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            shutil.copy2(origem, destino)
+
+        return destino
+
+    def interromper(self) -> None:
+        """Marca a execução como interrompida mantendo os intermediários, para que ela possa ser retomada
+        (ver checkpoint.py). coletar_lixo só apaga áreas interrompidas depois de `idade_maxima`.
+        """
+        self._gravar_estado('interrompida')
+
+    def finalizar(self, manter_intermediarios: bool = False) -> None:
+        """Marca a execução como finalizada e apaga os intermediários"""
+        if not manter_intermediarios:
+            shutil.rmtree(self.trabalho, ignore_errors=True)
+
+        self._gravar_estado('finalizada')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finalizar()
+        return False
+
+
+def _processo_ativo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def _ler_estado(raiz: str, id_execucao: str) -> dict:
+    try:
+        with open(os.path.join(raiz, id_execucao, 'estado.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _parada(estado: dict) -> bool:
+    """Execução deste host que não terminou: interrompida por erro ou cujo processo não existe mais"""
+    if estado['host'] != socket.gethostname():
+        return False
+
+    return estado['estado'] == 'interrompida' or (estado['estado'] == 'executando' and not _processo_ativo(estado['pid']))
+
+
+def area_retomavel(raiz: str, id_execucao: str) -> bool:
+    """A execução parou neste host e os seus intermediários ainda existem"""
+    estado = _ler_estado(raiz, id_execucao)
+
+    return estado is not None and _parada(estado) and os.path.isdir(estado['trabalho'])
+
+
+def coletar_lixo(raiz: str, idade_maxima: float = 24 * 3600) -> list:
+    """Apaga os intermediários de execuções que terminaram ou que pararam (interrompidas ou cujo processo
+    não existe mais neste host) há mais de `idade_maxima` segundos; antes disso elas ainda podem ser retomadas.
+    As pastas persistentes (artefatos promovidos) são mantidas. Execuções finalizadas há mais de
+    `idade_maxima` segundos e sem artefatos são removidas por completo.
+
+    Args:
+        raiz (str): Pasta persistente das execuções
+        idade_maxima (float, optional): Idade em segundos. Defaults to 24h.
+
+    Returns:
+        list: ids das execuções limpas
+    """
+    limpas = []
+    if not os.path.isdir(raiz):
+        return limpas
+
+    for id_execucao in os.listdir(raiz):
+        path_estado = os.path.join(raiz, id_execucao, 'estado.json')
+        estado = _ler_estado(raiz, id_execucao)
+        if estado is None:
+            continue
+
+        antiga = time.time() - estado['atualizado'] > idade_maxima
+        if estado['estado'] not in ('finalizada', 'abandonada') and not (_parada(estado) and antiga):
+            continue
+
+        if os.path.isdir(estado['trabalho']):
+            shutil.rmtree(estado['trabalho'], ignore_errors=True)
+            limpas.append(id_execucao)
+
+            if estado['estado'] != 'finalizada':
+                estado['estado'] = 'abandonada'
+                with open(path_estado, 'w') as f:
+                    json.dump(estado, f)
+
+        artefatos = [nome for nome in os.listdir(os.path.join(raiz, id_execucao)) if nome not in ('estado.json', 'work')]
+        if not artefatos and antiga:
+            shutil.rmtree(os.path.join(raiz, id_execucao), ignore_errors=True)
+
+    return limpas
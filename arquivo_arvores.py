@@ -0,0 +1,222 @@
+"""Arquivo único de árvores: todas as árvores (ou subárvores) de uma pasta em um só arquivo
+
+Cada árvore é uma linha (nome, newick) de uma tabela SQLite, em vez de um arquivo nexus por árvore: gravar as
+subárvores de uma árvore é uma única transação, apagar todas é apagar um arquivo, e qualquer árvore é lida pelo
+nome sem percorrer as demais. Uma árvore do arquivo é referenciada por `<arquivo>.arvores#<nome>` (ver
+referencia), aceito onde o código espera o caminho de uma árvore (ler_arvore, ArvoreCompacta.ler, checkpoints).
+O newick é o mesmo que o Bio.Phylo escreve no bloco TREES do nexus, então nada se perde na conversão.
+
+Exportação para nexus (ou outro formato do Bio.Phylo) sob demanda:
+    python arquivo_arvores.py data/out/runs/tarefa_3/Trees/arvores.arvores --listar
+    python arquivo_arvores.py data/out/runs/tarefa_3/Trees/arvores.arvores --exportar pasta [--nomes tree_a tree_b]
+"""
+import argparse
+import io
+import os
+import sqlite3
+import threading
+
+
+EXTENSAO = '.arvores'
+SEPARADOR = '#'
+
+# Nomes dos arquivos únicos dentro das pastas Trees e Subtrees (ver pipeline_arquivos)
+ARQUIVO_ARVORES = 'arvores' + EXTENSAO
+ARQUIVO_SUBARVORES = 'subarvores' + EXTENSAO
+
+
+def e_arquivo(path: str) -> bool:
+    """O caminho é um arquivo único de árvores (e não uma pasta ou um arquivo de árvore)"""
+    return path.endswith(EXTENSAO)
+
+
+def referencia(path_arquivo: str, nome: str) -> str:
+    """Referência a uma árvore de um arquivo único, usada no lugar do caminho de um arquivo de árvore"""
+    return f'{path_arquivo}{SEPARADOR}{nome}'
+
+
+def separar(caminho: str) -> tuple:
+    """(arquivo, nome) de uma referência ou (caminho, None) para um arquivo de árvore comum"""
+    path_arquivo, separador, nome = caminho.rpartition(EXTENSAO + SEPARADOR)
+    if not separador:
+        return caminho, None
+
+    return path_arquivo + EXTENSAO, nome
+
+
+def nome_arvore(caminho: str) -> str:
+    """Nome do arquivo da árvore ou nome dentro do arquivo único (o mesmo nome que ela teria como arquivo)"""
+    path_arquivo, nome = separar(caminho)
+    return nome if nome is not None else os.path.basename(path_arquivo)
+
+
+def existe(caminho: str) -> bool:
+    """Como os.path.exists, também para as referências a árvores de um arquivo único"""
+    path_arquivo, nome = separar(caminho)
+    if nome is None:
+        return os.path.exists(path_arquivo)
+
+    return os.path.exists(path_arquivo) and nome in abrir(path_arquivo)
+
+
+def ler_arvore(caminho: str, data_format: str = 'nexus'):
+    """Phylo.read de um arquivo de árvore ou de uma referência (o formato só vale para arquivos)"""
+    path_arquivo, nome = separar(caminho)
+    if nome is None:
+        from Bio import Phylo
+        return Phylo.read(path_arquivo, data_format)
+
+    return abrir(path_arquivo).ler(nome)
+
+
+def listar(path: str) -> list:
+    """Árvores de uma pasta (caminhos, exceto file.gitkeep) ou de um arquivo único (referências)"""
+    if e_arquivo(path):
+        return [referencia(path, nome) for nome in abrir(path).nomes()] if os.path.exists(path) else []
+
+    return [os.path.join(path, nome) for nome in os.listdir(path) if nome != 'file.gitkeep']
+
+
+class ArquivoArvores:
+    """Arquivo único (SQLite) com árvores em newick, indexadas pelo nome
+
+    Vários processos podem gravar no mesmo arquivo (ex.: a etapa de árvores do pipeline): o SQLite serializa as
+    escritas e o journal WAL deixa as leituras correrem durante elas. Uma conexão só pode ser usada pela thread
+    que a abriu; use abrir para reaproveitar a conexão da thread atual.
+
+    Args:
+        path (str): Arquivo (criado se não existir)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conexao = sqlite3.connect(path, timeout=30)
+        self.conexao.execute('PRAGMA journal_mode=WAL')
+        # Intermediários: sem fsync a cada transação (o WAL mantém o arquivo consistente se o processo cair)
+        self.conexao.execute('PRAGMA synchronous=NORMAL')
+        self.conexao.execute('CREATE TABLE IF NOT EXISTS Arvore (id INTEGER PRIMARY KEY, nome TEXT UNIQUE NOT NULL, newick TEXT NOT NULL)')
+        self.conexao.commit()
+
+    def gravar(self, nome: str, tree) -> str:
+        """Grava (ou substitui) uma árvore e devolve a referência a ela"""
+        return self.gravar_varias([(nome, tree)])[0]
+
+    def gravar_varias(self, arvores) -> list:
+        """Grava (ou substitui) várias árvores em uma transação
+
+        Args:
+            arvores: pares (nome, árvore do Bio.Phylo)
+
+        Returns:
+            list: referências às árvores gravadas
+        """
+        from Bio import Phylo
+
+        linhas = []
+        for nome, tree in arvores:
+            texto = io.StringIO()
+            Phylo.write(tree, texto, 'newick')
+            linhas.append((nome, texto.getvalue().strip()))
+
+        with self.conexao:
+            self.conexao.executemany('INSERT OR REPLACE INTO Arvore (nome, newick) VALUES (?, ?)', linhas)
+
+        return [referencia(self.path, nome) for nome, _ in linhas]
+
+    def newick(self, nome: str) -> str:
+        linha = self.conexao.execute('SELECT newick FROM Arvore WHERE nome = ?', (nome,)).fetchone()
+        if linha is None:
+            raise KeyError(f'{nome} não está em {self.path}')
+
+        return linha[0]
+
+    def ler(self, nome: str):
+        """Árvore (Bio.Phylo) gravada com o nome"""
+        from Bio import Phylo
+
+        return Phylo.read(io.StringIO(self.newick(nome)), 'newick')
+
+    def nomes(self) -> list:
+        """Nomes das árvores, na ordem de gravação"""
+        return [nome for nome, in self.conexao.execute('SELECT nome FROM Arvore ORDER BY id')]
+
+    def exportar(self, pasta: str, data_format: str = 'nexus', nomes: list = None, extensao: str = None) -> list:
+        """Escreve árvores do arquivo como arquivos comuns (um por árvore)
+
+        Args:
+            pasta (str): Pasta de saída
+            data_format (str, optional): Formato do Bio.Phylo. Defaults to 'nexus'.
+            nomes (list, optional): Árvores exportadas. Defaults to todas.
+            extensao (str, optional): Troca a extensão dos nomes. Defaults to o próprio nome (os nomes gravados
+                pelo pipeline são os nomes dos arquivos, ex.: tree_x.nexus).
+
+        Returns:
+            list: caminhos dos arquivos escritos
+        """
+        from Bio import Phylo
+
+        os.makedirs(pasta, exist_ok=True)
+        caminhos = []
+        for nome in nomes or self.nomes():
+            caminho = os.path.join(pasta, f'{os.path.splitext(nome)[0]}.{extensao}' if extensao else nome)
+            Phylo.write(self.ler(nome), caminho, data_format)
+            caminhos.append(caminho)
+
+        return caminhos
+
+    def consolidar(self) -> None:
+        """Leva o WAL para o arquivo principal, para que o arquivo possa ser copiado sozinho (ex.: AreaTrabalho.promover)"""
+        self.conexao.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def fechar(self) -> None:
+        self.conexao.close()
+
+    def __contains__(self, nome: str) -> bool:
+        return self.conexao.execute('SELECT 1 FROM Arvore WHERE nome = ?', (nome,)).fetchone() is not None
+
+    def __len__(self):
+        return self.conexao.execute('SELECT COUNT(*) FROM Arvore').fetchone()[0]
+
+
+_abertos = threading.local()
+
+
+def abrir(path: str) -> ArquivoArvores:
+    """ArquivoArvores do caminho, reaproveitando a conexão aberta pela thread atual
+
+    Uma conexão é reaberta se o arquivo foi apagado ou substituído desde então (ex.: por clean_files).
+    """
+    abertos = _abertos.__dict__.setdefault('arquivos', {})
+    chave = os.path.abspath(path)
+    inode = os.stat(path).st_ino if os.path.exists(path) else None
+
+    arquivo, inode_aberto = abertos.get(chave, (None, None))
+    if arquivo is None or inode is None or inode != inode_aberto:
+        if arquivo is not None:
+            arquivo.fechar()
+        arquivo = ArquivoArvores(path)
+        abertos[chave] = (arquivo, os.stat(path).st_ino)
+
+    return arquivo
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Lista ou exporta as árvores de um arquivo único')
+    parser.add_argument('arquivo', help=f'Arquivo único ({EXTENSAO})')
+    parser.add_argument('--listar', action='store_true', help='Lista os nomes das árvores')
+    parser.add_argument('--exportar', metavar='PASTA', help='Exporta as árvores, um arquivo por árvore')
+    parser.add_argument('--formato', default='nexus', help='Formato da exportação (Bio.Phylo). Padrão: nexus')
+    parser.add_argument('--extensao', help='Extensão dos arquivos exportados (padrão: a do nome de cada árvore)')
+    parser.add_argument('--nomes', nargs='+', help='Árvores exportadas (padrão: todas)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.arquivo):
+        parser.error(f'{args.arquivo} não existe')
+
+    arquivo = ArquivoArvores(args.arquivo)
+    if args.listar:
+        print('\n'.join(arquivo.nomes()))
+    if args.exportar:
+        caminhos = arquivo.exportar(args.exportar, args.formato, args.nomes, args.extensao)
+        print(f'{len(caminhos)} árvores exportadas para {args.exportar}')
+    arquivo.fechar()
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+# Parâmetros que não alteram a árvore guia (saída, mensagens, threads e etapas progressiva/refinamento).
+# Qualquer outro parâmetro entra na chave do cache.
+PARAMETROS_IGNORADOS = {
+    'clustalw': {
+        'OUTPUT', 'OUTFILE', 'QUIET', 'SEQNOS', 'SEQNO_RANGE', 'OUTORDER', 'CASE', 'STATS', 'RANGE',
+        'GAPOPEN', 'GAPEXT', 'GAPDIST', 'ENDGAPS', 'NOPGAP', 'NOHGAP', 'HGAPRESIDUES', 'MAXDIV',
+        'MATRIX', 'DNAMATRIX', 'TRANSWEIGHT', 'ITERATION', 'NUMITER',
+    },
+    'clustalo': {
+        'outfmt', 'threads', 'residuenumber', 'wrap', 'verbose', 'force', 'log', 'v', 'guidetree-out', 'distmat-out',
+    },
+}
+
+# Parâmetro (do make_*) com que cada alinhador recebe uma árvore guia pronta.
+# O mafft não entra: o --treeout grava newick, mas o --treein espera o formato próprio do mafft
+# (conversão pelo newick2mafft.rb, que não faz parte da instalação do Dockerfile).
+USAR_ARVORE = {
+    'clustalw': 'USETREE',
+    'clustalo': 'guidetree-in',
+}
+
+
+def hash_arquivo(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+
+    return h.hexdigest()
+
+
+class CacheArvoreGuia:
+    """Cache de árvores guia (.dnd) dos alinhadores progressivos.
+
+    A chave é o hash do fasta de entrada mais os parâmetros que afetam a árvore guia. Variações que só mudam
+    parâmetros da etapa progressiva ou de refinamento reaproveitam a árvore já calculada (clustalw -USETREE,
+    clustalo --guidetree-in) e pulam a etapa de distâncias O(n²).
+
+    Args:
+        pasta (str): Pasta do cache (compartilhada entre execuções)
+    """
+
+    def __init__(self, pasta: str):
+        self.pasta = os.path.abspath(pasta)
+        os.makedirs(self.pasta, exist_ok=True)
+
+    @staticmethod
+    def suporta(algoritmo: str) -> bool:
+        return algoritmo.lower() in USAR_ARVORE
+
+    def chave(self, algoritmo: str, path_in_fasta: str, args: tuple, kwargs: dict) -> str:
+        """Chave do cache: hash do fasta + algoritmo + parâmetros que afetam a árvore guia"""
+        algoritmo = algoritmo.lower()
+        ignorados = PARAMETROS_IGNORADOS.get(algoritmo, set())
+
+        tags = sorted(str(tag) for tag in args if tag not in ignorados)
+        params = sorted((str(k), str(v)) for k, v in kwargs.items() if k not in ignorados and k != USAR_ARVORE.get(algoritmo))
+
+        h = hashlib.sha256()
+        h.update(hash_arquivo(path_in_fasta).encode())
+        h.update(repr((algoritmo, tags, params)).encode())
+
+        return h.hexdigest()
+
+    def caminho(self, chave: str) -> str:
+        return os.path.join(self.pasta, f'{chave}.dnd')
+
+    def buscar(self, chave: str) -> str:
+        """Caminho da árvore guia em cache ou None"""
+        path = self.caminho(chave)
+        return path if os.path.exists(path) else None
+
+    def guardar(self, chave: str, path_dnd: str) -> str:
+        """Copia uma árvore guia para o cache (escrita atômica, segura entre execuções simultâneas)"""
+        if not os.path.exists(path_dnd) or os.path.getsize(path_dnd) == 0:
+            return None
+
+        fd, tmp = tempfile.mkstemp(dir=self.pasta, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(path_dnd, tmp)
+        os.replace(tmp, self.caminho(chave))
+
+        return self.caminho(chave)
+
+    def preparar(self, algoritmo: str, path_in_fasta: str, file_out_dnd: str, args: tuple, kwargs: dict) -> tuple:
+        """Ajusta os parâmetros do alinhador para usar a árvore em cache ou para gravar a árvore calculada
+
+        Args:
+            algoritmo (str): Alinhador
+            path_in_fasta (str): Fasta de entrada
+            file_out_dnd (str): Onde o alinhador deve gravar a árvore guia calculada
+            args (tuple), kwargs (dict): Parâmetros do alinhador
+
+        Returns:
+            tuple: (args, kwargs, chave, reaproveitada)
+        """
+        algoritmo = algoritmo.lower()
+        chave = self.chave(algoritmo, path_in_fasta, args, kwargs)
+        kwargs = dict(kwargs)
+        path_cache = self.buscar(chave)
+
+        if path_cache:
+            kwargs[USAR_ARVORE[algoritmo]] = path_cache
+            return args, kwargs, chave, True
+
+        # O clustalw grava o .dnd em file_out_dnd (NEWTREE, ver align_sequence)
+        if algoritmo == 'clustalo':
+            kwargs['guidetree-out'] = file_out_dnd
+
+        return args, kwargs, chave, False
@@ -0,0 +1,331 @@
+"""Benchmark das etapas do NMFSt.P
+
+Mede v_sequences, extrair_informacoes_fasta, construir_arvores (por método de distância e modelo),
+make_matrix e compare_subtrees (e as versões por assinatura) sobre:
+- os FASTAs ORTHOMCL de files/input (alinhamentos simulados completando as sequências com gaps);
+- conjuntos sintéticos gerados com semente fixa, variando a quantidade de taxa e o comprimento das sequências.
+
+Tudo roda em uma pasta temporária (banco, log e arquivos intermediários), sem tocar em data/ nem em dados.db.
+O resultado (tempos, vazão, pico de memória e curvas de escala) é gravado em JSON.
+
+Com --alinhador-simulado também mede o pipeline em fluxo (pipeline_arquivos) sobre os FASTAs ORTHOMCL, com os
+alinhadores simulados de alinhador_simulado.py no lugar dos reais, variando os alinhamentos simultâneos.
+
+Com --verificar-importacao só confere o tempo de import dos pontos de entrada, como verificar_importacao.py.
+
+Uso:
+    python benchmark.py --saida benchmark.json
+    python benchmark.py --taxa 8 16 32 64 --comprimentos 100 300 1000 --arquivos 10
+    python benchmark.py --alinhador-simulado clustalo --segundos-alinhamento 0.2 --workers-alinhamento 1 2 4
+    python benchmark.py --verificar-importacao
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from verificar_importacao import tempo_importacao, verificar_importacao
+
+AMINOACIDOS = 'ACDEFGHIKLMNPQRSTVWY'
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+ENTRADAS = os.path.join(RAIZ, 'files', 'input')
+
+
+def medir(funcao, *args, repeticoes: int = 3, preparar=None, **kwargs) -> dict:
+    """Mede o tempo de uma função (melhor e mediana de `repeticoes`) e o pico de memória (tracemalloc, em uma execução extra)
+
+    Args:
+        funcao (callable): Função medida
+        repeticoes (int, optional): Quantidade de execuções cronometradas. Defaults to 3.
+        preparar (callable, optional): Chamada antes de cada execução, fora do tempo medido (ex.: restaurar arquivos)
+
+    Returns:
+        dict: segundos, mediana, pico_memoria (bytes) e o retorno da última execução em 'retorno'
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        retorno = funcao(*args, **kwargs)
+        tempos.append(time.perf_counter() - inicio)
+
+    # O tracemalloc deixa a execução mais lenta, então o pico de memória é medido separadamente
+    if preparar:
+        preparar()
+    tracemalloc.start()
+    funcao(*args, **kwargs)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'segundos': min(tempos), 'mediana': statistics.median(tempos), 'pico_memoria': pico, 'retorno': retorno}
+
+
+def gerar_sequencias(rng: random.Random, taxa: int, comprimento: int, taxa_mutacao: float = 0.15) -> list:
+    """Gera sequências de proteína evoluindo a partir de uma ancestral por bissecções sucessivas,
+    para que as árvores tenham estrutura (e subárvores repetidas entre arquivos)
+
+    Returns:
+        list: lista de (nome, sequência)
+    """
+    ancestral = ''.join(rng.choice(AMINOACIDOS) for _ in range(comprimento))
+
+    def mutar(seq):
+        return ''.join(rng.choice(AMINOACIDOS) if rng.random() < taxa_mutacao else c for c in seq)
+
+    sequencias = [ancestral]
+    while len(sequencias) < taxa:
+        sequencias = [mutar(s) for s in sequencias for _ in range(2)]
+
+    return [(f'taxon{i}', seq) for i, seq in enumerate(sequencias[:taxa])]
+
+
+def escrever_fasta(path: str, sequencias: list) -> None:
+    with open(path, 'w') as f:
+        for nome, seq in sequencias:
+            f.write(f'>{nome}\n{seq}\n')
+
+
+def escrever_clustal(path: str, sequencias: list) -> None:
+    """Escreve um alinhamento em formato clustal, completando as sequências com gaps até o mesmo comprimento"""
+    from Bio.Align import MultipleSeqAlignment
+    from Bio import AlignIO
+    from Bio.Seq import Seq
+    from Bio.SeqRecord import SeqRecord
+
+    comprimento = max(len(seq) for _, seq in sequencias)
+    alinhamento = MultipleSeqAlignment(
+        [SeqRecord(Seq(seq.ljust(comprimento, '-')), id=nome) for nome, seq in sequencias]
+    )
+    AlignIO.write(alinhamento, path, 'clustal')
+
+
+def ler_fasta(path: str) -> list:
+    from Bio import SeqIO
+
+    return [(record.id.split('|')[0], str(record.seq)) for record in SeqIO.parse(path, 'fasta')]
+
+
+def preparar_conjunto(pasta: str, conjuntos: dict) -> dict:
+    """Cria as pastas de um conjunto de dados: fasta (original), fasta_trabalho, aln, trees e subtrees
+
+    Args:
+        pasta (str): Pasta do conjunto
+        conjuntos (dict): nome do arquivo -> lista de (nome, sequência)
+
+    Returns:
+        dict: caminhos das pastas
+    """
+    pastas = {nome: os.path.join(pasta, nome) for nome in ('fasta', 'fasta_trabalho', 'aln', 'trees', 'subtrees')}
+    for p in pastas.values():
+        os.makedirs(p, exist_ok=True)
+
+    for nome, sequencias in conjuntos.items():
+        escrever_fasta(os.path.join(pastas['fasta'], nome), sequencias)
+        escrever_clustal(os.path.join(pastas['aln'], f'{nome}.aln'), sequencias)
+
+    return pastas
+
+
+def medir_conjunto(main, pastas: dict, args, rotulo: dict) -> list:
+    """Executa e mede todas as etapas sobre um conjunto de dados"""
+    from subarvores import IndiceAssinaturas
+    from resultados import compare_subtrees_colunar, ComparadorIncremental
+
+    resultados = []
+    n_arquivos = len(os.listdir(pastas['aln']))
+
+    def registrar(etapa, medicao, itens, **extra):
+        medicao.pop('retorno', None)
+        medicao.update(rotulo)
+        medicao.update(extra)
+        medicao['etapa'] = etapa
+        medicao['itens'] = itens
+        medicao['itens_por_segundo'] = itens / medicao['segundos'] if medicao['segundos'] else None
+        resultados.append(medicao)
+        print(f"  {etapa:<28} {extra or ''} {medicao['segundos']:.4f}s", file=sys.stderr)
+
+    def restaurar_fasta():
+        shutil.rmtree(pastas['fasta_trabalho'])
+        shutil.copytree(pastas['fasta'], pastas['fasta_trabalho'])
+
+    registrar('v_sequences', medir(main.v_sequences, pastas['fasta_trabalho'], repeticoes=args.repeticoes,
+                                   preparar=restaurar_fasta), n_arquivos)
+    registrar('extrair_informacoes_fasta', medir(main.extrair_informacoes_fasta, pastas['fasta'],
+                                                 repeticoes=args.repeticoes), n_arquivos)
+
+    for metodo in args.metodos:
+        for modelo in args.modelos:
+            registrar('construir_arvores',
+                      medir(main.construir_arvores, pastas['aln'], pastas['trees'], modelo, 'nexus', metodo,
+                            repeticoes=args.repeticoes),
+                      n_arquivos, distance_method=metodo, evolutionary_model=modelo)
+
+    # As etapas seguintes usam as árvores do primeiro método/modelo
+    main.construir_arvores(pastas['aln'], pastas['trees'], args.modelos[0], 'nexus', args.metodos[0])
+
+    medicao = medir(main.make_matrix, pastas['trees'], pastas['subtrees'], 'nexus', repeticoes=args.repeticoes)
+    matrix_subtree, max_columns, max_rows = medicao['retorno']
+    n_subarvores = sum(1 for row in matrix_subtree for path in row if path is not None)
+    registrar('make_matrix', medicao, n_arquivos, subarvores=n_subarvores)
+
+    n_pares = (max_rows * max_columns) ** 2
+    if n_pares <= args.max_pares_original:
+        registrar('compare_subtrees',
+                  medir(lambda: main.compare_subtrees(max_rows, max_columns, matrix_subtree, main.fill_dict({}, max_columns)),
+                        repeticoes=1),
+                  n_pares)
+
+    medicao = medir(IndiceAssinaturas.from_matrix, matrix_subtree, 'nexus', repeticoes=args.repeticoes)
+    indice = medicao['retorno']
+    registrar('IndiceAssinaturas.from_matrix', medicao, n_subarvores, assinaturas=len(indice))
+    registrar('compare_subtrees_colunar', medir(compare_subtrees_colunar, indice, repeticoes=args.repeticoes),
+              len(indice) ** 2)
+
+    def streaming():
+        comparador = ComparadorIncremental(IndiceAssinaturas())
+        for registros in main.gerar_subarvores(pastas['trees'], pastas['subtrees'], 'nexus'):
+            comparador.consumir(registros)
+        return comparador.resultado
+
+    registrar('gerar_subarvores+ComparadorIncremental', medir(streaming, repeticoes=args.repeticoes), n_arquivos)
+
+    return resultados
+
+
+def medir_pipeline(main, pastas: dict, args, rotulo: dict) -> list:
+    """Mede pipeline_arquivos com os alinhadores simulados (tempo fixo por alinhamento, ver alinhador_simulado.py)"""
+    from alinhador_simulado import PARAMETROS_CLUSTAL, simulados
+
+    resultados = []
+    n_arquivos = len(os.listdir(pastas['fasta']))
+    args_alinhador, kwargs_alinhador = PARAMETROS_CLUSTAL[args.alinhador_simulado]
+    d_parametros_arvore = {'evolutionary_model': args.modelos[0], 'output_format': 'nexus',
+                           'distance_method': args.metodos[0]}
+    saidas = [os.path.join(os.path.dirname(pastas['fasta']), nome) for nome in ('aln_pipeline', 'trees_pipeline', 'subtrees_pipeline')]
+    for p in saidas:
+        os.makedirs(p, exist_ok=True)
+
+    with simulados(segundos=args.segundos_alinhamento, semente=args.semente):
+        for workers in args.workers_alinhamento:
+            medicao = medir(lambda: list(main.pipeline_arquivos(args.alinhador_simulado, pastas['fasta'], *saidas,
+                                                                d_parametros_arvore, *args_alinhador,
+                                                                workers_alinhamento=workers, **kwargs_alinhador)),
+                            repeticoes=args.repeticoes)
+            medicao.pop('retorno')
+            medicao.update(rotulo, etapa='pipeline_arquivos', itens=n_arquivos, workers_alinhamento=workers,
+                           alinhador=args.alinhador_simulado, segundos_alinhamento=args.segundos_alinhamento)
+            medicao['itens_por_segundo'] = n_arquivos / medicao['segundos'] if medicao['segundos'] else None
+            resultados.append(medicao)
+            print(f"  {'pipeline_arquivos':<28} {{'workers_alinhamento': {workers}}} {medicao['segundos']:.4f}s", file=sys.stderr)
+
+    return resultados
+
+
+def curvas(resultados: list, eixo: str) -> dict:
+    """Agrupa os tempos por etapa ao longo de um eixo (taxa ou comprimento) dos conjuntos sintéticos"""
+    saida = {}
+    for r in resultados:
+        if r.get('conjunto') != f'sintetico_{eixo}':
+            continue
+        chave = r['etapa']
+        if 'distance_method' in r:
+            chave = f"{chave}[{r['distance_method']},{r['evolutionary_model']}]"
+        saida.setdefault(chave, []).append([r[eixo], r['segundos']])
+
+    return saida
+
+
+def main_benchmark(args) -> dict:
+    rng = random.Random(args.semente)
+    pasta = tempfile.mkdtemp(prefix='bench_nmfstp_')
+    cwd = os.getcwd()
+
+    try:
+        # O banco (dados.db) é criado no diretório atual
+        os.chdir(pasta)
+        sys.path.insert(0, RAIZ)
+        tempo_import, _ = tempo_importacao('main')
+        import main
+        from tabelas import Base, engine
+        Base.metadata.create_all(engine)
+
+        resultados = []
+
+        arquivos = sorted(os.listdir(ENTRADAS))[:args.arquivos]
+        print(f'ORTHOMCL ({len(arquivos)} arquivos)', file=sys.stderr)
+        pastas = preparar_conjunto(os.path.join(pasta, 'orthomcl'),
+                                   {nome: ler_fasta(os.path.join(ENTRADAS, nome)) for nome in arquivos})
+        resultados += medir_conjunto(main, pastas, args, {'conjunto': 'orthomcl'})
+        if args.alinhador_simulado:
+            resultados += medir_pipeline(main, pastas, args, {'conjunto': 'orthomcl'})
+
+        for taxa in args.taxa:
+            print(f'Sintético: {taxa} taxa x {args.comprimentos[0]}', file=sys.stderr)
+            conjuntos = {f'SINT{i}': gerar_sequencias(rng, taxa, args.comprimentos[0]) for i in range(args.arquivos_sinteticos)}
+            pastas = preparar_conjunto(os.path.join(pasta, f'taxa_{taxa}'), conjuntos)
+            resultados += medir_conjunto(main, pastas, args, {'conjunto': 'sintetico_taxa', 'taxa': taxa,
+                                                              'comprimento': args.comprimentos[0]})
+
+        for comprimento in args.comprimentos:
+            print(f'Sintético: {args.taxa[0]} taxa x {comprimento}', file=sys.stderr)
+            conjuntos = {f'SINT{i}': gerar_sequencias(rng, args.taxa[0], comprimento) for i in range(args.arquivos_sinteticos)}
+            pastas = preparar_conjunto(os.path.join(pasta, f'comprimento_{comprimento}'), conjuntos)
+            resultados += medir_conjunto(main, pastas, args, {'conjunto': 'sintetico_comprimento', 'taxa': args.taxa[0],
+                                                              'comprimento': comprimento})
+    finally:
+        os.chdir(cwd)
+        if not args.manter:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    return {
+        'data': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'host': platform.node(),
+        'processador': platform.processor() or platform.machine(),
+        'python': platform.python_version(),
+        'parametros': vars(args),
+        'tempo_import_main': tempo_import,
+        'resultados': resultados,
+        'curvas': {'taxa': curvas(resultados, 'taxa'), 'comprimento': curvas(resultados, 'comprimento')},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark das etapas do NMFSt.P')
+    parser.add_argument('--saida', default='benchmark.json', help='Arquivo JSON de saída')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--arquivos', type=int, default=10, help='Quantidade de arquivos ORTHOMCL usados')
+    parser.add_argument('--arquivos-sinteticos', type=int, default=4, help='Arquivos por conjunto sintético')
+    parser.add_argument('--taxa', type=int, nargs='+', default=[8, 16, 32, 64])
+    parser.add_argument('--comprimentos', type=int, nargs='+', default=[100, 300, 1000])
+    parser.add_argument('--metodos', nargs='+', default=['identity', 'blosum62'], help='distance_method de construir_arvores')
+    parser.add_argument('--modelos', nargs='+', default=['nj', 'upgma'], help='evolutionary_model de construir_arvores')
+    parser.add_argument('--max-pares-original', type=int, default=20_000,
+                        help='Só mede o compare_subtrees original até essa quantidade de pares (R*C)^2')
+    parser.add_argument('--alinhador-simulado', choices=['clustalw', 'muscle', 'clustalo', 'mafft', 'probcons', 't_coffee'],
+                        help='Mede também pipeline_arquivos com esse alinhador simulado')
+    parser.add_argument('--segundos-alinhamento', type=float, default=0.1, help='Tempo de cada alinhamento simulado')
+    parser.add_argument('--workers-alinhamento', type=int, nargs='+', default=[1, 4],
+                        help='Alinhamentos simultâneos medidos no pipeline')
+    parser.add_argument('--manter', action='store_true', help='Não apaga a pasta temporária')
+    parser.add_argument('--verificar-importacao', action='store_true',
+                        help='Só confere o tempo de import dos pontos de entrada (ver verificar_importacao.py)')
+    args = parser.parse_args()
+
+    if args.verificar_importacao:
+        sys.exit(0 if verificar_importacao() else 1)
+
+    relatorio = main_benchmark(args)
+
+    with open(args.saida, 'w') as f:
+        json.dump(relatorio, f, indent=2)
+
+    print(f'Resultado gravado em {args.saida}', file=sys.stderr)
@@ -0,0 +1,166 @@
+"""Suporte de bootstrap dos clados das árvores
+
+As B replicatas reamostram as colunas do alinhamento codificado com reposição (uma matriz de índices B x L,
+convertida em pesos por coluna). As matrizes de distâncias de todas as replicatas saem em lote de
+matrizes_replicatas (ver matriz_distancia.py) e as árvores das replicatas são construídas em um pool de
+processos, só como topologia (bipartições), por uma versão em NumPy do nj/upgma do Biopython. O suporte de um clado da árvore original é a
+porcentagem de replicatas com a mesma bipartição, gravada no nome do nó interno (Inner3 -> Inner3_bs95.0,
+ver suporte). Nem clade.confidence nem comentários servem: o Bio.Phylo escreve a confidence colada ao nome do
+nó, e o leitor de nexus descarta o nome dos nós com comentário. O nome é usado nos arquivos de subárvores.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from distancias import NamespaceTaxa, mascaras_clados, normalizar, trivial
+from matriz_distancia import MEMORIA_PADRAO, matrizes_replicatas
+
+
+# Abaixo deste custo (replicatas x n³) as árvores são construídas no próprio processo:
+# criar o pool custa mais do que o NJ de árvores pequenas
+MINIMO_CUSTO_PARALELO = 1e9
+
+SUFIXO_SUPORTE = '_bs'
+
+
+def indices_replicatas(comprimento: int, replicatas: int, semente: int = None) -> np.ndarray:
+    """Colunas sorteadas com reposição para cada replicata (B x L)"""
+    rng = np.random.default_rng(semente)
+    return rng.integers(0, comprimento, size=(replicatas, comprimento))
+
+
+def pesos_replicatas(indices: np.ndarray, comprimento: int) -> np.ndarray:
+    """Vezes em que cada coluna foi sorteada em cada replicata (B x L)"""
+    replicatas = len(indices)
+    deslocados = indices + np.arange(replicatas)[:, None] * comprimento
+
+    return np.bincount(deslocados.ravel(), minlength=replicatas * comprimento).reshape(replicatas, comprimento)
+
+
+def _quadrada(condensada: np.ndarray, n: int) -> np.ndarray:
+    quadrada = np.zeros((n, n))
+    i, j = np.triu_indices(n, k=1)
+    quadrada[i, j] = condensada
+    quadrada[j, i] = condensada
+
+    return quadrada
+
+
+def _biparticoes_replicata(n: int, evolutionary_model: str, condensada: np.ndarray) -> list:
+    """Bipartições não triviais (bit i = sequência i) da árvore de uma replicata
+
+    Repete o nj/upgma do DistanceTreeConstructor (mesma escolha do par, inclusive nos empates, e mesma
+    atualização das distâncias) com NumPy e sem montar a árvore: só a topologia interessa para o suporte.
+    """
+    dm = _quadrada(condensada, n)
+    mascaras = [1 << i for i in range(n)]
+    todos = (1 << n) - 1
+    upgma = evolutionary_model.lower() == 'upgma'
+    splits = set()
+
+    while len(dm) > (1 if upgma else 2):
+        k = len(dm)
+        inferior = np.tril_indices(k, -1)  # pares (i, j), j < i, na ordem do laço do Biopython
+        if upgma:
+            valores = dm[inferior]
+            # `>=`: o último mínimo
+            posicao = len(valores) - 1 - int(np.argmin(valores[::-1]))
+            min_i, min_j = inferior[0][posicao], inferior[1][posicao]
+        else:
+            node_dist = dm.sum(axis=1) / (k - 2)
+            valores = dm[inferior] - node_dist[inferior[0]] - node_dist[inferior[1]]
+            # `>` a partir do par (1, 0) registrado como min_i = 0, min_j = 1: o primeiro mínimo
+            posicao = int(np.argmin(valores))
+            min_i, min_j = (inferior[0][posicao], inferior[1][posicao]) if valores[posicao] < valores[0] else (0, 1)
+
+        d_ij = dm[min_i, min_j]
+        novas = (dm[min_i] + dm[min_j]) / 2 if upgma else (dm[min_i] + dm[min_j] - d_ij) / 2
+        dm[min_j, :] = novas
+        dm[:, min_j] = novas
+        dm[min_j, min_j] = 0
+        dm = np.delete(np.delete(dm, min_i, axis=0), min_i, axis=1)
+
+        m = mascaras[min_i] | mascaras[min_j]
+        mascaras[min_j] = m
+        del mascaras[min_i]
+        splits.add(normalizar(m, todos))
+
+    return [m for m in splits if not trivial(m, n)]
+
+
+def suporte_bootstrap(tree, codigos: np.ndarray, nomes: list, distance_method: str = 'identity',
+                      evolutionary_model: str = 'nj', replicatas: int = 100, semente: int = None,
+                      workers: int = None, memoria_max: int = MEMORIA_PADRAO) -> dict:
+    """Anota o suporte de bootstrap (%) dos clados internos da árvore (ver suporte)
+
+    Os clados são comparados como bipartições (sem raiz): para o UPGMA, os dois filhos da raiz têm o mesmo suporte.
+
+    Args:
+        tree (Tree): Árvore construída a partir de `codigos` (folhas com os nomes de `nomes`)
+        codigos (np.ndarray): Alinhamento codificado usado na árvore (ver codificar)
+        nomes (list): Nome de cada linha de `codigos`
+        distance_method (str, optional): Modelo do DistanceCalculator. Defaults to 'identity'.
+        evolutionary_model (str, optional): "nj" ou "upgma". Defaults to 'nj'.
+        replicatas (int, optional): Quantidade de replicatas (B). Defaults to 100.
+        semente (int, optional): Semente do sorteio das colunas. Defaults to None.
+        workers (int, optional): Processos construindo as árvores das replicatas. Defaults to os.cpu_count()
+            a partir de MINIMO_CUSTO_PARALELO e 1 abaixo disso ou dentro de um processo de um pool (ex.: a etapa
+            de árvores do pipeline, que informa a sua parte dos núcleos).
+        memoria_max (int, optional): Bytes para as matrizes de um lote de replicatas. Defaults to MEMORIA_PADRAO.
+
+    Returns:
+        dict: {bitset da bipartição: replicatas que a contêm}
+    """
+    n, comprimento = codigos.shape
+    pares = n * (n - 1) // 2
+    if workers is None:
+        # Um pool dentro de um processo de outro pool multiplicaria os processos pelos núcleos
+        em_pool = multiprocessing.parent_process() is not None
+        workers = os.cpu_count() if replicatas * n ** 3 >= MINIMO_CUSTO_PARALELO and not em_pool else 1
+
+    pesos = pesos_replicatas(indices_replicatas(comprimento, replicatas, semente), comprimento)
+    # Replicatas por lote, para que as matrizes condensadas do lote caibam em memoria_max
+    lote = max(min(memoria_max // max(4 * pares, 1), replicatas), 1)
+
+    contagem = {}
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) if workers > 1 else None
+    try:
+        for inicio in range(0, replicatas, lote):
+            condensadas = matrizes_replicatas(codigos, distance_method, pesos[inicio:inicio + lote], memoria_max)
+            argumentos = ([n] * len(condensadas), [evolutionary_model] * len(condensadas), list(condensadas))
+            if executor is not None:
+                resultados = executor.map(_biparticoes_replicata, *argumentos, chunksize=max(len(condensadas) // (4 * workers), 1))
+            else:
+                resultados = map(_biparticoes_replicata, *argumentos)
+
+            for splits in resultados:
+                for m in splits:
+                    contagem[m] = contagem.get(m, 0) + 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Suporte dos clados da árvore original, com os mesmos bits por nome
+    taxa = NamespaceTaxa()
+    for nome in nomes:
+        taxa.bit(nome)
+    mascaras = mascaras_clados(tree, taxa)
+    todos = mascaras[id(tree.root)]
+
+    for clade in tree.get_nonterminals():
+        m = normalizar(mascaras[id(clade)], todos)
+        if clade is not tree.root and not trivial(m, n):
+            clade.name = f'{clade.name or "Inner"}{SUFIXO_SUPORTE}{100 * contagem.get(m, 0) / replicatas:.1f}'
+
+    return contagem
+
+
+def suporte(clade) -> float:
+    """Suporte de bootstrap (%) gravado por suporte_bootstrap, ou None se o clado não foi avaliado"""
+    _, separador, valor = (clade.name or '').rpartition(SUFIXO_SUPORTE)
+    try:
+        return float(valor) if separador else None
+    except ValueError:
+        return None
@@ -0,0 +1,199 @@
+"""Calibração do host: micro-benchmarks para normalizar tempos medidos em máquinas diferentes
+
+Mede, uma vez por host (o resultado fica no banco e é reaproveitado nas execuções seguintes):
+- vazão de ponto flutuante (produto de matrizes do NumPy), gravada em Host.teraflops;
+- banda de memória (cópia de um vetor maior que o cache), em MB/s;
+- processamento de texto em um núcleo (leitura de um fasta sintético em Python puro);
+- latência para criar um subprocesso (os alinhadores são executáveis externos).
+Os quatro valores ficam na tabela CalibracaoHost, com o fator de velocidade que normaliza o histórico de tempos
+do ModeloCusto (ver custo.historico).
+
+Uso:
+    python calibracao.py            # calibra o host atual se ainda não foi calibrado
+    python calibracao.py --forcar   # mede de novo
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+
+from tabelas import Session, CalibracaoHost, Host
+
+
+# Resultados de um host de referência: fator_velocidade(referência) == 1
+REFERENCIA = {
+    'teraflops': 0.05,
+    'banda_memoria': 5000.0,  # MB/s
+    'texto': 50.0,  # MB/s
+    'latencia_subprocesso': 1.0,  # ms
+}
+
+DIMENSAO_MATRIZ = 512
+TAMANHO_COPIA = 64 * 2 ** 20  # bytes, maior que o cache de último nível
+SEQUENCIAS_TEXTO = 2000
+REPETICOES = 5
+
+
+def _melhor_tempo(funcao, repeticoes: int = REPETICOES) -> float:
+    """Menor tempo de `repeticoes` execuções (a primeira, de aquecimento, é descartada)"""
+    funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+
+    return min(tempos)
+
+
+def medir_flops(n: int = DIMENSAO_MATRIZ) -> float:
+    """Vazão do produto de matrizes float64 n x n (2n³ operações), em TFLOPS"""
+    rng = np.random.default_rng(0)
+    a = rng.random((n, n))
+    b = rng.random((n, n))
+
+    return 2 * n ** 3 / _melhor_tempo(lambda: a @ b) / 1e12
+
+
+def medir_banda_memoria(tamanho: int = TAMANHO_COPIA) -> float:
+    """Banda de memória na cópia de um vetor (bytes lidos + escritos), em MB/s"""
+    origem = np.ones(tamanho // 8)
+    destino = np.empty_like(origem)
+
+    return 2 * tamanho / _melhor_tempo(lambda: np.copyto(destino, origem)) / 2 ** 20
+
+
+def medir_texto(qtd_sequencias: int = SEQUENCIAS_TEXTO) -> float:
+    """Leitura de um fasta sintético em um núcleo, como em estatisticas_fasta, em MB/s"""
+    rng = np.random.default_rng(0)
+    residuos = np.frombuffer(b'ACDEFGHIKLMNPQRSTVWY', dtype=np.uint8)
+    linhas = []
+    for i in range(qtd_sequencias):
+        linhas.append(f'>seq{i}')
+        sequencia = residuos[rng.integers(0, len(residuos), 300)].tobytes().decode()
+        linhas.extend(sequencia[j:j + 60] for j in range(0, len(sequencia), 60))
+    texto = '\n'.join(linhas) + '\n'
+
+    def ler():
+        qtd, total = 0, 0
+        for line in texto.splitlines():
+            if line.startswith('>'):
+                qtd += 1
+            else:
+                total += len(line.strip())
+        return qtd, total
+
+    return len(texto) / _melhor_tempo(ler) / 2 ** 20
+
+
+def medir_latencia_subprocesso(repeticoes: int = 20) -> float:
+    """Mediana do tempo para executar um processo que termina logo (`true`), em ms"""
+    comando = [shutil.which('true')] if shutil.which('true') else [sys.executable, '-c', 'pass']
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        subprocess.run(comando, check=True)
+        tempos.append(time.perf_counter() - inicio)
+
+    return statistics.median(tempos) * 1000
+
+
+def medir() -> dict:
+    return {
+        'teraflops': medir_flops(),
+        'banda_memoria': medir_banda_memoria(),
+        'texto': medir_texto(),
+        'latencia_subprocesso': medir_latencia_subprocesso(),
+    }
+
+
+def fator_velocidade(medidas: dict) -> float:
+    """Velocidade do host em relação a REFERENCIA (média geométrica das razões; > 1 é mais rápido)"""
+    razoes = [
+        medidas['teraflops'] / REFERENCIA['teraflops'],
+        medidas['banda_memoria'] / REFERENCIA['banda_memoria'],
+        medidas['texto'] / REFERENCIA['texto'],
+        REFERENCIA['latencia_subprocesso'] / medidas['latencia_subprocesso'],
+    ]
+
+    return float(np.exp(np.mean(np.log(razoes))))
+
+
+def calibrar_host(id_host: int, forcar: bool = False) -> CalibracaoHost:
+    """Calibra o host uma única vez e preenche Host.teraflops
+
+    Args:
+        id_host (int): Host calibrado (o host atual)
+        forcar (bool, optional): Mede de novo mesmo que já exista uma calibração. Defaults to False.
+
+    Returns:
+        CalibracaoHost: calibração do host (desanexada da sessão)
+    """
+    session = Session()
+    calibracao = session.query(CalibracaoHost).filter_by(idHost=id_host).first()
+    if calibracao is not None and not forcar:
+        session.expunge(calibracao)
+        session.close()
+        return calibracao
+
+    medidas = medir()
+    if calibracao is None:
+        calibracao = CalibracaoHost(idHost=id_host)
+        session.add(calibracao)
+    calibracao.teraflops = medidas['teraflops']
+    calibracao.bandaMemoria = medidas['banda_memoria']
+    calibracao.texto = medidas['texto']
+    calibracao.latenciaSubprocesso = medidas['latencia_subprocesso']
+    calibracao.fator = fator_velocidade(medidas)
+    calibracao.hora = time.time()
+
+    try:
+        session.query(Host).filter_by(id=id_host).update({'teraflops': medidas['teraflops']})
+        session.commit()
+    except IntegrityError:
+        # Outro processo do mesmo host (ex.: workers da fila iniciados juntos) gravou a calibração antes
+        # (idHost é único): vale a dele
+        session.rollback()
+        session.close()
+        return calibrar_host(id_host)
+    session.refresh(calibracao)
+    session.expunge(calibracao)
+    session.close()
+
+    return calibracao
+
+
+def tempo_normalizado(segundos: float, id_host: int) -> float:
+    """Tempo que a medida levaria no host de referência (ou o próprio tempo, se o host não foi calibrado)"""
+    session = Session()
+    fator = session.query(CalibracaoHost.fator).filter_by(idHost=id_host).scalar()
+    session.close()
+
+    return segundos * fator if fator else segundos
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibração do host atual')
+    parser.add_argument('--forcar', action='store_true', help='Mede de novo mesmo que o host já tenha sido calibrado')
+    args = parser.parse_args()
+
+    import psutil
+    from metricas import get_cpu_model
+    from tabelas import create_or_retrieve
+
+    host = create_or_retrieve(
+        Host(nome=os.uname().nodename, processador=get_cpu_model(),
+             capacidade_memoria=psutil.virtual_memory().total / (1024 ** 3)),
+        Host,
+        ['nome']
+    )
+    calibracao = calibrar_host(host.id, args.forcar)
+    print(f'{host.nome}: {calibracao.teraflops:.3f} TFLOPS, {calibracao.bandaMemoria:.0f} MB/s de memória, '
+          f'{calibracao.texto:.1f} MB/s de texto, {calibracao.latenciaSubprocesso:.2f} ms por subprocesso '
+          f'(fator {calibracao.fator:.2f})')
@@ -0,0 +1,142 @@
+import time
+
+from sqlalchemy import func
+
+from tabelas import Session, Checkpoint, Execucao, Parametros, Tarefa
+from area_trabalho import area_retomavel
+from arquivo_arvores import existe
+
+
+# Parâmetros da árvore gravados em Parametros junto com os do alinhador
+PARAMETROS_ARVORE = ('evolutionary_model', 'output_format', 'distance_method', 'max_gaps', 'remover_constantes',
+                     'bootstrap')
+# Modo de consulta da comparação das subárvores (ver ComparadorTop em resultados.py)
+PARAMETROS_COMPARACAO = ('top_k', 'min_grau')
+# Gravados durante a Tarefa (resultados, não parâmetros)
+CHAVES_RESULTADO = ('colunas_mantidas', 'reaproveita')
+
+
+class Checkpoints:
+    """Checkpoints por etapa de uma Tarefa.
+
+    Cada unidade concluída (um arquivo alinhado, uma árvore construída, a comparação) é gravada no banco
+    com o artefato que produziu. Ao retomar uma Tarefa interrompida, as unidades concluídas cujo artefato
+    ainda existe na área de trabalho são puladas.
+
+    Só guarda o id da Tarefa, então pode ser passado para as etapas que rodam em outro processo (pipeline.py).
+
+    Args:
+        id_tarefa (int): Tarefa dos checkpoints
+    """
+
+    def __init__(self, id_tarefa: int):
+        self.id_tarefa = id_tarefa
+
+    def _buscar(self, session, etapa: str, chave: str) -> Checkpoint:
+        return session.query(Checkpoint).filter_by(idTarefa=self.id_tarefa, etapa=etapa, chave=chave).first()
+
+    def marcar(self, etapa: str, chave: str, artefato: str = None) -> None:
+        session = Session()
+        checkpoint = self._buscar(session, etapa, chave)
+        if checkpoint is None:
+            session.add(Checkpoint(idTarefa=self.id_tarefa, etapa=etapa, chave=chave, artefato=artefato, hora=time.time()))
+        else:
+            checkpoint.artefato = artefato
+            checkpoint.hora = time.time()
+        session.commit()
+        session.close()
+
+    def concluido(self, etapa: str, chave: str) -> bool:
+        """A unidade foi concluída e o seu artefato (se houver) ainda existe"""
+        session = Session()
+        checkpoint = self._buscar(session, etapa, chave)
+        session.close()
+
+        return checkpoint is not None and (checkpoint.artefato is None or existe(checkpoint.artefato))
+
+    def artefato(self, etapa: str, chave: str) -> str:
+        """Artefato de uma unidade concluída ou None se ela precisa ser refeita"""
+        session = Session()
+        checkpoint = self._buscar(session, etapa, chave)
+        session.close()
+
+        if checkpoint is None or checkpoint.artefato is None or not existe(checkpoint.artefato):
+            return None
+
+        return checkpoint.artefato
+
+    def contar(self, etapa: str) -> int:
+        session = Session()
+        n = session.query(func.count(Checkpoint.id)).filter_by(idTarefa=self.id_tarefa, etapa=etapa).scalar()
+        session.close()
+
+        return n
+
+    def retomar(self) -> int:
+        """Registra uma retomada da Tarefa
+
+        Returns:
+            int: número desta retomada (1 na primeira)
+        """
+        n = self.contar('retomada') + 1
+        self.marcar('retomada', str(n))
+
+        return n
+
+
+def tarefas_interrompidas(pasta_execucoes: str, nome: str = 'Subárvores Frequentes', max_retomadas: int = 3) -> list:
+    """Tarefas não finalizadas (Execucao sem HoraFim) com checkpoints e com a área de trabalho ainda
+    disponível neste host, da mais recente para a mais antiga. Tarefas já retomadas `max_retomadas` vezes
+    ficam de fora, para que um erro que sempre se repete não prenda o driver na mesma Tarefa.
+
+    Args:
+        pasta_execucoes (str): Raiz das áreas de trabalho (ver AreaTrabalho)
+        nome (str, optional): Nome das Tarefas. Defaults to 'Subárvores Frequentes'.
+        max_retomadas (int, optional): Defaults to 3.
+
+    Returns:
+        list: ids das Tarefas
+    """
+    session = Session()
+    ids = [
+        id_tarefa for (id_tarefa,) in
+        session.query(Tarefa.id)
+            .join(Execucao, Execucao.id == Tarefa.idExecucao)
+            .filter(Tarefa.nome == nome, Execucao.HoraFim.is_(None))
+            .filter(Tarefa.id.in_(session.query(Checkpoint.idTarefa).filter(Checkpoint.etapa != 'retomada')))
+            .order_by(Tarefa.id.desc())
+    ]
+    session.close()
+
+    return [
+        id_tarefa for id_tarefa in ids
+        if area_retomavel(pasta_execucoes, f'tarefa_{id_tarefa}')
+        and Checkpoints(id_tarefa).contar('retomada') < max_retomadas
+    ]
+
+
+def carregar_parametros(id_tarefa: int) -> tuple:
+    """Parâmetros gravados de uma Tarefa, no formato usado pelo driver (inverso de salvar_parametros)
+
+    Returns:
+        tuple: (algoritmo, tags, params, d_parametros_arvore)
+    """
+    session = Session()
+    linhas = session.query(Parametros.Chave, Parametros.Valor).filter_by(idTarefa=id_tarefa).all()
+    session.close()
+
+    algoritmo = None
+    tags, params, d_parametros_arvore = [], {}, {}
+    for chave, valor in linhas:
+        if chave in CHAVES_RESULTADO or chave in PARAMETROS_COMPARACAO:
+            continue
+        elif chave == 'algoritmo':
+            algoritmo = valor
+        elif chave in PARAMETROS_ARVORE:
+            d_parametros_arvore[chave] = valor
+        elif valor is None:
+            tags.append(chave)
+        else:
+            params[chave] = valor
+
+    return algoritmo, tags, params, d_parametros_arvore
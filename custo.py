@@ -0,0 +1,213 @@
+import heapq
+import math
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from checkpoint import CHAVES_RESULTADO, PARAMETROS_ARVORE, PARAMETROS_COMPARACAO
+from tabelas import Session, CalibracaoHost, Entrada, Execucao, Parametros, Tarefa, Tarefas_Entradas, create_or_retrieve
+
+
+# Parâmetros gravados em Parametros que não são do alinhador
+CHAVES_IGNORADAS = {'algoritmo', *PARAMETROS_ARVORE, *PARAMETROS_COMPARACAO, *CHAVES_RESULTADO}
+
+# Um alinhamento a executar: entrada, algoritmo, chave dos parâmetros (ver chave_parametros),
+# estatísticas da entrada, threads usadas pelo alinhador e tempo previsto (segundos)
+Job = namedtuple('Job', ['entrada', 'algoritmo', 'parametros', 'qtd_sequencias', 'comprimento_medio', 'threads', 'previsto'])
+
+
+def chave_parametros(parametros: dict) -> tuple:
+    """Chave canônica dos parâmetros do alinhador (como em salvar_parametros), sem os parâmetros da árvore"""
+    return tuple(sorted(
+        (str(chave), None if valor is None else str(valor))
+        for chave, valor in parametros.items() if chave not in CHAVES_IGNORADAS
+    ))
+
+
+def estatisticas_fasta(path: str) -> tuple:
+    """Quantidade de sequências e comprimento médio de um fasta, sem carregar as sequências
+
+    Returns:
+        tuple: (qtd_sequencias, comprimento_medio)
+    """
+    qtd = 0
+    total = 0
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('>'):
+                qtd += 1
+            else:
+                total += len(line.strip())
+
+    return qtd, (total / qtd if qtd else 0)
+
+
+def registrar_execucao_entrada(id_tarefa: int, path_in_fasta: str, inicio: float, fim: float) -> None:
+    """Grava o tempo de alinhamento de uma entrada (Execucao ligada à Tarefa e à Entrada por Tarefas_Entradas),
+    que é o histórico usado pelo ModeloCusto
+    """
+    qtd, comprimento = estatisticas_fasta(path_in_fasta)
+    entrada = create_or_retrieve(
+        Entrada(
+            nome=os.path.basename(path_in_fasta),
+            tamanho=os.path.getsize(path_in_fasta),
+            qtdSequencias=qtd,
+            comprimentoMedio=comprimento
+        ),
+        Entrada,
+        ['nome']
+    )
+
+    session = Session()
+    execucao = Execucao(HoraInicio=inicio, HoraFim=fim)
+    session.add(execucao)
+    session.flush()
+    session.add(Tarefas_Entradas(idTarefa=id_tarefa, idEntrada=entrada.id, idExecucao=execucao.id))
+    session.commit()
+    session.close()
+
+
+def historico() -> list:
+    """Execuções por entrada já registradas: (algoritmo, chave dos parâmetros, qtd_sequencias, comprimento_medio, segundos)
+
+    Os segundos são normalizados para o host de referência pela calibração do host da Tarefa
+    (ver calibracao.tempo_normalizado); os de hosts não calibrados ficam como foram medidos.
+    """
+    session = Session()
+    linhas = (
+        session.query(Tarefas_Entradas.idTarefa, Entrada.qtdSequencias, Entrada.comprimentoMedio,
+                      Execucao.HoraInicio, Execucao.HoraFim, CalibracaoHost.fator)
+            .join(Entrada, Entrada.id == Tarefas_Entradas.idEntrada)
+            .join(Execucao, Execucao.id == Tarefas_Entradas.idExecucao)
+            .outerjoin(Tarefa, Tarefa.id == Tarefas_Entradas.idTarefa)
+            .outerjoin(CalibracaoHost, CalibracaoHost.idHost == Tarefa.idHost)
+            .filter(Execucao.HoraFim.isnot(None))
+            .all()
+    )
+
+    parametros = {}
+    for id_tarefa, chave, valor in session.query(Parametros.idTarefa, Parametros.Chave, Parametros.Valor):
+        parametros.setdefault(id_tarefa, {})[chave] = valor
+    session.close()
+
+    dados = []
+    for id_tarefa, qtd, comprimento, inicio, fim, fator in linhas:
+        p = parametros.get(id_tarefa, {})
+        if 'algoritmo' not in p or not qtd or not comprimento:
+            continue
+        segundos = max(fim - inicio, 1e-3)
+        dados.append((p['algoritmo'], chave_parametros(p), qtd, comprimento, segundos * fator if fator else segundos))
+
+    return dados
+
+
+class ModeloCusto:
+    """Previsão do tempo de alinhamento a partir do histórico.
+
+    Ajusta log(t) = a[algoritmo] + b·log(qtd_sequencias) + c·log(comprimento_medio) por mínimos quadrados
+    sobre todas as execuções, mais um ajuste médio por (algoritmo, parâmetros) quando há ao menos duas
+    execuções com os mesmos parâmetros. Sem histórico usa a estimativa n²·L dos alinhadores progressivos.
+
+    O histórico está em tempos do host de referência (ver historico); `fator` é o fator de velocidade do host
+    em que os alinhamentos previstos vão rodar (CalibracaoHost.fator), e as previsões são divididas por ele.
+    """
+
+    MINIMO_AJUSTE = 2
+
+    def __init__(self, fator: float = 1.0):
+        self.fator = fator or 1.0
+        self.algoritmos = {}   # algoritmo -> índice da coluna de intercepto
+        self.coeficientes = None
+        self.ajustes = {}      # (algoritmo, chave dos parâmetros) -> resíduo médio em log
+        self.n_execucoes = 0
+
+    @classmethod
+    def from_db(cls, fator: float = 1.0):
+        modelo = cls(fator)
+        modelo.ajustar(historico())
+        return modelo
+
+    def _linha(self, algoritmo: str, qtd: float, comprimento: float) -> np.ndarray:
+        x = np.zeros(len(self.algoritmos) + 2)
+        x[self.algoritmos[algoritmo]] = 1
+        x[-2] = math.log(max(qtd, 1))
+        x[-1] = math.log(max(comprimento, 1))
+        return x
+
+    def ajustar(self, dados: list) -> 'ModeloCusto':
+        """Ajusta o modelo a partir de (algoritmo, parâmetros, qtd_sequencias, comprimento_medio, segundos)"""
+        self.n_execucoes = len(dados)
+        self.algoritmos = {algoritmo: i for i, algoritmo in enumerate(sorted({d[0] for d in dados}))}
+        if len(dados) < len(self.algoritmos) + 2:
+            self.coeficientes = None
+            return self
+
+        X = np.array([self._linha(a, q, c) for a, _, q, c, _ in dados])
+        y = np.log([d[4] for d in dados])
+        self.coeficientes = np.linalg.lstsq(X, y, rcond=None)[0]
+
+        residuos = {}
+        for (algoritmo, parametros, *_), x, t in zip(dados, X, y):
+            residuos.setdefault((algoritmo, parametros), []).append(t - x @ self.coeficientes)
+        self.ajustes = {k: float(np.mean(v)) for k, v in residuos.items() if len(v) >= self.MINIMO_AJUSTE}
+
+        return self
+
+    def prever(self, algoritmo: str, parametros: tuple, qtd: float, comprimento: float) -> float:
+        """Tempo previsto em segundos"""
+        if self.coeficientes is None or algoritmo not in self.algoritmos:
+            return 1e-7 * qtd ** 2 * comprimento / self.fator
+
+        log_t = self._linha(algoritmo, qtd, comprimento) @ self.coeficientes
+        log_t += self.ajustes.get((algoritmo, parametros), 0.0)
+
+        return float(math.exp(log_t)) / self.fator
+
+
+def criar_jobs(entradas: list, algoritmo: str, parametros: dict, modelo: ModeloCusto) -> list:
+    """Monta os Jobs de alinhamento de uma lista de fastas, com o tempo previsto pelo modelo"""
+    chave = chave_parametros(parametros)
+    threads = int(parametros.get('threads') or 1)
+
+    jobs = []
+    for entrada in entradas:
+        qtd, comprimento = estatisticas_fasta(entrada)
+        jobs.append(Job(entrada, algoritmo, chave, qtd, comprimento, threads,
+                        modelo.prever(algoritmo, chave, qtd, comprimento)))
+
+    return jobs
+
+
+def ordenar_jobs(jobs: list) -> list:
+    """Ordena do mais longo para o mais curto (LPT), reduzindo a cauda do lote"""
+    return sorted(jobs, key=lambda job: job.previsto, reverse=True)
+
+
+def estimar_makespan(jobs: list, nucleos: int = None) -> float:
+    """Simula a execução dos jobs, na ordem dada, em `nucleos` núcleos: cada job ocupa `threads` núcleos
+    ao mesmo tempo e começa quando eles ficam livres
+
+    Returns:
+        float: tempo total previsto em segundos
+    """
+    nucleos = nucleos or os.cpu_count()
+    livres = [0.0] * nucleos  # instante em que cada núcleo fica livre (heap)
+
+    fim = 0.0
+    for job in jobs:
+        k = min(max(job.threads, 1), nucleos)
+        ocupados = [heapq.heappop(livres) for _ in range(k)]
+        inicio = max(ocupados)
+        termino = inicio + job.previsto
+        for _ in range(k):
+            heapq.heappush(livres, termino)
+        fim = max(fim, termino)
+
+    return fim
+
+
+def workers_por_nucleos(threads: int, nucleos: int = None) -> int:
+    """Quantidade de alinhamentos simultâneos que cabem nos núcleos quando cada um usa `threads` threads"""
+    nucleos = nucleos or os.cpu_count()
+    return max(1, nucleos // max(threads, 1))
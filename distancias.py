@@ -0,0 +1,279 @@
+"""Distância entre árvores: Robinson–Foulds (RF) e RF ponderada
+
+Cada árvore é reduzida às suas bipartições, codificadas como inteiros (bitsets) sobre um espaço de taxa
+compartilhado (NamespaceTaxa). A matriz R x R de todas as árvores de uma entrada sai de um produto de
+matrizes de incidência (árvores x bipartições únicas) e de um índice bipartição -> árvores, sem percorrer
+as árvores par a par.
+
+Uso típico: comparar as árvores da mesma entrada geradas por alinhadores/parâmetros diferentes
+(uma Tarefa por combinação), gravando o resultado na tabela DistanciaArvore:
+    python distancias.py                  # todas as execuções em data/out/runs
+    python distancias.py --tarefas 3 7 12
+"""
+import argparse
+import os
+import re
+
+import numpy as np
+
+
+class NamespaceTaxa:
+    """Atribui um bit a cada nome de folha, compartilhado por todas as árvores comparadas"""
+
+    def __init__(self):
+        self.indices = {}
+
+    def bit(self, nome: str) -> int:
+        indice = self.indices.setdefault(nome, len(self.indices))
+        return 1 << indice
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def _popcount(x: int) -> int:
+    return bin(x).count('1')
+
+
+def mascaras_clados(tree, taxa: NamespaceTaxa) -> dict:
+    """Bitset das folhas de cada clado da árvore (Bio.Phylo), indexado por id(clado)"""
+    mascaras = {}
+    for clade in tree.find_clades(order='postorder'):
+        if clade.is_terminal():
+            mascaras[id(clade)] = taxa.bit(clade.name)
+        else:
+            m = 0
+            for filho in clade.clades:
+                m |= mascaras[id(filho)]
+            mascaras[id(clade)] = m
+
+    return mascaras
+
+
+def normalizar(m: int, todos: int) -> int:
+    """Lado da bipartição sem a folha de menor bit (um ramo e o seu complemento caem na mesma chave)"""
+    return m ^ todos if m & todos & -todos else m
+
+
+def biparticoes(tree, taxa: NamespaceTaxa) -> tuple:
+    """Bipartições de uma árvore (Bio.Phylo) como {bitset: comprimento do ramo}.
+
+    Cada ramo separa as folhas em dois lados; a bipartição é guardada como o lado sem a folha de menor bit,
+    de forma que um ramo e o seu complemento (mesmo ramo visto da outra ponta, ou os dois filhos de uma raiz
+    binária) caiam na mesma chave, como em uma árvore não enraizada.
+
+    Returns:
+        tuple: (biparticoes, todos) com o dicionário de bipartições (inclusive as triviais, de um ramo terminal)
+            e o bitset de todas as folhas da árvore
+    """
+    mascaras = mascaras_clados(tree, taxa)
+    todos = mascaras[id(tree.root)]
+
+    splits = {}
+    for clade in tree.find_clades():
+        if clade is tree.root:
+            continue
+        m = normalizar(mascaras[id(clade)], todos)
+        if m:
+            splits[m] = splits.get(m, 0.0) + (clade.branch_length or 0.0)
+
+    return splits, todos
+
+
+def restringir(splits: dict, todos: int, mascara: int) -> dict:
+    """Projeta as bipartições de uma árvore sobre um subconjunto das suas folhas (ex.: folhas em comum)"""
+    if mascara == todos:
+        return splits
+
+    menor = mascara & -mascara
+    restritas = {}
+    for m, comprimento in splits.items():
+        m &= mascara
+        if m & menor:
+            m ^= mascara
+        if m:
+            restritas[m] = restritas.get(m, 0.0) + comprimento
+
+    return restritas
+
+
+def trivial(m: int, n_taxa: int) -> bool:
+    """Bipartição de um ramo terminal (um lado com uma única folha)"""
+    k = _popcount(m)
+    return k <= 1 or k >= n_taxa - 1
+
+
+def matrizes_rf(lista_splits: list, n_taxa: int) -> tuple:
+    """RF, RF normalizada e RF ponderada de todos os pares de árvores (mesmas folhas)
+
+    RF(i, j) = |Bi| + |Bj| - 2|Bi ∩ Bj| (bipartições não triviais), com |Bi ∩ Bj| de um produto de matrizes de
+    incidência. A normalizada divide por 2(n - 3), o máximo para árvores binárias não enraizadas com n folhas.
+    A ponderada é a soma das diferenças absolutas dos comprimentos de ramo (inclusive dos ramos terminais,
+    comprimento 0 para a bipartição ausente): Wi + Wj - 2·Σ min(wi, wj) sobre as bipartições em comum,
+    acumulada bipartição por bipartição só entre as árvores que a contêm.
+
+    Args:
+        lista_splits (list): {bitset: comprimento} de cada árvore (ver biparticoes)
+        n_taxa (int): Quantidade de folhas
+
+    Returns:
+        tuple: (rf, rf_normalizada, rf_ponderada), matrizes R x R
+    """
+    ids = {}
+    arvores_por_split = {}  # bitset -> ([árvores], [comprimentos])
+    for i, splits in enumerate(lista_splits):
+        for m, comprimento in splits.items():
+            ids.setdefault(m, len(ids))
+            arvores, comprimentos = arvores_por_split.setdefault(m, ([], []))
+            arvores.append(i)
+            comprimentos.append(comprimento)
+
+    r = len(lista_splits)
+    incidencia = np.zeros((r, len(ids)), dtype=np.float32)
+    for i, splits in enumerate(lista_splits):
+        incidencia[i, [ids[m] for m in splits if not trivial(m, n_taxa)]] = 1
+
+    em_comum = incidencia @ incidencia.T
+    tamanhos = incidencia.sum(axis=1)
+    rf = np.rint(tamanhos[:, None] + tamanhos[None, :] - 2 * em_comum).astype(np.int32)
+    rf_normalizada = rf / (2 * (n_taxa - 3)) if n_taxa > 3 else np.zeros_like(rf, dtype=np.float64)
+
+    totais = np.array([sum(splits.values()) for splits in lista_splits], dtype=np.float64)
+    minimos = np.zeros((r, r))
+    for arvores, comprimentos in arvores_por_split.values():
+        if len(arvores) > 1:
+            w = np.array(comprimentos)
+            minimos[np.ix_(arvores, arvores)] += np.minimum.outer(w, w)
+    rf_ponderada = totais[:, None] + totais[None, :] - 2 * minimos
+    np.fill_diagonal(rf_ponderada, 0)
+    rf_ponderada = np.maximum(rf_ponderada, 0)
+
+    return rf, rf_normalizada, rf_ponderada
+
+
+def comparar_arvores(paths: list, data_format: str = 'nexus') -> tuple:
+    """Lê as árvores e calcula as matrizes de distância. Árvores com folhas diferentes são comparadas
+    sobre as folhas em comum.
+
+    Returns:
+        tuple: (rf, rf_normalizada, rf_ponderada, n_taxa)
+    """
+    from arquivo_arvores import ler_arvore
+
+    taxa = NamespaceTaxa()
+    arvores = [biparticoes(ler_arvore(path, data_format), taxa) for path in paths]
+
+    comum = arvores[0][1]
+    for _, todos in arvores[1:]:
+        comum &= todos
+
+    lista_splits = [restringir(splits, todos, comum) for splits, todos in arvores]
+
+    return (*matrizes_rf(lista_splits, _popcount(comum)), _popcount(comum))
+
+
+def arvores_tarefas(pasta_execucoes: str, ids: list = None) -> dict:
+    """Árvores promovidas para as pastas das execuções (ver AreaTrabalho), agrupadas por entrada.
+    As árvores de um arquivo único (ver arquivo_arvores.py) entram como referências.
+
+    Returns:
+        dict: {entrada: {id_tarefa: caminho da árvore}}
+    """
+    from arquivo_arvores import e_arquivo, listar, nome_arvore
+
+    grupos = {}
+    for nome in sorted(os.listdir(pasta_execucoes)):
+        encontrado = re.fullmatch(r'tarefa_(\d+)', nome)
+        if not encontrado or (ids and int(encontrado.group(1)) not in ids):
+            continue
+
+        pasta_trees = os.path.join(pasta_execucoes, nome, 'Trees')
+        if not os.path.isdir(pasta_trees):
+            continue
+
+        caminhos = []
+        for arquivo in os.listdir(pasta_trees):
+            if e_arquivo(arquivo):
+                # Árvores gravadas em um arquivo único (ver arquivo_arvores.py)
+                caminhos.extend(listar(os.path.join(pasta_trees, arquivo)))
+            else:
+                caminhos.append(os.path.join(pasta_trees, arquivo))
+
+        for caminho in caminhos:
+            nome = nome_arvore(caminho)
+            if nome.startswith('tree_'):
+                entrada = os.path.splitext(nome[len('tree_'):])[0]
+                grupos.setdefault(entrada, {})[int(encontrado.group(1))] = caminho
+
+    return grupos
+
+
+def comparar_tarefas(pasta_execucoes: str, ids: list = None, gravar: bool = True) -> dict:
+    """Compara, entrada por entrada, as árvores das Tarefas e grava os pares na tabela DistanciaArvore
+
+    Args:
+        pasta_execucoes (str): Raiz das execuções (ex.: data/out/runs)
+        ids (list, optional): Tarefas comparadas. Defaults to todas as encontradas.
+        gravar (bool, optional): Grava no banco. Defaults to True.
+
+    Returns:
+        dict: {entrada: (ids das tarefas, rf, rf_normalizada, rf_ponderada)}
+    """
+    resultado = {}
+    for entrada, por_tarefa in arvores_tarefas(pasta_execucoes, ids).items():
+        if len(por_tarefa) < 2:
+            continue
+        tarefas = sorted(por_tarefa)
+        rf, rf_normalizada, rf_ponderada, _ = comparar_arvores([por_tarefa[t] for t in tarefas])
+        resultado[entrada] = (tarefas, rf, rf_normalizada, rf_ponderada)
+
+    if gravar and resultado:
+        gravar_distancias(resultado)
+
+    return resultado
+
+
+def gravar_distancias(resultado: dict) -> None:
+    from sqlalchemy import and_, insert
+    from tabelas import Session, DistanciaArvore
+
+    session = Session()
+    for entrada, (tarefas, rf, rf_normalizada, rf_ponderada) in resultado.items():
+        # Recalcular substitui os pares já gravados
+        session.query(DistanciaArvore).filter(and_(
+            DistanciaArvore.entrada == entrada,
+            DistanciaArvore.idTarefaA.in_(tarefas),
+            DistanciaArvore.idTarefaB.in_(tarefas)
+        )).delete(synchronize_session=False)
+
+        i, j = np.triu_indices(len(tarefas), k=1)
+        session.execute(insert(DistanciaArvore), [
+            {'idTarefaA': tarefas[a], 'idTarefaB': tarefas[b], 'entrada': entrada, 'rf': int(rf[a, b]),
+             'rfNormalizado': float(rf_normalizada[a, b]), 'rfPonderado': float(rf_ponderada[a, b])}
+            for a, b in zip(i.tolist(), j.tolist())
+        ])
+    session.commit()
+    session.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Distância RF entre as árvores das Tarefas')
+    parser.add_argument('--pasta', default=os.path.join('data', 'out', 'runs'), help='Raiz das execuções')
+    parser.add_argument('--tarefas', type=int, nargs='+', help='Ids das Tarefas (padrão: todas)')
+    parser.add_argument('--nao-gravar', action='store_true')
+    args = parser.parse_args()
+
+    resultado = comparar_tarefas(args.pasta, args.tarefas, not args.nao_gravar)
+
+    # Média da RF normalizada por par de Tarefas, sobre as entradas em comum
+    soma, contagem = {}, {}
+    for tarefas, _, rf_normalizada, _ in resultado.values():
+        for a in range(len(tarefas)):
+            for b in range(a + 1, len(tarefas)):
+                par = (tarefas[a], tarefas[b])
+                soma[par] = soma.get(par, 0.0) + rf_normalizada[a, b]
+                contagem[par] = contagem.get(par, 0) + 1
+
+    print(f'{len(resultado)} entradas, {len(soma)} pares de tarefas')
+    for par in sorted(soma, key=lambda p: soma[p] / contagem[p]):
+        print(f'tarefas {par[0]:>5} x {par[1]:<5} RF normalizada média {soma[par] / contagem[par]:.3f} ({contagem[par]} entradas)')
@@ -0,0 +1,354 @@
+"""Fila de alinhamentos no banco, com lease e heartbeat
+
+Vários workers (no mesmo host ou em hosts diferentes apontando para o mesmo banco, ver NMFSTP_DB em tabelas.py)
+reivindicam jobs (entrada, algoritmo, parâmetros) de forma atômica. Um job cujo worker parou de renovar o lease
+volta a ficar disponível; depois de `maxTentativas` tentativas ele é marcado como falhou.
+
+Uso:
+    python fila.py enfileirar data/full_dataset_plasmodium clustalw --variacoes 5
+    python fila.py worker            # em quantos processos/hosts quiser
+    python fila.py status
+"""
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from sqlalchemy import and_, func, or_, select, update
+
+from tabelas import Session, Fila
+from registro import configurar_logging, logger
+
+
+log = logger('fila')
+
+
+def _disponivel(agora: float):
+    """Condição de um job que pode ser reivindicado: pendente ou com o lease vencido"""
+    return and_(
+        or_(Fila.estado == 'pendente', and_(Fila.estado == 'executando', Fila.leaseAte < agora)),
+        Fila.tentativas < Fila.maxTentativas
+    )
+
+
+def enfileirar(entradas: list, algoritmo: str, tags: list = (), params: dict = None, prioridades: list = None,
+               max_tentativas: int = 3) -> int:
+    """Adiciona um job por entrada
+
+    Args:
+        entradas (list): Caminhos dos fastas
+        algoritmo (str): Alinhador
+        tags (list, optional): Tags do alinhador (args de align_sequence)
+        params (dict, optional): Parâmetros do alinhador (kwargs de align_sequence)
+        prioridades (list, optional): Prioridade de cada entrada (maior sai primeiro). Defaults to 0.
+        max_tentativas (int, optional): Defaults to 3.
+
+    Returns:
+        int: quantidade de jobs adicionados
+    """
+    parametros = json.dumps({'tags': list(tags), 'params': params or {}})
+    prioridades = prioridades or [0] * len(entradas)
+
+    session = Session()
+    session.add_all([
+        Fila(entrada=entrada, algoritmo=algoritmo, parametros=parametros, prioridade=prioridade,
+             estado='pendente', tentativas=0, maxTentativas=max_tentativas)
+        for entrada, prioridade in zip(entradas, prioridades)
+    ])
+    session.commit()
+    session.close()
+
+    return len(entradas)
+
+
+def expirar() -> int:
+    """Marca como falhou os jobs com lease vencido que já esgotaram as tentativas"""
+    agora = time.time()
+    session = Session()
+    n = session.execute(
+        update(Fila)
+            .where(Fila.estado == 'executando', Fila.leaseAte < agora, Fila.tentativas >= Fila.maxTentativas)
+            .values(estado='falhou', erro='lease expirado')
+    ).rowcount
+    session.commit()
+    session.close()
+
+    return n
+
+
+def reivindicar(worker: str, lease: float) -> Fila:
+    """Reivindica atomicamente o próximo job disponível (maior prioridade, mais antigo)
+
+    O UPDATE com subconsulta é um único comando: no sqlite ele roda com o banco bloqueado para escrita;
+    em outros bancos a condição repetida no WHERE externo faz o segundo worker não alterar a linha já tomada.
+
+    Returns:
+        Fila: job reivindicado (desanexado da sessão) ou None se a fila estiver vazia
+    """
+    agora = time.time()
+    token = str(uuid.uuid4())
+
+    proximo = (
+        select(Fila.id)
+            .where(_disponivel(agora))
+            .order_by(Fila.prioridade.desc(), Fila.id)
+            .limit(1)
+            .scalar_subquery()
+    )
+
+    session = Session()
+    n = session.execute(
+        update(Fila)
+            .where(Fila.id == proximo, _disponivel(agora))
+            .values(estado='executando', worker=worker, token=token, leaseAte=agora + lease, heartbeat=agora,
+                    tentativas=Fila.tentativas + 1)
+            .execution_options(synchronize_session=False)
+    ).rowcount
+    session.commit()
+
+    job = session.query(Fila).filter(Fila.token == token).first() if n else None
+    if job is not None:
+        session.expunge(job)
+    session.close()
+
+    return job
+
+
+def renovar(job: Fila, lease: float) -> bool:
+    """Heartbeat: estende o lease. Devolve False se o job foi tomado por outro worker (lease perdido)"""
+    agora = time.time()
+    session = Session()
+    n = session.execute(
+        update(Fila)
+            .where(Fila.id == job.id, Fila.token == job.token, Fila.estado == 'executando')
+            .values(leaseAte=agora + lease, heartbeat=agora)
+    ).rowcount
+    session.commit()
+    session.close()
+
+    return n == 1
+
+
+def concluir(job: Fila, id_tarefa: int) -> bool:
+    session = Session()
+    n = session.execute(
+        update(Fila)
+            .where(Fila.id == job.id, Fila.token == job.token)
+            .values(estado='concluido', idTarefa=id_tarefa, leaseAte=None)
+    ).rowcount
+    session.commit()
+    session.close()
+
+    return n == 1
+
+
+def falhar(job: Fila, erro: str) -> bool:
+    """Devolve o job para a fila ou, sem tentativas restantes, marca como falhou"""
+    estado = 'falhou' if job.tentativas >= job.maxTentativas else 'pendente'
+    session = Session()
+    n = session.execute(
+        update(Fila)
+            .where(Fila.id == job.id, Fila.token == job.token)
+            .values(estado=estado, erro=erro[:1024], leaseAte=None)
+    ).rowcount
+    session.commit()
+    session.close()
+
+    return n == 1
+
+
+@lru_cache(maxsize=None)
+def host_worker() -> int:
+    """Id do Host deste processo, registrado e calibrado na primeira chamada
+
+    A calibração é feita uma vez por host (ver calibracao.py); o cache evita consultar o banco a cada job.
+    """
+    import psutil
+    from metricas import get_cpu_model
+    from tabelas import Host, create_or_retrieve
+    from calibracao import calibrar_host
+
+    host = create_or_retrieve(
+        Host(nome=os.uname().nodename, processador=get_cpu_model(),
+             capacidade_memoria=psutil.virtual_memory().total / (1024 ** 3)),
+        Host,
+        ['nome']
+    )
+    calibrar_host(host.id)
+
+    return host.id
+
+
+def processar_alinhamento(job: Fila) -> int:
+    """Executa um job de alinhamento e registra Tarefa, Parametros e Execucao
+
+    Returns:
+        int: id da Tarefa criada
+    """
+    import psutil
+    from main import align_sequence, salvar_parametros
+    from tabelas import Execucao, Parametros, Tarefa
+    from area_trabalho import AreaTrabalho
+    from custo import registrar_execucao_entrada
+
+    parametros = json.loads(job.parametros)
+    tags, params = parametros['tags'], parametros['params']
+    id_host = host_worker()
+
+    initial_disk_io = psutil.disk_io_counters()
+    session = Session()
+    monitor = Execucao(HoraInicio=time.time(), UsoCPU=psutil.cpu_percent(), MemoriaDisponivel=psutil.virtual_memory().free)
+    session.add(monitor)
+    session.flush()
+    tarefa = Tarefa(nome='Alinhamento', algoritmo=job.algoritmo, idExecucao=monitor.id, idHost=id_host)
+    session.add(tarefa)
+    session.flush()
+
+    d_parametros = salvar_parametros(*tags, **params)
+    d_parametros['algoritmo'] = job.algoritmo
+    for chave, valor in d_parametros.items():
+        session.add(Parametros(Chave=chave, Valor=valor, idTarefa=tarefa.id))
+    session.commit()
+    id_tarefa, id_monitor = tarefa.id, monitor.id
+    session.close()
+
+    with AreaTrabalho(os.path.join('data', 'out', 'runs'), f'fila_{job.id}_{job.tentativas}') as area:
+        inicio = time.time()
+        file_out_aln = align_sequence(job.algoritmo, job.entrada, area.tmp, *tags, **params)
+        if file_out_aln is None:
+            raise RuntimeError(f'{job.algoritmo} escreveu em stderr')
+        registrar_execucao_entrada(id_tarefa, job.entrada, inicio, time.time())
+        area.promover(file_out_aln)
+
+    current_disk_io = psutil.disk_io_counters()
+    session = Session()
+    session.query(Execucao).filter_by(id=id_monitor).update({
+        'LeituraDisco': current_disk_io.read_bytes - initial_disk_io.read_bytes,
+        'EscritaDisco': current_disk_io.write_bytes - initial_disk_io.write_bytes,
+        'HoraFim': time.time()
+    })
+    session.commit()
+    session.close()
+
+    return id_tarefa
+
+
+def executar_worker(funcao=processar_alinhamento, lease: float = 300, espera: float = 5,
+                    parar_quando_vazia: bool = True) -> int:
+    """Loop de um worker: reivindica, executa com heartbeat e reporta cada job
+
+    Args:
+        funcao (callable, optional): Executa um job e devolve o id da Tarefa. Defaults to processar_alinhamento.
+        lease (float, optional): Duração do lease em segundos; o heartbeat renova a cada lease/3. Defaults to 300.
+        espera (float, optional): Intervalo entre consultas quando a fila está vazia. Defaults to 5.
+        parar_quando_vazia (bool, optional): Termina quando não houver jobs pendentes nem em execução. Defaults to True.
+
+    Returns:
+        int: quantidade de jobs concluídos por este worker
+    """
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    concluidos = 0
+
+    while True:
+        expirar()
+        job = reivindicar(worker, lease)
+
+        if job is None:
+            if parar_quando_vazia and not _jobs_ativos():
+                return concluidos
+            time.sleep(espera)
+            continue
+
+        parar = threading.Event()
+
+        def heartbeat():
+            while not parar.wait(lease / 3):
+                # Um erro do banco (ex.: "database is locked") não pode matar o heartbeat: o lease venceria com o
+                # job ainda em execução e outro worker o executaria de novo. Tenta de novo no próximo intervalo.
+                try:
+                    renovado = renovar(job, lease)
+                except Exception as e:
+                    log.error(f'{worker}: erro ao renovar o lease do job {job.id}: {e}')
+                    continue
+                if not renovado:
+                    log.warning(f'{worker}: lease do job {job.id} perdido')
+                    return
+
+        t = threading.Thread(target=heartbeat, daemon=True)
+        t.start()
+        try:
+            id_tarefa = funcao(job)
+        except Exception as e:
+            log.error(f'{worker}: job {job.id} ({job.entrada}): {e}', exc_info=True)
+            falhar(job, str(e))
+        else:
+            if concluir(job, id_tarefa):
+                concluidos += 1
+            else:
+                log.warning(f'{worker}: job {job.id} concluído depois de perder o lease')
+        finally:
+            parar.set()
+            t.join()
+
+
+def _jobs_ativos() -> bool:
+    session = Session()
+    n = session.query(func.count(Fila.id)).filter(Fila.estado.in_(['pendente', 'executando'])).scalar()
+    session.close()
+
+    return n > 0
+
+
+def status() -> dict:
+    session = Session()
+    contagem = dict(session.query(Fila.estado, func.count(Fila.id)).group_by(Fila.estado).all())
+    session.close()
+
+    return contagem
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fila de alinhamentos')
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p = sub.add_parser('enfileirar', help='Adiciona um job por arquivo da pasta')
+    p.add_argument('pasta')
+    p.add_argument('algoritmo')
+    p.add_argument('--variacoes', type=int, default=1, help='Conjuntos de parâmetros sorteados (sort_params) por arquivo')
+
+    p = sub.add_parser('worker', help='Executa jobs até a fila esvaziar')
+    p.add_argument('--lease', type=float, default=300)
+    p.add_argument('--continuar', action='store_true', help='Continua esperando novos jobs com a fila vazia')
+
+    sub.add_parser('status')
+
+    args = parser.parse_args()
+
+    match args.comando:
+        case 'enfileirar':
+            from parametros_algoritmos import sort_params
+            from custo import ModeloCusto, criar_jobs
+
+            entradas = [os.path.join(args.pasta, nome) for nome in sorted(os.listdir(args.pasta))]
+            modelo = ModeloCusto.from_db()
+            total = 0
+            for _ in range(args.variacoes):
+                params, tags = sort_params(args.algoritmo)
+                # Os mais longos primeiro também entre os hosts (ver custo.py), em tempos do host de referência
+                previstos = [job.previsto for job in criar_jobs(entradas, args.algoritmo, dict(params, **{t: None for t in tags}), modelo)]
+                total += enfileirar(entradas, args.algoritmo, list(tags), params, previstos)
+            print(f'{total} jobs adicionados')
+
+        case 'worker':
+            listener = configurar_logging()
+            try:
+                log.info(f'{executar_worker(lease=args.lease, parar_quando_vazia=not args.continuar)} jobs concluídos')
+            finally:
+                listener.stop()
+
+        case 'status':
+            print(status())
@@ -0,0 +1,262 @@
+"""Índice de acesso aleatório a arquivos fasta (.fai) e amostragem de arquivos e sequências
+
+O índice segue o formato .fai do samtools (nome, comprimento, offset da sequência, bases por linha, bytes por
+linha) e fica em uma pasta de cache (PASTA_INDICES), não ao lado do fasta: as pastas de entrada são listadas
+inteiras pelo pipeline. Ele é reconstruído só quando o fasta é mais novo que ele. Com ele, os bytes de um
+registro (cabeçalho completo + sequência) são lidos com um seek, sem percorrer o arquivo: o registro i vai do fim
+da sequência do registro i - 1 até o fim da sua própria sequência.
+
+A amostragem escolhe arquivos e/ou sequências de cada arquivo a partir de uma semente e grava só os registros
+escolhidos, para execuções reduzidas e estudos de escala sem copiar o conjunto de dados inteiro:
+    python indice_fasta.py data/full_dataset_plasmodium data/amostra --arquivos 20 --sequencias 0.5 --semente 1
+    python main.py --entrada data/amostra
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+from collections import namedtuple
+
+
+RegistroFai = namedtuple('RegistroFai', ['nome', 'comprimento', 'offset', 'bases_linha', 'bytes_linha'])
+
+EXTENSAO_INDICE = '.fai'
+PASTA_INDICES = os.path.join('data', 'cache', 'indices_fasta')
+
+# O NJ/UPGMA precisa de pelo menos 3 sequências para uma árvore com ramos internos
+MINIMO_SEQUENCIAS = 3
+
+
+def caminho_indice(path: str, pasta_indices: str = PASTA_INDICES) -> str:
+    """Índice do fasta no cache, identificado pelo caminho absoluto do fasta"""
+    chave = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(pasta_indices, f'{chave}_{os.path.basename(path)}{EXTENSAO_INDICE}')
+
+
+def construir_indice(path: str, pasta_indices: str = PASTA_INDICES) -> list:
+    """Percorre o fasta uma vez e grava o índice .fai no cache
+
+    Como no samtools, todas as linhas de uma sequência, exceto a última, precisam ter o mesmo tamanho.
+
+    Args:
+        path (str): Arquivo fasta
+        pasta_indices (str, optional): Pasta dos índices. Defaults to PASTA_INDICES.
+
+    Returns:
+        list: RegistroFai de cada sequência, na ordem do arquivo
+    """
+    registros = []
+    nome = None
+
+    def fechar():
+        if nome is not None:
+            registros.append(RegistroFai(nome, comprimento, offset, bases_linha, bytes_linha))
+
+    with open(path, 'rb') as f:
+        posicao = 0
+        for linha in f:
+            if linha.startswith(b'>'):
+                fechar()
+                nome = linha[1:].split(None, 1)[0].decode() if linha[1:].strip() else ''
+                comprimento, offset, bases_linha, bytes_linha = 0, posicao + len(linha), 0, 0
+                ultima, vazia = None, False
+            elif nome is not None and not linha.strip():
+                vazia = True
+            elif nome is not None:
+                bases = len(linha.rstrip(b'\r\n'))
+                if vazia or (ultima is not None and (ultima[0] != bases_linha or ultima[1] != bytes_linha or bases > bases_linha)):
+                    raise ValueError(f'{path}: linhas de tamanhos diferentes na sequência {nome}')
+                if not bases_linha:
+                    bases_linha, bytes_linha = bases, len(linha)
+                comprimento += bases
+                ultima = (bases, len(linha))
+            posicao += len(linha)
+        fechar()
+
+    os.makedirs(pasta_indices, exist_ok=True)
+    # Escrito à parte e renomeado: processos que indexam o mesmo fasta não leem um índice pela metade
+    path_indice = caminho_indice(path, pasta_indices)
+    path_temporario = f'{path_indice}.{os.getpid()}'
+    with open(path_temporario, 'w') as f:
+        for registro in registros:
+            f.write('\t'.join(map(str, registro)) + '\n')
+    os.replace(path_temporario, path_indice)
+
+    return registros
+
+
+def carregar_indice(path: str, pasta_indices: str = PASTA_INDICES) -> list:
+    """Índice do fasta, lido do .fai ou construído se ele não existir ou for mais antigo que o fasta"""
+    path_indice = caminho_indice(path, pasta_indices)
+    if not os.path.exists(path_indice) or os.path.getmtime(path_indice) < os.path.getmtime(path):
+        return construir_indice(path, pasta_indices)
+
+    with open(path_indice) as f:
+        return [RegistroFai(nome, *map(int, valores))
+                for nome, *valores in (linha.rstrip('\n').split('\t') for linha in f if linha.strip())]
+
+
+def _bytes_sequencia(registro: RegistroFai) -> int:
+    """Bytes da sequência no arquivo, inclusive as quebras de linha"""
+    if not registro.comprimento:
+        return 0
+
+    linhas, resto = divmod(registro.comprimento, registro.bases_linha)
+    quebra = registro.bytes_linha - registro.bases_linha
+
+    return linhas * registro.bytes_linha + (resto + quebra if resto else 0)
+
+
+class FastaIndexado:
+    """Fasta com acesso aleatório aos registros pelo índice .fai (ver carregar_indice)
+
+    Args:
+        path (str): Arquivo fasta
+        pasta_indices (str, optional): Pasta dos índices. Defaults to PASTA_INDICES.
+    """
+
+    def __init__(self, path: str, pasta_indices: str = PASTA_INDICES):
+        self.path = path
+        self.registros = carregar_indice(path, pasta_indices)
+        self.posicoes = {registro.nome: i for i, registro in enumerate(self.registros)}
+
+        # Bytes [inicio, fim) de cada registro, do cabeçalho ao fim da sequência
+        tamanho = os.path.getsize(path)
+        self.fins = [min(r.offset + _bytes_sequencia(r), tamanho) for r in self.registros]
+        self.inicios = [0] + self.fins[:-1]
+
+    def __len__(self):
+        return len(self.registros)
+
+    def nomes(self) -> list:
+        return [registro.nome for registro in self.registros]
+
+    def comprimentos(self) -> list:
+        return [registro.comprimento for registro in self.registros]
+
+    def sequencia(self, nome: str) -> str:
+        """Sequência (sem quebras de linha) de um registro"""
+        registro = self.registros[self.posicoes[nome]]
+        with open(self.path, 'rb') as f:
+            f.seek(registro.offset)
+            dados = f.read(_bytes_sequencia(registro))
+
+        return dados.replace(b'\r', b'').replace(b'\n', b'').decode()
+
+    def escrever(self, path_saida: str, indices: list) -> int:
+        """Grava um fasta só com os registros escolhidos, na ordem do arquivo original
+
+        Registros vizinhos são copiados em uma única leitura.
+
+        Args:
+            path_saida (str): Fasta de saída
+            indices (list): Posições dos registros no arquivo (ver nomes)
+
+        Returns:
+            int: bytes gravados
+        """
+        trechos = []
+        for i in sorted(set(indices)):
+            if trechos and trechos[-1][1] == self.inicios[i]:
+                trechos[-1][1] = self.fins[i]
+            else:
+                trechos.append([self.inicios[i], self.fins[i]])
+
+        total = 0
+        with open(self.path, 'rb') as entrada, open(path_saida, 'wb') as saida:
+            for inicio, fim in trechos:
+                entrada.seek(inicio)
+                dados = entrada.read(fim - inicio)
+                # O último registro do arquivo pode não terminar em quebra de linha
+                if not dados.endswith(b'\n'):
+                    dados += b'\n'
+                total += saida.write(dados)
+
+        return total
+
+
+def _quantidade(total: int, valor) -> int:
+    """Quantidade absoluta (int) ou fração do total (float em (0, 1])"""
+    if isinstance(valor, float) and valor <= 1:
+        return max(round(total * valor), 1)
+
+    return min(int(valor), total)
+
+
+def amostrar_arquivos(arquivos: list, quantidade, semente: int = None) -> list:
+    """Arquivos sorteados (ordenados pelo nome); a mesma semente escolhe os mesmos arquivos
+
+    Args:
+        arquivos (list): Nomes ou caminhos dos arquivos
+        quantidade (int | float): Quantidade de arquivos ou fração deles
+        semente (int, optional): Semente do sorteio. Defaults to None.
+    """
+    arquivos = sorted(arquivos)
+    return sorted(random.Random(semente).sample(arquivos, _quantidade(len(arquivos), quantidade)))
+
+
+def amostrar_sequencias(fasta: FastaIndexado, quantidade, semente: int = None) -> list:
+    """Posições das sequências sorteadas de um fasta (pelo menos MINIMO_SEQUENCIAS, se houver)
+
+    O sorteio depende só da semente e do nome do arquivo, não da ordem em que os arquivos são amostrados.
+
+    Args:
+        fasta (FastaIndexado): Fasta indexado
+        quantidade (int | float): Quantidade de sequências ou fração delas
+        semente (int, optional): Semente do sorteio. Defaults to None.
+    """
+    total = len(fasta)
+    k = min(max(_quantidade(total, quantidade), MINIMO_SEQUENCIAS), total)
+    rng = random.Random(f'{semente}:{os.path.basename(fasta.path)}' if semente is not None else None)
+
+    return sorted(rng.sample(range(total), k))
+
+
+def amostrar(input_path: str, path_saida: str, arquivos=None, sequencias=None, semente: int = None) -> list:
+    """Grava em `path_saida` uma versão reduzida dos fastas de `input_path`
+
+    Args:
+        input_path (str): Pasta com os arquivos fasta
+        path_saida (str): Pasta de saída (criada se não existir)
+        arquivos (int | float, optional): Arquivos sorteados (quantidade ou fração). Defaults to todos.
+        sequencias (int | float, optional): Sequências sorteadas de cada arquivo. Defaults to todas (cópia do arquivo).
+        semente (int, optional): Semente dos sorteios. Defaults to None.
+
+    Returns:
+        list: caminhos dos fastas gravados
+    """
+    nomes = [nome for nome in os.listdir(input_path) if os.path.isfile(os.path.join(input_path, nome)) and nome != 'file.gitkeep']
+    if arquivos is not None:
+        nomes = amostrar_arquivos(nomes, arquivos, semente)
+
+    os.makedirs(path_saida, exist_ok=True)
+    caminhos = []
+    for nome in sorted(nomes):
+        origem, destino = os.path.join(input_path, nome), os.path.join(path_saida, nome)
+        if sequencias is None:
+            shutil.copyfile(origem, destino)
+        else:
+            fasta = FastaIndexado(origem)
+            fasta.escrever(destino, amostrar_sequencias(fasta, sequencias, semente))
+        caminhos.append(destino)
+
+    return caminhos
+
+
+def _numero(valor: str):
+    """Argumento da linha de comando: '20' é uma quantidade e '0.5' uma fração"""
+    return float(valor) if '.' in valor else int(valor)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Amostra arquivos fasta e sequências a partir de uma semente')
+    parser.add_argument('entrada', help='Pasta com os arquivos fasta')
+    parser.add_argument('saida', help='Pasta da amostra')
+    parser.add_argument('--arquivos', type=_numero, help='Quantidade (ex.: 20) ou fração (ex.: 0.1) de arquivos')
+    parser.add_argument('--sequencias', type=_numero, help='Quantidade ou fração das sequências de cada arquivo')
+    parser.add_argument('--semente', type=int, help='Semente dos sorteios')
+    args = parser.parse_args()
+
+    caminhos = amostrar(args.entrada, args.saida, args.arquivos, args.sequencias, args.semente)
+    print(f'{len(caminhos)} arquivos gravados em {args.saida}')
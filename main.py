@@ -1,35 +1,32 @@
 # %%
+import argparse
 import os
+import shutil
 import subprocess
+import tempfile
 from pathlib import Path
-import pandas as pd
-import psutil
 import time
-from sqlalchemy import create_engine
-import random
-import logging
+from functools import partial
 from collections import Counter
 
 # %%
-from tabelas import *
-from metricas import *
+# Só módulos leves no import. Biopython, SQLAlchemy (tabelas), numpy e psutil são importados dentro das
+# funções que os usam: `import main` (test.py, processos dos pools, workers da fila) não paga por eles,
+# não cria o engine do banco nem o app.log
 from alinhadores import *
+from subarvores import ArvoreCompacta, RegistroSubarvore
+from arquivo_arvores import abrir, e_arquivo, listar, nome_arvore, ARQUIVO_ARVORES, ARQUIVO_SUBARVORES
+from pipeline import Etapa, PipelineArquivos
+from area_trabalho import AreaTrabalho, coletar_lixo
+from arvore_guia import CacheArvoreGuia
 from parametros_algoritmos import sort_params
+from registro import configurar_logging, logger, Progresso
 
-# %%
-from Bio import AlignIO, Phylo, SeqIO
-from Bio.Phylo.TreeConstruction import DistanceCalculator, DistanceTreeConstructor
-from dendropy import Tree 
-
-
-logging.basicConfig(
-    level=logging.DEBUG,  # Define o nível de log
-    format="%(asctime)s [%(levelname)s] %(message)s",  # Formato da mensagem
-    datefmt="%Y-%m-%d %H:%M:%S",  # Formato da data
-    handlers=[
-        logging.FileHandler("app.log"),  # Log em arquivo
-    ]
-)
+# Um logger por etapa; o nível de cada um é configurável (ver registro.py)
+log_entrada = logger('entrada')
+log_alinhamento = logger('alinhamento')
+log_arvore = logger('arvore')
+log_driver = logger('driver')
 
 # %%
 def duplicate_names(file_path: str) -> bool:
@@ -42,6 +39,8 @@ def duplicate_names(file_path: str) -> bool:
         bool: True se houver sequências duplicadas e False se não houver
     """
     
+    from Bio import SeqIO
+
     names_set = set()
 
     try:
@@ -52,7 +51,7 @@ def duplicate_names(file_path: str) -> bool:
                 names_set.add(record.id)
 
     except FileNotFoundError:
-        print(f"O arquivo '{file_path}' não foi encontrado.")
+        log_entrada.warning(f"O arquivo '{file_path}' não foi encontrado.")
         return False
 
     return False
@@ -78,24 +77,27 @@ def validate_sequences(file_path: str) -> bool:
                 if not set(sequence).issubset(valid_characters):
                     return False
     except FileNotFoundError:
-        print(f"O arquivo '{file_path}' não foi encontrado.")
+        log_entrada.warning(f"O arquivo '{file_path}' não foi encontrado.")
         return False
 
     return True
 
 # %%
-def remove_pipe(name: str, path_in_fasta: str, input_path: str) -> None:
+def remove_pipe(name: str, path_in_fasta: str, output_path: str) -> None:
     """Cria um arquivo de sequências únicas, a partir
     de um arquivo de entrada fasta.
 
     Args:
-        output_file (str): Caminho do arquivo de saída
+        name (str): Nome do arquivo de saída
         path_in_fasta (str): Caminho do arquivo com as sequências de entrada
+        output_path (str): Pasta do arquivo de saída
 
     Returns:
         str: Caminho do arquivo de saída
     """
 
+    from Bio import SeqIO
+
     sequences = list(SeqIO.parse(path_in_fasta, "fasta"))
     
     # Criar um dicionário para armazenar as sequências únicas
@@ -111,23 +113,28 @@ def remove_pipe(name: str, path_in_fasta: str, input_path: str) -> None:
     # Criar uma lista de sequências únicas
     unique_sequences_list = list(unique_sequences.values())
 
-    # Substitui o arquivo original por um arquivo tratado
-    SeqIO.write(unique_sequences_list, os.path.join(input_path, name), "fasta")
+    # Grava o arquivo tratado (substitui o original quando output_path é a pasta de entrada)
+    SeqIO.write(unique_sequences_list, os.path.join(output_path, name), "fasta")
 
 # %%
-def v_sequences(input_path: str):
+def v_sequences(input_path: str, output_path: str = None):
     """Percorre os arquivos na pasta de entrada.
     Em caso de arquivos com sequências duplicadas ou sequências inválidas, substitui por um arquivo tratado (no_pipe)
 
     Args:
-        path_in_fasta (str): Pasta com os arquivos de entrada em formato fasta
+        input_path (str): Pasta com os arquivos de entrada em formato fasta
+        output_path (str, optional): Pasta que recebe os arquivos tratados e cópias dos demais, sem alterar a
+            pasta de entrada (ex.: a área de trabalho da execução). Defaults to None (trata na própria pasta).
     """
+    output_path = output_path or input_path
 
     for name_file in os.listdir(input_path):
         c_path = os.path.join(input_path, name_file)
 
         if duplicate_names(c_path) or not(validate_sequences(c_path)):
-            remove_pipe(Path(name_file), c_path, input_path)
+            remove_pipe(Path(name_file), c_path, output_path)
+        elif output_path != input_path:
+            shutil.copy2(c_path, os.path.join(output_path, name_file))
 
 # %%
 def clean_files(dir_path: str) -> None:
@@ -137,8 +144,13 @@ def clean_files(dir_path: str) -> None:
     [tmp, Trees, full_dataset_plasmodium] - Essas as pastas que normalmente tem que ser limpas
 
     Args:
-        data_output_path (str): caminho da pasta
+        data_output_path (str): caminho da pasta ou de um arquivo único de árvores (ver arquivo_arvores.py), que é apagado
     """
+    if e_arquivo(dir_path):
+        for path in (dir_path, dir_path + '-wal', dir_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        return
 
     files = os.listdir(dir_path)
     if "full_dataset_plasmodium" in dir_path:
@@ -153,7 +165,8 @@ def clean_files(dir_path: str) -> None:
                 os.remove(file_path)
 
 # %%
-def construir_arvores(path_out_aln: str, path_out_tree: str, evolutionary_model:str = 'nj', output_format: str = 'nexus', distance_method: str = 'identity') -> None:
+def construir_arvores(path_out_aln: str, path_out_tree: str, evolutionary_model:str = 'nj', output_format: str = 'nexus', distance_method: str = 'identity',
+                      max_gaps: float = None, remover_constantes: bool = False, bootstrap: int = 0) -> None:
     """_summary_
 
     Args:
@@ -162,78 +175,188 @@ def construir_arvores(path_out_aln: str, path_out_tree: str, evolutionary_model:
         evolutionary_model (str, optional): Pode ser "nj" ou "upgm". Defaults to 'nj'.
         output_format (str, optional): Pode ser "newick", "nexus" ou "phyloxml". Defaults to 'nexus'.
         distance_method (str, optional): "identity", "blastn", "trans", "hamming", "kimura", "jukes-cantor", "logdet", "mcc", "poisson", "similarity". Defaults to 'identity'.
+        max_gaps (float, optional): Ver construir_arvore. Defaults to None.
+        remover_constantes (bool, optional): Ver construir_arvore. Defaults to False.
+        bootstrap (int, optional): Ver construir_arvore. Defaults to 0.
     """
     
     clean_files(path_out_tree) # Apaga todos os arquivos de árvores da pasta de saída que estejam lá de execuções anteriores
 
-    for file_aln in os.listdir(path_out_aln):
-        print(file_aln)
+    files_aln = [file_aln for file_aln in os.listdir(path_out_aln) if file_aln.endswith('.aln')]  # Somente arquivos de alinhamento
+    progresso = Progresso('arvore', len(files_aln))
 
-        if not file_aln.endswith('.aln'):   # Verifica se é um arquivo de alinhamento
-            continue
-        
-        try:
-            # Abre o arquivo de alinhamento
-            with open(os.path.join(path_out_aln, file_aln), "r") as handle:
-                alignment = AlignIO.read(handle, "clustal") # O objeto MultipleSeqAlignment retornado é armazenado na variável.
-        except Exception as e:
-            print(e)
-            continue
+    for file_aln in files_aln:
+        log_arvore.debug(file_aln)
+        construir_arvore(os.path.join(path_out_aln, file_aln), path_out_tree, evolutionary_model, output_format, distance_method,
+                         max_gaps, remover_constantes, bootstrap)
+        progresso.avancar()
 
-        sequence_names = [record.id for record in alignment]
-        duplicates = [item for item, count in Counter(sequence_names).items() if count > 1]
+    progresso.finalizar()
 
-        if duplicates:
-            print("Nomes duplicados encontrados:", duplicates)
+# %%
+def construir_arvore(path_aln: str, path_out_tree: str, evolutionary_model:str = 'nj', output_format: str = 'nexus', distance_method: str = 'identity',
+                     max_gaps: float = None, remover_constantes: bool = False, bootstrap: int = 0, id_tarefa: int = None,
+                     workers_bootstrap: int = None) -> str:
+    """Constrói a árvore de um único arquivo de alinhamento (ver construir_arvores)
 
-            for i, record in enumerate(alignment):
-                record.id = f"seq_{i}"
-        
-        # Calcula a matriz de distância
-        # argumento 'identity', que indica que a distância entre as sequências será medida pelo número de identidades, 
-        # ou seja, a fração de posições nas sequências que possuem o mesmo nucleotídeo ou aminoácido.
+    Args:
+        path_aln (str): Arquivo de alinhamento .aln (clustal)
+        path_out_tree (str): Pasta de saída da árvore
+        evolutionary_model (str, optional): Pode ser "nj" ou "upgma". Defaults to 'nj'.
+        output_format (str, optional): Pode ser "newick", "nexus" ou "phyloxml". Defaults to 'nexus'.
+        distance_method (str, optional): Ver construir_arvores. Defaults to 'identity'.
+        max_gaps (float, optional): Remove as colunas com fração de gaps acima deste valor antes da matriz de
+            distâncias. Defaults to None (mantém todas).
+        remover_constantes (bool, optional): Remove as colunas iguais em todas as sequências. Defaults to False.
+        bootstrap (int, optional): Replicatas de bootstrap; o suporte dos clados vai para a árvore (ver bootstrap.py).
+            Defaults to 0 (sem bootstrap).
+        id_tarefa (int, optional): Com o corte de colunas, grava as colunas mantidas em Parametros
+            (chave colunas_mantidas). Defaults to None.
+        workers_bootstrap (int, optional): Processos do bootstrap (ver suporte_bootstrap). Defaults to None.
+
+    Returns:
+        str: caminho da árvore gerada ou None se o alinhamento não puder ser lido
+    """
+    from Bio import AlignIO, Phylo
+    from Bio.Phylo.TreeConstruction import DistanceTreeConstructor
+    from matriz_distancia import agrupar_identicas, codificar, colunas_informativas, matriz_distancias
+
+    try:
+        # Abre o arquivo de alinhamento
+        with open(path_aln, "r") as handle:
+            alignment = AlignIO.read(handle, "clustal") # O objeto MultipleSeqAlignment retornado é armazenado na variável.
+    except Exception as e:
+        log_arvore.error(f"{path_aln}: {e}")
+        return None
 
-        calculator = DistanceCalculator(distance_method)
+    sequence_names = [record.id for record in alignment]
+    duplicates = [item for item, count in Counter(sequence_names).items() if count > 1]
 
-        # Calcula a matriz de distâncias entre as sequências
-        distance_matrix = calculator.get_distance(alignment) 
+    if duplicates:
+        log_arvore.debug(f"{path_aln}: nomes duplicados encontrados: {duplicates}")
 
-        # Constrói a árvore filogenética
-        # Constrói árvores filogenéticas a partir de matrizes de distâncias entre sequências.
-        constructor = DistanceTreeConstructor()
-        
-        match evolutionary_model.lower():
-            case 'nj':
-                # Para NJ
-                tree = constructor.nj(distance_matrix)
-            case 'upgma':
-                # Para UPGMA
-                tree = constructor.upgma(distance_matrix)
-
-        # Salva a árvore
-        path_o_tree = os.path.join(path_out_tree,f'tree_{Path(file_aln).stem}.{output_format}')
-        Phylo.write(tree, path_o_tree, output_format)
+        for i, record in enumerate(alignment):
+            record.id = f"seq_{i}"
+    
+    # Calcula a matriz de distância
+    # argumento 'identity', que indica que a distância entre as sequências será medida pelo número de identidades, 
+    # ou seja, a fração de posições nas sequências que possuem o mesmo nucleotídeo ou aminoácido.
+
+    # Corte de colunas: colunas com muitos gaps ou constantes só aumentam o custo O(n²·L) das distâncias
+    # (os valores vêm como texto quando a Tarefa é retomada, ver carregar_parametros)
+    codigos = codificar(alignment)
+    colunas = None
+    remover_constantes = remover_constantes in (True, 'True', 'true', '1')
+    if max_gaps is not None or remover_constantes:
+        colunas = colunas_informativas(codigos, None if max_gaps is None else float(max_gaps), remover_constantes)
+        codigos = codigos[:, colunas]
+        mantidas = int(colunas.sum())
+        log_arvore.debug(f"{path_aln}: {mantidas} de {len(colunas)} colunas mantidas")
+
+        if id_tarefa is not None:
+            from tabelas import Session, Parametros
+            session = Session()
+            session.add(Parametros(Chave='colunas_mantidas', Valor=f'{mantidas}/{len(colunas)} {Path(path_aln).stem}'[:50], idTarefa=id_tarefa))
+            session.commit()
+            session.close()
+
+    # Sequências idênticas (nas colunas usadas) entram uma vez só no NJ/UPGMA, que é O(n³),
+    # e voltam para a árvore depois como irmãs com comprimento de ramo 0
+    representantes, identicas = agrupar_identicas(codigos)
+    if len(representantes) < 2:
+        representantes, identicas = None, {}
+    elif identicas:
+        log_arvore.debug(f"{path_aln}: {len(representantes)} de {len(alignment)} sequências únicas")
+
+    # Calcula a matriz de distâncias entre as sequências, em blocos e com memória limitada (ver matriz_distancia.py)
+    distance_matrix = matriz_distancias(alignment, distance_method, colunas=colunas, linhas=representantes)
+
+    # Constrói a árvore filogenética
+    # Constrói árvores filogenéticas a partir de matrizes de distâncias entre sequências.
+    constructor = DistanceTreeConstructor()
+    
+    match evolutionary_model.lower():
+        case 'nj':
+            # Para NJ
+            tree = constructor.nj(distance_matrix)
+        case 'upgma':
+            # Para UPGMA
+            tree = constructor.upgma(distance_matrix)
+
+    # O suporte é calculado com as representantes, antes de recolocar as cópias
+    if bootstrap and int(bootstrap) > 0:
+        from bootstrap import suporte_bootstrap
+        linhas = representantes if representantes is not None else list(range(len(alignment)))
+        suporte_bootstrap(tree, codigos[linhas], [alignment[i].id for i in linhas], distance_method,
+                          evolutionary_model, int(bootstrap), workers=workers_bootstrap)
+
+    if identicas:
+        reinserir_identicas(tree, {alignment[r].id: [alignment[i].id for i in copias] for r, copias in identicas.items()})
+
+    # Salva a árvore
+    name_tree = f'tree_{Path(path_aln).stem}.{output_format}'
+    if e_arquivo(path_out_tree):
+        return abrir(path_out_tree).gravar(name_tree, tree)
+
+    path_o_tree = os.path.join(path_out_tree, name_tree)
+    Phylo.write(tree, path_o_tree, output_format)
+
+    return path_o_tree
+
+# %%
+def reinserir_identicas(tree, identicas: dict) -> None:
+    """Recoloca na árvore as sequências removidas por serem idênticas a outra (ver agrupar_identicas)
+
+    Cada folha representante vira um clado, com o comprimento de ramo original, formado por ela e pelas
+    cópias, todas com comprimento 0 (clados binários encadeados, como o NJ/UPGMA produziriam).
+
+    Args:
+        tree (Tree): Árvore do Bio.Phylo construída só com as representantes
+        identicas (dict): {nome da representante: [nomes das cópias]}
+    """
+    from Bio.Phylo.BaseTree import Clade
+
+    n = 0
+    for folha in tree.get_terminals():
+        copias = identicas.get(folha.name)
+        if not copias:
+            continue
+
+        no = Clade(branch_length=0, name=folha.name)
+        for copia in copias:
+            n += 1
+            # Nome único: os arquivos de subárvores usam o nome do clado (ver sub_tree)
+            no = Clade(branch_length=0, name=f'Identicas{n}', clades=[no, Clade(branch_length=0, name=copia)])
+
+        # A folha vira a raiz do clado: mantém a posição e o comprimento de ramo dela na árvore
+        folha.name = no.name
+        folha.clades = no.clades
 
 # %%
 def align_sequence(
     algoritmo: str,
     path_in_fasta: str, 
     path_out_aln: str, 
-    *args, **kwargs
+    *args, cache_arvore_guia: CacheArvoreGuia = None, **kwargs
 ):
     """_summary_
 
     Args:
         path_in_fasta (str): _description_
         path_out_aln (str): _description_
-        path_out_dnd (str): _description_
-        path_old_dnd (str): _description_
+        cache_arvore_guia (CacheArvoreGuia, optional): Reaproveita a árvore guia (.dnd) de alinhamentos anteriores
+            do mesmo fasta com os mesmos parâmetros de árvore guia (clustalw e clustalo). Defaults to None.
 
     Returns:
-        _type_: _description_
+        str: caminho do arquivo .aln ou None se o alinhador escreveu em stderr
     """
-    input_path, file_name = os.path.split(path_in_fasta)
+    file_name = os.path.basename(path_in_fasta)
     file_out_aln = os.path.join(path_out_aln, f'{Path(file_name).stem}.aln')
+    file_out_dnd = os.path.join(path_out_aln, f'{Path(file_name).stem}.dnd')
+
+    reaproveitada = False
+    if cache_arvore_guia is not None and cache_arvore_guia.suporta(algoritmo):
+        args, kwargs, chave_arvore_guia, reaproveitada = cache_arvore_guia.preparar(algoritmo, path_in_fasta, file_out_dnd, args, kwargs)
 
     match algoritmo.lower():
         case 'muscle':
@@ -241,6 +364,10 @@ def align_sequence(
             p = subprocess.run(command, capture_output=True, text=True)
         
         case 'clustalw':
+            # A árvore guia calculada vai direto para a pasta de saída (sem NEWTREE o clustalw a grava ao lado
+            # do fasta, que pode ser compartilhado por outras execuções)
+            if 'USETREE' not in kwargs:
+                kwargs = dict(kwargs, NEWTREE=file_out_dnd)
             command = make_clustalw(path_in_fasta, file_out_aln, *args, **kwargs)
             p = subprocess.run(command, capture_output=True, text=True)
         
@@ -272,16 +399,14 @@ def align_sequence(
 
 
     if p.stderr:
-        print(command)
-        print(p.stderr)
+        stderr = p.stderr.decode(errors='replace') if isinstance(p.stderr, bytes) else p.stderr
+        log_alinhamento.warning(f"{' '.join(map(str, command))}\n{stderr}")
         return None
 
-    # Mover o arquivo de saída .dnd para o diretório "resultados"
-    file_old_dnd = os.path.join(input_path, f'{Path(file_name).stem}.dnd')
-    file_out_dnd = os.path.join(path_out_aln, f'{Path(file_name).stem}.dnd')
+    if cache_arvore_guia is not None and cache_arvore_guia.suporta(algoritmo) and not reaproveitada:
+        cache_arvore_guia.guardar(chave_arvore_guia, file_out_dnd)
 
-    if os.path.exists(file_old_dnd):
-        os.rename(file_old_dnd, file_out_dnd)    
+    return file_out_aln
 
 # %%
 def sub_tree(path: str, name_subtree: str, data_format: str, data_output_path: str,  extension_format: str) -> list:
@@ -297,21 +422,51 @@ def sub_tree(path: str, name_subtree: str, data_format: str, data_output_path: s
     Returns:
         list: retorna uma lista com todos os arquivos de subarvores do arquivo de entrada
     """
-    tree = Phylo.read(path, data_format)
-    name_subtree = name_subtree.rsplit(".", 1)[0]
-
     #Lista caminhos das subárvores (que posteriormente serão utilizadas para compor a matriz de subárvores)
-    row_subtree = []
-
-    for clade in tree.find_clades():
-        subtree = Phylo.BaseTree.Tree(clade)
-        if subtree.count_terminals() > 1:
-            filepath_out = os.path.join(data_output_path, f'{name_subtree}_{clade.name}.{extension_format}')
-            Phylo.write(subtree, filepath_out, data_format)        
-            row_subtree.append(filepath_out)
-            
+    row_subtree = [registro.caminho for registro in sub_tree_registros(path, name_subtree, data_format, data_output_path, extension_format)]
+
     return row_subtree 
 
+# %%
+def sub_tree_registros(path: str, name_subtree: str, data_format: str, data_output_path: str, extension_format: str,
+                       linha: int = 0, topologia: bool = False) -> list:
+    """Gera as subárvores de um arquivo de árvore, como em sub_tree, mas devolvendo um RegistroSubarvore
+    (linha, caminho, folhas) por subárvore, de forma que as folhas não precisem ser relidas do arquivo.
+
+    Args:
+        path (str): Arquivo da árvore
+        name_subtree (str): Nome base dos arquivos de subárvores
+        data_format (str): Formato da árvore
+        data_output_path (str): Pasta de saída das subárvores ou arquivo único (ver arquivo_arvores.py), no qual
+            as subárvores da árvore são gravadas em uma transação e os caminhos dos registros são referências
+        extension_format (str): Extensão dos arquivos de subárvores
+        linha (int, optional): Linha (árvore) das subárvores na matriz. Defaults to 0.
+        topologia (bool, optional): Inclui a topologia canônica no registro. Defaults to False.
+
+    Returns:
+        list: registros das subárvores com mais de uma folha
+    """
+    from Bio import Phylo
+
+    # Folhas e topologia de todos os clados em uma passada (ver ArvoreCompacta)
+    arvore = ArvoreCompacta.ler(path, data_format)
+    topologias = arvore.topologias() if topologia else None
+    name_subtree = name_subtree.rsplit(".", 1)[0]
+
+    indices = [i for i, no in enumerate(arvore.nos) if no.n_folhas > 1]
+    nomes = [f'{name_subtree}_{arvore.nos[i].nome}.{extension_format}' for i in indices]
+
+    if e_arquivo(data_output_path):
+        caminhos = abrir(data_output_path).gravar_varias(
+            (nome, Phylo.BaseTree.Tree(arvore.clados[i])) for nome, i in zip(nomes, indices))
+    else:
+        caminhos = [os.path.join(data_output_path, nome) for nome in nomes]
+        for caminho, i in zip(caminhos, indices):
+            Phylo.write(Phylo.BaseTree.Tree(arvore.clados[i]), caminho, data_format)
+
+    return [RegistroSubarvore(linha, caminho, arvore.folhas_clado(i), topologias[i] if topologia else None)
+            for caminho, i in zip(caminhos, indices)]
+
 # %%
 def directory_has_single_file(directory_path: str) -> str:
     """Verifica se o diretório possui somente um arquivo
@@ -344,24 +499,13 @@ def preencher_matriz(matriz: list, max_columns:int, valor_preenchimento=None):
 def grade_maf(path_1:str, path_2:str, data_format:str) -> int:
     if(path_1 is None or path_2 is None):
         return -1      
-    grau = 0
-
-    subtree_1 = Phylo.read(path_1,data_format)
-    subtree_2 = Phylo.read(path_2,data_format)
 
-    # Lista todas as clades ( folhas )
-    list_1 = [i.name for i in subtree_1.get_terminals()]
-    list_2 = [i.name for i in subtree_2.get_terminals()]
+    # Folhas das duas subárvores como bitsets sobre os mesmos ids: o grau é o tamanho da interseção
+    ids = {}
+    subtree_1 = ArvoreCompacta.ler(path_1, data_format, ids)
+    subtree_2 = ArvoreCompacta.ler(path_2, data_format, ids)
 
-    sorted_list1 = sorted(list_1)
-    sorted_list2 = sorted(list_2)
-    
-    for i in range(len(list_1)):
-        for j in range(len(list_2)):
-            if sorted_list1[i] == sorted_list2[j]:
-                grau += 1
-    
-    return grau
+    return (subtree_1.nos[0].mascara & subtree_2.nos[0].mascara).bit_count()
 
 # %%
 def fill_dict(dict, max_columns):
@@ -392,42 +536,64 @@ def compare_subtrees(max_rows: int, max_columns: int, matrix_subtree: list, dict
     return max_maf, dict_maf_database
 
 # %%
-def files_align(algoritmo: str, input_path: str, path_out_aln: str, *args, **kwargs):
+def files_align(algoritmo: str, input_path: str, path_out_aln: str, *args, id_tarefa: int = None, arquivos=None,
+                sequencias=None, semente: int = None, **kwargs):
+    """Alinha os arquivos fasta de uma pasta, opcionalmente só uma amostra deles (ver indice_fasta.py)
+
+    Args:
+        algoritmo (str): Alinhador (ver align_sequence)
+        input_path (str): Pasta com os arquivos fasta
+        path_out_aln (str): Pasta de saída dos alinhamentos
+        id_tarefa (int, optional): Se informado, liga cada entrada alinhada à Tarefa (Tarefas_Entradas). Defaults to None.
+        arquivos (int | float, optional): Quantidade ou fração de arquivos sorteados. Defaults to todos.
+        sequencias (int | float, optional): Quantidade ou fração das sequências sorteadas de cada arquivo;
+            só os registros sorteados são lidos (pelo índice .fai) e gravados em uma pasta temporária. Defaults to todas.
+        semente (int, optional): Semente dos sorteios. Defaults to None.
+        *args, **kwargs: Parâmetros do alinhador
+    """
+    from indice_fasta import FastaIndexado, amostrar_arquivos, amostrar_sequencias
+
     clean_files(path_out_aln)
 
-    all_files = os.listdir(input_path)
-    files = random.choices(all_files, k=random.random(10, len(all_files)))
+    files = [file for file in os.listdir(input_path) if file != "file.gitkeep"]
+    if arquivos is not None:
+        files = amostrar_arquivos(files, arquivos, semente)
 
-    files = os.listdir(input_path)
-        
-    session = Session()
-    for file in files:
-        colunas_filtradas = (
-            session.query(Entrada.id)
-                .filter(Entrada.nome == 'PLASMODIUM6.fasta')
-                .first()
-            )
+    path_amostra = tempfile.mkdtemp(prefix='amostra_') if sequencias is not None else None
 
-        te = Tarefas_Entradas(idTarefa=id_tarefa, idEntrada=colunas_filtradas[0])
-        session.add(te)
-        session.commit()
-        id_tarefa = tarefa.id
+    if id_tarefa is not None:
+        from tabelas import Session, Entrada, Tarefas_Entradas
+        session = Session()
 
-        align_sequence(algoritmo, os.path.join(input_path, file), path_out_aln, *args, **kwargs)
-    session.close()
+    try:
+        for file in files:
+            path_in_fasta = os.path.join(input_path, file)
+            if path_amostra is not None:
+                fasta = FastaIndexado(path_in_fasta)
+                path_in_fasta = os.path.join(path_amostra, file)
+                fasta.escrever(path_in_fasta, amostrar_sequencias(fasta, sequencias, semente))
+
+            if id_tarefa is not None:
+                id_entrada = session.query(Entrada.id).filter(Entrada.nome == file).scalar()
+                if id_entrada is not None:
+                    session.add(Tarefas_Entradas(idTarefa=id_tarefa, idEntrada=id_entrada))
+                    session.commit()
+
+            align_sequence(algoritmo, path_in_fasta, path_out_aln, *args, **kwargs)
+    finally:
+        if id_tarefa is not None:
+            session.close()
+        if path_amostra is not None:
+            shutil.rmtree(path_amostra, ignore_errors=True)
 
 # %%
 def make_matrix(input_path: str, data_output_path: str, output_format: str) -> tuple:
     clean_files(data_output_path)
-    
-    files = os.listdir(input_path)
 
     matrix_subtree = []
 
-    for name_file in files:
-        if name_file != "file.gitkeep":
-            file_path = os.path.join(input_path, name_file)
-            matrix_subtree.append(sub_tree(file_path, name_file, 'nexus', data_output_path, output_format))
+    for file_path in listar(input_path):
+        matrix_subtree.append(sub_tree(file_path, nome_arvore(file_path), 'nexus', data_output_path, output_format))
 
     max_columns = max(len(row) for row in matrix_subtree)
     max_rows = len(matrix_subtree)
@@ -437,8 +603,162 @@ def make_matrix(input_path: str, data_output_path: str, output_format: str) -> t
 
     return matrix_subtree, max_columns, max_rows
 
+# %%
+def gerar_subarvores(input_path: str, data_output_path: str, output_format: str, topologia: bool = False):
+    """Versão em streaming de make_matrix: gera as subárvores árvore por árvore.
+    Nenhuma matriz é montada nem preenchida com None; quem consome (IndiceAssinaturas, ComparadorIncremental)
+    processa cada árvore assim que ela é lida.
+
+    Args:
+        input_path (str): Pasta com as árvores ou arquivo único (ver arquivo_arvores.py)
+        data_output_path (str): Pasta de saída das subárvores ou arquivo único
+        output_format (str): Extensão dos arquivos de subárvores
+        topologia (bool, optional): Inclui a topologia canônica nos registros. Defaults to False.
+
+    Yields:
+        list: registros (RegistroSubarvore) das subárvores de uma árvore
+    """
+    clean_files(data_output_path)
+
+    for linha, file_path in enumerate(listar(input_path)):
+        yield sub_tree_registros(file_path, nome_arvore(file_path), 'nexus', data_output_path, output_format, linha, topologia)
+
+# %%
+def pipeline_arquivos(algoritmo: str, input_path: str, path_out_aln: str, path_out_tree: str, path_out_subtree: str,
+                      d_parametros_arvore: dict, *args, workers_alinhamento: int = None, workers_arvore: int = 2,
+                      workers_subarvore: int = 1, tamanho_fila: int = 4, cache_arvore_guia: CacheArvoreGuia = None,
+                      modelo_custo: 'ModeloCusto' = None, id_tarefa: int = None, checkpoints: 'Checkpoints' = None,
+                      perfilador: 'Perfilador' = None, arquivo_unico: bool = False, reuso: 'ReusoAlinhamentos' = None,
+                      **kwargs):
+    """Alinha, constrói a árvore e extrai as subárvores de cada arquivo de entrada em fluxo (ver pipeline.py):
+    cada arquivo segue para a próxima etapa assim que termina a anterior, sem esperar os demais.
+    Substitui a sequência files_align -> construir_arvores -> gerar_subarvores.
+
+    Args:
+        algoritmo (str): Alinhador (ver align_sequence)
+        input_path (str): Pasta com os arquivos fasta
+        path_out_aln (str): Pasta de saída dos alinhamentos
+        path_out_tree (str): Pasta de saída das árvores
+        path_out_subtree (str): Pasta de saída das subárvores
+        d_parametros_arvore (dict): evolutionary_model, output_format, distance_method e, opcionais, max_gaps,
+            remover_constantes e bootstrap de construir_arvore
+        workers_alinhamento (int, optional): Alinhamentos simultâneos. Defaults to os núcleos divididos pelas threads do alinhador.
+        workers_arvore (int, optional): Processos construindo árvores. Defaults to 2.
+        workers_subarvore (int, optional): Threads extraindo subárvores. Defaults to 1.
+        tamanho_fila (int, optional): Tamanho das filas entre as etapas. Defaults to 4.
+        cache_arvore_guia (CacheArvoreGuia, optional): Ver align_sequence. Defaults to None.
+        modelo_custo (ModeloCusto, optional): Ordena os alinhamentos do mais longo para o mais curto pelo tempo
+            previsto e informa a estimativa do tempo total (ver custo.py). Defaults to None.
+        id_tarefa (int, optional): Se informado, grava o tempo de alinhamento de cada entrada (histórico do ModeloCusto)
+            e as colunas mantidas pelo corte (ver construir_arvore). Defaults to None.
+        checkpoints (Checkpoints, optional): Grava cada alinhamento e árvore concluídos e pula os que já foram
+            concluídos em uma execução anterior da mesma Tarefa (as pastas de saída não são limpas). Defaults to None.
+        perfilador (Perfilador, optional): Perfila cada chamada das etapas, inclusive nos processos (ver perfil.py). Defaults to None.
+        arquivo_unico (bool, optional): Grava as árvores e as subárvores em um arquivo único em cada pasta
+            (ARQUIVO_ARVORES e ARQUIVO_SUBARVORES, ver arquivo_arvores.py) em vez de um arquivo por árvore. Defaults to False.
+        reuso (ReusoAlinhamentos, optional): Com id_tarefa, grava o hash de cada alinhamento e copia a árvore de um
+            alinhamento idêntico de outra Tarefa em vez de construí-la (ver reuso.py). Defaults to None.
+        *args, **kwargs: Parâmetros do alinhador
+
+    Yields:
+        list: registros (RegistroSubarvore) das subárvores de cada árvore, na ordem em que ficam prontos
+    """
+    from custo import criar_jobs, ordenar_jobs, estimar_makespan, workers_por_nucleos
+
+    if checkpoints is None:
+        for path in (path_out_aln, path_out_tree, path_out_subtree):
+            clean_files(path)
+
+    if arquivo_unico:
+        path_out_tree = os.path.join(path_out_tree, ARQUIVO_ARVORES)
+        path_out_subtree = os.path.join(path_out_subtree, ARQUIVO_SUBARVORES)
+
+    entradas = [os.path.join(input_path, file) for file in os.listdir(input_path)]
+
+    # Alinhadores multithread (ex.: clustalo --threads) ocupam mais de um núcleo
+    threads = int(kwargs.get('threads') or 1)
+    workers_alinhamento = workers_alinhamento or workers_por_nucleos(threads)
+
+    if modelo_custo is not None:
+        jobs = ordenar_jobs(criar_jobs(entradas, algoritmo, salvar_parametros(*args, **kwargs), modelo_custo))
+        entradas = [job.entrada for job in jobs]
+        log_driver.info(f"Tempo previsto de alinhamento: {estimar_makespan(jobs, workers_alinhamento * threads):.1f}s "
+                        f"({len(jobs)} entradas, {workers_alinhamento} simultâneas)")
+
+    extension_format = d_parametros_arvore['output_format']
+    etapas = [
+        Etapa('alinhamento', partial(_alinhar, algoritmo, path_out_aln, args, kwargs, cache_arvore_guia, id_tarefa, checkpoints, reuso), workers_alinhamento),
+        # Cada processo de árvore fica com a sua parte dos núcleos para o bootstrap (ver suporte_bootstrap)
+        Etapa('arvore', partial(_construir_arvore, path_out_tree, d_parametros_arvore, id_tarefa, checkpoints, reuso,
+                                max((os.cpu_count() or 1) // workers_arvore, 1)), workers_arvore, processos=True),
+        Etapa('subarvores', partial(_extrair_subarvores, path_out_subtree, extension_format), workers_subarvore),
+    ]
+    if perfilador is not None:
+        for etapa in etapas:
+            etapa.funcao = perfilador.envolver(etapa.nome, etapa.funcao)
+
+    executor = PipelineArquivos(etapas, tamanho_fila)
+    progresso = Progresso('pipeline', len(entradas))
+
+    for linha, _, registros in executor.executar(entradas):
+        progresso.avancar()
+        yield [registro._replace(linha=linha) for registro in registros]
+
+    progresso.finalizar()
+    for entrada, etapa, erro in executor.erros:
+        log_driver.warning(f"Erro em {etapa} ({entrada}): {erro}")
+
+# %%
+def _alinhar(algoritmo: str, path_out_aln: str, args: tuple, kwargs: dict, cache_arvore_guia, id_tarefa, checkpoints,
+             reuso, path_in_fasta: str):
+    if checkpoints is not None and (file_out_aln := checkpoints.artefato('alinhamento', path_in_fasta)):
+        return file_out_aln
+
+    inicio = time.time()
+    file_out_aln = align_sequence(algoritmo, path_in_fasta, path_out_aln, *args, cache_arvore_guia=cache_arvore_guia, **kwargs)
+
+    if id_tarefa is not None and file_out_aln is not None:
+        from custo import registrar_execucao_entrada
+        registrar_execucao_entrada(id_tarefa, path_in_fasta, inicio, time.time())
+
+    # Hash do alinhamento normalizado, para reaproveitar a árvore de um alinhamento idêntico (ver reuso.py)
+    if reuso is not None and id_tarefa is not None and file_out_aln is not None:
+        reuso.registrar(id_tarefa, file_out_aln)
+
+    if checkpoints is not None and file_out_aln is not None:
+        checkpoints.marcar('alinhamento', path_in_fasta, file_out_aln)
+
+    return file_out_aln
+
+def _construir_arvore(path_out_tree: str, d_parametros_arvore: dict, id_tarefa, checkpoints, reuso, workers_bootstrap: int,
+                      path_aln: str):
+    if checkpoints is not None and (path_tree := checkpoints.artefato('arvore', path_aln)):
+        return path_tree
+
+    reaproveitar = reuso is not None and id_tarefa is not None
+    path_tree = reuso.reaproveitar_arvore(id_tarefa, path_aln, path_out_tree) if reaproveitar else None
+
+    if path_tree is not None:
+        log_arvore.debug(f"{path_aln}: árvore copiada de um alinhamento idêntico")
+    else:
+        path_tree = construir_arvore(path_aln, path_out_tree, **d_parametros_arvore, id_tarefa=id_tarefa,
+                                     workers_bootstrap=workers_bootstrap)
+        if reaproveitar and path_tree is not None:
+            reuso.arvore_construida(id_tarefa, path_aln)
+
+    if checkpoints is not None and path_tree is not None:
+        checkpoints.marcar('arvore', path_aln, path_tree)
+
+    return path_tree
+
+def _extrair_subarvores(data_output_path: str, extension_format: str, path_tree: str) -> list:
+    return sub_tree_registros(path_tree, nome_arvore(path_tree), extension_format, data_output_path, extension_format)
+
 # %%
 def extrair_informacoes_fasta(input_path: str):
+    from Bio import SeqIO
+    from tabelas import Entrada, create_or_retrieve
+
     infos_entradas = []
 
     files = [file for file in os.listdir(input_path) if os.path.isfile(os.path.join(input_path, file)) and os.path.getsize(os.path.join(input_path, file)) > 1024]
@@ -497,10 +817,57 @@ def salvar_parametros(*args, **kwargs):
 
 # algoritmos = ['muscle', 'clustalw', 'clustalo', 'mafft', 'probcons', 't_coffee']
 algoritmos = ['muscle', 'clustalw']
-if __name__ == '__main__':
-    for _ in range(300):
+
+# Cada iteração roda na sua própria área de trabalho (ver area_trabalho.py).
+# Intermediários em tmpfs: NMFSTP_TMPFS=1 (/dev/shm) ou NMFSTP_TMPFS=<diretório>
+pasta_execucoes = os.path.join('data', 'out', 'runs')
+tmpfs = os.environ.get('NMFSTP_TMPFS')
+tmpfs = True if tmpfs == '1' else tmpfs
+
+def executar(iteracoes: int = 300, algoritmo_padrao: str = 'probcons',
+             input_path: str = os.path.join('data', 'full_dataset_plasmodium'), perfil: bool = False,
+             max_gaps: float = None, remover_constantes: bool = False, bootstrap: int = 0, arquivo_unico: bool = False,
+             reaproveitar: bool = True, top_k: int = None, min_grau: int = 1) -> None:
+    """Driver do NMFSt.P: cada iteração sorteia os parâmetros do alinhador (ou retoma uma Tarefa interrompida),
+    alinha, constrói as árvores, extrai e compara as subárvores e grava o resultado no banco
+
+    Args:
+        iteracoes (int, optional): Defaults to 300.
+        algoritmo_padrao (str, optional): Alinhador das Tarefas novas. Defaults to 'probcons'.
+        input_path (str, optional): Pasta com os arquivos fasta. Defaults to data/full_dataset_plasmodium.
+        perfil (bool, optional): Perfila as etapas e grava os artefatos em <execução>/perfil, ligados à Execucao
+            pela tabela Perfil (ver perfil.py). Defaults to False.
+        max_gaps (float, optional): Corte de colunas das Tarefas novas antes das árvores (ver construir_arvore). Defaults to None.
+        remover_constantes (bool, optional): Idem, para as colunas constantes. Defaults to False.
+        bootstrap (int, optional): Replicatas de bootstrap das árvores das Tarefas novas. Defaults to 0.
+        arquivo_unico (bool, optional): Árvores e subárvores em um arquivo único por pasta (ver pipeline_arquivos).
+            Defaults to False.
+        reaproveitar (bool, optional): Reaproveita as árvores de alinhamentos idênticos de Tarefas anteriores e,
+            se todos os alinhamentos forem iguais aos de uma Tarefa já comparada, os resultados dela (ver reuso.py).
+            Defaults to True.
+        top_k (int, optional): Grava somente os k pares de subárvores de maior grau (ver ComparadorTop). Os
+            resultados parciais não são reaproveitados por outras Tarefas. Defaults to None (todos).
+        min_grau (int, optional): Grava somente os pares com grau >= min_grau. Defaults to 1.
+    """
+    import psutil
+    from tabelas import Session, Host, Execucao, Tarefa, Parametros, create_or_retrieve
+    from metricas import get_cpu_model
+    from subarvores import IndiceAssinaturas
+    from resultados import ComparadorIncremental, ComparadorTop
+    from custo import ModeloCusto
+    from checkpoint import Checkpoints, tarefas_interrompidas, carregar_parametros
+    from perfil import Perfilador
+    from calibracao import calibrar_host
+    from reuso import ReusoAlinhamentos, ComparacaoReaproveitavel, marcar_reuso
+
+    coletar_lixo(pasta_execucoes)
+
+    # Árvores guia (.dnd) compartilhadas entre as iterações (ver arvore_guia.py)
+    cache_arvore_guia = CacheArvoreGuia(os.path.join('data', 'cache', 'arvores_guia'))
+
+    for _ in range(iteracoes):
         # algoritmo = random.choice(algoritmos)
-        algoritmo = 'probcons'
+        algoritmo = algoritmo_padrao
         # %% [markdown]
         # ## 1. Sciphy
 
@@ -510,10 +877,7 @@ if __name__ == '__main__':
         # #### Se houver sequencia duplicadas cria um novo arquivo com sufixo _nopipe e faz as etapas posteriores em cima desse arquivo ao invés do original
 
         # %%
-        v_sequences(os.path.join('data', 'full_dataset_plasmodium'))
-
-        # Coleta informações sobre os arquivos de entrada e já coloca no banco de dados
-        infos_entradas = extrair_informacoes_fasta(os.path.join("data", "full_dataset_plasmodium"))
+        perfilador = Perfilador(perfil)
 
         # %% [markdown]
         # #### Inicia o monitoramento de recursos
@@ -529,113 +893,189 @@ if __name__ == '__main__':
             Host,
             ['nome']
         )
+        # Uma vez por host: os tempos de hosts diferentes são normalizados pela calibração (ver calibracao.py)
+        calibracao = calibrar_host(host.id)
+
+        # Previsão do tempo de alinhamento neste host a partir das execuções anteriores, inclusive as das
+        # iterações anteriores (ver custo.py)
+        modelo_custo = ModeloCusto.from_db(calibracao.fator)
 
         # %%
         initial_disk_io = psutil.disk_io_counters()
-        monitor = Execucao(
-            HoraInicio=time.time(),
-            UsoCPU=psutil.cpu_percent(),
-            MemoriaDisponivel=psutil.virtual_memory().free,
-        )
 
-        session = Session()
-        session.add(monitor)
-        session.commit()
-        id_monitor = monitor.id
-        session.close()
+        # Retoma a Tarefa interrompida mais recente deste host (ver checkpoint.py) em vez de começar outra:
+        # os alinhamentos e árvores já concluídos são reaproveitados
+        interrompidas = tarefas_interrompidas(pasta_execucoes)
 
-        # %%
-        tarefa = Tarefa(nome='Subárvores Frequentes', algoritmo='NMFSt.P', idExecucao=id_monitor, idHost=host.id)
-        session = Session()
-        session.add(tarefa)
-        session.commit()
-        id_tarefa = tarefa.id
-        session.close()
+        if interrompidas:
+            id_tarefa = interrompidas[0]
+            checkpoints = Checkpoints(id_tarefa)
+            algoritmo, tags, params, d_parametros = carregar_parametros(id_tarefa)
 
-        # %% [markdown]
-        # ### 1.2 Alinhamento múltiplo de sequências
+            session = Session()
+            id_monitor = session.query(Tarefa.idExecucao).filter_by(id=id_tarefa).scalar()
+            session.close()
 
-        # %%
-        params, tags = sort_params(algoritmo)
-                
-        d_parametros = salvar_parametros(*tags, **params)
-        d_parametros['algoritmo'] = algoritmo
+            log_driver.info(f"Retomando a tarefa {id_tarefa} (retomada {checkpoints.retomar()}): "
+                            f"{checkpoints.contar('alinhamento')} alinhamentos e {checkpoints.contar('arvore')} árvores concluídos")
+        else:
+            monitor = Execucao(
+                HoraInicio=time.time(),
+                UsoCPU=psutil.cpu_percent(),
+                MemoriaDisponivel=psutil.virtual_memory().free,
+            )
 
-        try:
-            # %%
-            print(d_parametros)
-            files_align(algoritmo, os.path.join('data', 'full_dataset_plasmodium'), os.path.join('data', 'out', 'tmp'), *tags, **params)
+            session = Session()
+            session.add(monitor)
+            session.commit()
+            id_monitor = monitor.id
+            session.close()
 
             # %%
+            tarefa = Tarefa(nome='Subárvores Frequentes', algoritmo='NMFSt.P', idExecucao=id_monitor, idHost=host.id)
             session = Session()
-            for chave, valor in d_parametros.items():
-                parametros = Parametros(Chave=chave, Valor=valor, idTarefa=id_tarefa)
-                session.add(parametros)
+            session.add(tarefa)
             session.commit()
+            id_tarefa = tarefa.id
             session.close()
 
-            # %% [markdown]
-            # ### 1.3 Escolha do modelo evolutivo
+            checkpoints = Checkpoints(id_tarefa)
 
-            # %% [markdown]
-            # 
-
-            # %% [markdown]
-            # ### 1.4 Geração da Árvore Filogenética
-            # Parametros de entrada do algoritmo: <br>
-            # Modelo evoltivo: Pode ser "nj" ou "upgma" <br>
-            # Formato de saída: Pode ser nexus <br>
+            params, tags = sort_params(algoritmo)
+                    
+            d_parametros = salvar_parametros(*tags, **params)
+            d_parametros['algoritmo'] = algoritmo
 
-            # %%
-            d_parametros = {
-                'evolutionary_model':'nj', 
-                'output_format':'nexus', 
-                'distance_method':'identity'
-            }
+        # %% [markdown]
+        # ### 1.2 Alinhamento múltiplo de sequências
 
-            session = Session()
-            for chave, valor in d_parametros.items():
-                parametros = Parametros(Chave=chave, Valor=valor, idTarefa=id_tarefa)
-                session.add(parametros)
-            session.commit()
-            session.close()
+        # %%
+        area = AreaTrabalho(pasta_execucoes, f'tarefa_{id_tarefa}', tmpfs)
+        concluida = False
 
-            # %%
-            print("Construindo árvores: ")
-            construir_arvores(os.path.join("data", "out", "tmp"), os.path.join("data", "out", "Trees"), 
-                            d_parametros['evolutionary_model'], d_parametros['output_format'], d_parametros['distance_method'])
+        try:
+            # Os arquivos tratados (e cópias dos demais) ficam na área de trabalho: a pasta de entrada, que pode
+            # ser compartilhada por execuções simultâneas, não é alterada
+            with perfilador.etapa('v_sequences'):
+                v_sequences(input_path, area.entradas)
+
+            # Coleta informações sobre os arquivos de entrada e já coloca no banco de dados
+            with perfilador.etapa('extrair_informacoes_fasta'):
+                infos_entradas = extrair_informacoes_fasta(area.entradas)
+
+            if not interrompidas:
+                # %%
+                log_driver.info(f"Tarefa {id_tarefa}: {d_parametros}")
+
+                # %%
+                session = Session()
+                for chave, valor in d_parametros.items():
+                    parametros = Parametros(Chave=chave, Valor=valor, idTarefa=id_tarefa)
+                    session.add(parametros)
+                session.commit()
+                session.close()
+
+                # %% [markdown]
+                # ### 1.3 Escolha do modelo evolutivo
+
+                # %% [markdown]
+                # 
+
+                # %% [markdown]
+                # ### 1.4 Geração da Árvore Filogenética
+                # Parametros de entrada do algoritmo: <br>
+                # Modelo evoltivo: Pode ser "nj" ou "upgma" <br>
+                # Formato de saída: Pode ser nexus <br>
+
+                # %%
+                d_parametros = {
+                    'evolutionary_model':'nj', 
+                    'output_format':'nexus', 
+                    'distance_method':'identity'
+                }
+                # Corte de colunas opcional, gravado com os demais parâmetros da árvore
+                if max_gaps is not None:
+                    d_parametros['max_gaps'] = max_gaps
+                if remover_constantes:
+                    d_parametros['remover_constantes'] = True
+                if bootstrap:
+                    d_parametros['bootstrap'] = bootstrap
+
+                # Modo de consulta da comparação: gravado à parte, não é parâmetro da árvore
+                d_parametros_comparacao = {'top_k': top_k, 'min_grau': min_grau if min_grau > 1 else None}
+
+                session = Session()
+                for chave, valor in d_parametros.items():
+                    parametros = Parametros(Chave=chave, Valor=valor, idTarefa=id_tarefa)
+                    session.add(parametros)
+                for chave, valor in d_parametros_comparacao.items():
+                    if valor is not None:
+                        session.add(Parametros(Chave=chave, Valor=valor, idTarefa=id_tarefa))
+                session.commit()
+                session.close()
 
             # %% [markdown]
             # ### 1.5 Geração das Subárvores Possíveis
+            # Alinhamento, árvore e subárvores de cada arquivo são feitos em fluxo (ver pipeline_arquivos):
+            # um arquivo já alinhado segue para a árvore enquanto os demais ainda estão sendo alinhados
 
             # %%
-            matrix_subtree, max_columns, max_rows = make_matrix(os.path.join("data", "out", "Trees"), os.path.join("data", "out", "Subtrees"), "nexus")
+            log_driver.info("Alinhando e construindo árvores")
+            reuso = ReusoAlinhamentos(pasta_execucoes, d_parametros) if reaproveitar else None
+            subarvores = pipeline_arquivos(algoritmo, area.entradas, area.tmp,
+                                           area.trees, area.subtrees, d_parametros, *tags,
+                                           cache_arvore_guia=cache_arvore_guia, modelo_custo=modelo_custo,
+                                           id_tarefa=id_tarefa, checkpoints=checkpoints, perfilador=perfilador,
+                                           arquivo_unico=arquivo_unico, reuso=reuso, **params)
 
             # %% [markdown]
             # ### 1.6 Mapeamento das Subárvores
 
             # %%
-            dict_maf_database = {}
-            dict_maf_database = fill_dict(dict_maf_database, max_columns)
-                
+            # Subárvores com o mesmo conjunto de folhas são agrupadas por assinatura (ver subarvores.py)
+            indice = IndiceAssinaturas()
+            # Com top_k ou min_grau só os pares selecionados são guardados, em vez do resultado completo
+            consulta = top_k is not None or min_grau > 1
+            comparador = ComparadorTop(indice, top_k, min_grau) if consulta else ComparadorIncremental(indice)
 
             # %% [markdown]
             # ### 1.7 Cálculo da Similaridade entre as Subárvores
 
             # %%
-            print("Comparando subárvores")
-            max_maf, dict_maf_database = compare_subtrees(max_rows, max_columns, matrix_subtree, dict_maf_database)
+            log_driver.info("Comparando subárvores")
+            # Inclui a espera pelo pipeline; as etapas dele são perfiladas à parte
+            # Com o reuso, a comparação só começa quando um alinhamento difere dos de todas as Tarefas já comparadas
+            # O resultado parcial de uma consulta não vem de outra Tarefa
+            reaproveitar_comparacao = reaproveitar and not consulta
+            consumidor = ComparacaoReaproveitavel(id_tarefa, comparador) if reaproveitar_comparacao else comparador
+            with perfilador.etapa('comparacao'):
+                for registros in subarvores:
+                    consumidor.consumir(registros)
+                id_origem = consumidor.finalizar() if reaproveitar_comparacao else None
+                resultado = comparador.resultado if id_origem is None else None
 
             # %% [markdown]
             # ### 1.8 Geração do Dicionário de Saída
 
             # %%
-            print(max_maf)
-            for i, j in dict_maf_database.items():
-                print(i,j)
-                for key, val in j.items():
-                    # print(i, key, val)
-                    continue
+            if id_origem is not None:
+                log_driver.info(f"Tarefa {id_tarefa}: alinhamentos idênticos aos da tarefa {id_origem}, resultados reaproveitados")
+                if not checkpoints.concluido('comparacao', 'resultado'):
+                    marcar_reuso(id_tarefa, id_origem)
+                    checkpoints.marcar('comparacao', 'resultado')
+            else:
+                max_maf = resultado.max_maf
+
+                log_driver.info(f"MAF máximo {max_maf}: {len(indice)} subárvores únicas, {len(resultado)} pares")
+                if not checkpoints.concluido('comparacao', 'resultado'):
+                    with perfilador.etapa('to_sql'):
+                        resultado.to_sql(id_tarefa, indice)
+                    checkpoints.marcar('comparacao', 'resultado')
+
+            # Somente as árvores são mantidas; alinhamentos e subárvores são apagados com a área de trabalho
+            if arquivo_unico:
+                abrir(os.path.join(area.trees, ARQUIVO_ARVORES)).consolidar()
+            area.promover(area.trees)
 
             # %% [markdown]
             # #### Complementando as variáveis de monitoramento
@@ -652,9 +1092,47 @@ if __name__ == '__main__':
             session.commit()
             session.close()
 
-            print("Fim")
+            log_driver.info(f"Tarefa {id_tarefa}: fim")
+            concluida = True
 
         except Exception as e:
-            print("ERRO")
-            print(e)
-            logging.error(e, exc_info=True)
\ No newline at end of file
+            log_driver.error(f"Tarefa {id_tarefa}: {e}", exc_info=True)
+
+        finally:
+            perfilador.salvar(os.path.join(area.persistente, 'perfil'), id_monitor)
+
+            # Uma iteração que falhou mantém os intermediários para ser retomada pela próxima
+            if concluida:
+                area.finalizar()
+            else:
+                area.interromper()
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description='NMFSt.P: subárvores frequentes')
+    parser.add_argument('--iteracoes', type=int, default=300)
+    parser.add_argument('--algoritmo', default='probcons', help='Alinhador das Tarefas novas')
+    parser.add_argument('--entrada', default=os.path.join('data', 'full_dataset_plasmodium'), help='Pasta com os arquivos fasta')
+    parser.add_argument('--profile', action='store_true',
+                        help='Perfila as etapas (cProfile e tracemalloc) e grava os artefatos na pasta da execução')
+    parser.add_argument('--max-gaps', type=float, help='Remove as colunas com fração de gaps acima deste valor antes das árvores')
+    parser.add_argument('--remover-constantes', action='store_true', help='Remove as colunas constantes antes das árvores')
+    parser.add_argument('--bootstrap', type=int, default=0, help='Replicatas de bootstrap para o suporte dos clados das árvores')
+    parser.add_argument('--arquivo-unico', action='store_true',
+                        help='Grava as árvores e subárvores em um arquivo único por pasta em vez de um arquivo por árvore')
+    parser.add_argument('--sem-reuso', action='store_true',
+                        help='Não reaproveita árvores e resultados de alinhamentos idênticos de Tarefas anteriores')
+    parser.add_argument('--top-k', type=int, help='Grava somente os k pares de subárvores de maior grau')
+    parser.add_argument('--min-grau', type=int, default=1, help='Grava somente os pares de subárvores com grau >= este valor')
+    args = parser.parse_args(argv)
+
+    listener = configurar_logging()
+    try:
+        executar(args.iteracoes, args.algoritmo, args.entrada, args.profile, args.max_gaps, args.remover_constantes,
+                 args.bootstrap, args.arquivo_unico, not args.sem_reuso, args.top_k, args.min_grau)
+    finally:
+        listener.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+"""Matriz de distâncias de um alinhamento em blocos, com memória limitada
+
+Equivalente ao DistanceCalculator do Biopython (mesmos modelos e mesmos valores, em float32), mas sem o laço em Python
+par a par: o alinhamento é codificado como uma matriz de bytes (sequências x colunas) e cada sequência é
+comparada com as seguintes em fatias, com o tamanho da fatia escolhido para que os temporários caibam em
+`memoria_max`. O resultado é gravado em uma matriz condensada float32 pré-alocada
+(só os pares i < j, na ordem do scipy.spatial.distance.squareform), preenchida por várias threads: o NumPy
+libera o GIL nas comparações e somas, e cada bloco de linhas escreve em um trecho disjunto da mesma matriz.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+MEMORIA_PADRAO = 256 * 2 ** 20  # bytes para os temporários de todos os blocos em andamento
+# Abaixo disso o custo de criar as threads supera o ganho
+MINIMO_SEQUENCIAS_PARALELO = 256
+
+
+def codificar(alignment) -> np.ndarray:
+    """Alinhamento (MultipleSeqAlignment) como matriz uint8 sequências x colunas"""
+    return np.array([np.frombuffer(str(record.seq).encode('ascii'), dtype=np.uint8) for record in alignment])
+
+
+def colunas_informativas(codigos: np.ndarray, max_gaps: float = None, remover_constantes: bool = False,
+                         gaps: bytes = b'-.') -> np.ndarray:
+    """Máscara das colunas mantidas pelo corte: colunas com fração de gaps acima de `max_gaps` e, com
+    `remover_constantes`, colunas com o mesmo caractere em todas as sequências (inclusive só gaps) saem
+
+    Args:
+        codigos (np.ndarray): Alinhamento codificado (ver codificar)
+        max_gaps (float, optional): Fração máxima de gaps de uma coluna mantida. Defaults to None (sem limite).
+        remover_constantes (bool, optional): Defaults to False.
+        gaps (bytes, optional): Caracteres contados como gap. Defaults to b'-.'.
+
+    Returns:
+        np.ndarray: máscara booleana das colunas
+    """
+    mantidas = np.ones(codigos.shape[1], dtype=bool)
+    if not codigos.size:
+        return mantidas
+
+    if max_gaps is not None:
+        eh_gap = np.zeros(256, dtype=bool)
+        eh_gap[list(gaps)] = True
+        mantidas &= eh_gap[codigos].mean(axis=0) <= max_gaps
+
+    if remover_constantes:
+        mantidas &= (codigos != codigos[0]).any(axis=0)
+
+    return mantidas
+
+
+def agrupar_identicas(codigos: np.ndarray, gaps: bytes = b'-.*') -> tuple:
+    """Agrupa as sequências alinhadas idênticas pelo hash das linhas codificadas
+
+    Sequências idênticas têm distância 0 entre si e as mesmas distâncias às demais, então a árvore pode ser
+    construída só com uma representante de cada grupo (ver reinserir_identicas em main.py). Linhas só com gaps
+    não são agrupadas: com os modelos de pontuação a distância entre elas é 1, não 0.
+
+    Returns:
+        tuple: (representantes, identicas) com os índices das sequências mantidas, em ordem, e
+            {representante: [índices das cópias]}
+    """
+    eh_gap = np.zeros(256, dtype=bool)
+    eh_gap[list(gaps)] = True
+    so_gaps = eh_gap[codigos].all(axis=1) if codigos.size else np.ones(len(codigos), dtype=bool)
+
+    vistas = {}
+    representantes = []
+    identicas = {}
+    for i, linha in enumerate(codigos):
+        if so_gaps[i]:
+            representantes.append(i)
+            continue
+        representante = vistas.setdefault(linha.tobytes(), i)
+        if representante == i:
+            representantes.append(i)
+        else:
+            identicas.setdefault(representante, []).append(i)
+
+    return representantes, identicas
+
+
+def indice_condensado(i, j, n: int):
+    """Posição do par (i, j), i < j, na matriz condensada de n sequências"""
+    return i * n - i * (i + 1) // 2 + j - i - 1
+
+
+def _tabela_pontuacao(calculator, codigos: np.ndarray) -> tuple:
+    """Recodifica o alinhamento no alfabeto da matriz de substituição do modelo
+
+    As letras ignoradas (gap e '*') ganham um código com linha e coluna zeradas na tabela de pontuação,
+    então não somam nem na pontuação nem no máximo.
+
+    Returns:
+        tuple: (codigos, tabela, diagonal, validas) com codigos (uint8) indexando a tabela K x K (achatada)
+            e diagonal e validas (1 fora das letras ignoradas) por código
+
+    Raises:
+        ValueError: letra do alinhamento fora da matriz de substituição (como no DistanceCalculator)
+    """
+    matriz = calculator.scoring_matrix
+    alfabeto = [ord(letra) for letra in matriz.alphabet]
+    k = len(alfabeto)
+
+    tradutor = np.full(256, -1, dtype=np.int16)
+    tradutor[alfabeto] = np.arange(k)
+    tradutor[[ord(letra) for letra in calculator.skip_letters]] = k
+
+    tabela = np.zeros((k + 1, k + 1), dtype=np.float32)
+    tabela[:k, :k] = np.asarray(matriz, dtype=np.float32)
+
+    recodificados = tradutor[codigos]
+    if (recodificados < 0).any():
+        invalidas = sorted({chr(c) for c in codigos[recodificados < 0].tolist()})
+        raise ValueError(f"Letras fora da matriz de substituição do modelo: {invalidas}")
+
+    validas = np.ones(k + 1, dtype=np.float32)
+    validas[k] = 0
+
+    return recodificados.astype(np.uint8), tabela.ravel(), np.diagonal(tabela).copy(), validas
+
+
+def _bloco_identidade(codigos: np.ndarray, inicio: int, fim: int, passo: int, saida: np.ndarray) -> None:
+    n, comprimento = codigos.shape
+    for i in range(inicio, fim):
+        k = indice_condensado(i, i + 1, n)
+        for j in range(i + 1, n, passo):
+            b = codigos[j:j + passo]
+            iguais = np.count_nonzero(b == codigos[i], axis=1)
+            saida[k:k + len(b)] = 1 - iguais / comprimento if comprimento else 1.0
+            k += len(b)
+
+
+def _bloco_pontuacao(codigos: np.ndarray, tabela: np.ndarray, diagonal: np.ndarray, validas: np.ndarray,
+                     inicio: int, fim: int, passo: int, saida: np.ndarray) -> None:
+    n = codigos.shape[0]
+    k = len(diagonal)
+    for i in range(inicio, fim):
+        a = codigos[i]
+        deslocamento = a.astype(np.intp) * k
+        diagonal_a, validas_a = diagonal[a], validas[a]
+        j0 = indice_condensado(i, i + 1, n)
+        for j in range(i + 1, n, passo):
+            b = codigos[j:j + passo]
+            pontuacao = tabela[deslocamento + b].sum(axis=1, dtype=np.float64)
+            # Só as colunas sem gap ou '*' nas duas sequências (diagonal e validas são 0 para essas letras)
+            maximo = np.maximum(validas[b] @ diagonal_a, diagonal[b] @ validas_a).astype(np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                saida[j0:j0 + len(b)] = np.where(maximo == 0, 1.0, 1 - pontuacao / maximo)
+            j0 += len(b)
+
+
+def _blocos(n: int, qtd: int) -> list:
+    """Divide as linhas em até `qtd` intervalos com aproximadamente o mesmo número de pares
+    (a linha i é comparada com as n - i - 1 seguintes, então os blocos do começo têm menos linhas)
+    """
+    pares_por_bloco = max(n * (n - 1) // 2 // max(qtd, 1), 1)
+    blocos = []
+    inicio = 0
+    while inicio < n - 1:
+        fim = inicio
+        pares = 0
+        while fim < n - 1 and (fim == inicio or pares + (n - fim - 1) <= pares_por_bloco):
+            pares += n - fim - 1
+            fim += 1
+        blocos.append((inicio, fim))
+        inicio = fim
+
+    return blocos
+
+
+def matriz_condensada(alignment, distance_method: str = 'identity', memoria_max: int = MEMORIA_PADRAO,
+                      threads: int = None, colunas: np.ndarray = None, linhas: list = None) -> tuple:
+    """Distâncias entre todas as sequências do alinhamento em uma matriz condensada float32
+
+    Args:
+        alignment (MultipleSeqAlignment): Alinhamento
+        distance_method (str, optional): Modelo do DistanceCalculator ("identity", "blastn", "trans",
+            "blosum62", ...). Defaults to 'identity'.
+        memoria_max (int, optional): Bytes para os temporários dos blocos em andamento (a matriz de saída
+            não entra na conta). Defaults to MEMORIA_PADRAO.
+        threads (int, optional): Blocos calculados ao mesmo tempo. Defaults to os.cpu_count() a partir de
+            MINIMO_SEQUENCIAS_PARALELO sequências e 1 abaixo disso.
+        colunas (np.ndarray, optional): Máscara ou índices das colunas usadas (ver colunas_informativas).
+            Defaults to None (todas).
+        linhas (list, optional): Índices das sequências usadas (ver agrupar_identicas). Defaults to None (todas).
+
+    Returns:
+        tuple: (nomes, condensada) com condensada[indice_condensado(i, j, n)] = distância(i, j)
+    """
+    from Bio.Phylo.TreeConstruction import DistanceCalculator
+
+    calculator = DistanceCalculator(distance_method)  # valida o modelo como antes
+    if linhas is not None:
+        alignment = [alignment[i] for i in linhas]
+    nomes = [record.id for record in alignment]
+    codigos = codificar(alignment)
+    if colunas is not None:
+        codigos = codigos[:, colunas]
+    n, comprimento = codigos.shape
+
+    if threads is None:
+        threads = os.cpu_count() if n >= MINIMO_SEQUENCIAS_PARALELO else 1
+
+    saida = np.empty(n * (n - 1) // 2, dtype=np.float32)
+
+    if calculator.scoring_matrix is None:
+        bytes_por_celula = 1  # comparação (bool)
+        funcao = lambda inicio, fim, passo: _bloco_identidade(codigos, inicio, fim, passo, saida)
+    else:
+        bytes_por_celula = 20  # índices (intp), pontuações, diagonal e validas (float32)
+        codigos, tabela, diagonal, validas = _tabela_pontuacao(calculator, codigos)
+        funcao = lambda inicio, fim, passo: _bloco_pontuacao(codigos, tabela, diagonal, validas, inicio, fim, passo, saida)
+
+    # Cada linha é comparada com `passo` sequências por vez, de forma que os temporários das threads somem até memoria_max
+    passo = max(memoria_max // (max(threads, 1) * max(comprimento, 1) * bytes_por_celula), 1)
+    # Mais blocos que threads: os blocos não demoram exatamente o mesmo
+    blocos = _blocos(n, 4 * threads if threads > 1 else 1)
+
+    if threads > 1 and len(blocos) > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda bloco: funcao(*bloco, passo), blocos))
+    else:
+        for inicio, fim in blocos:
+            funcao(inicio, fim, passo)
+
+    return nomes, saida
+
+
+def matrizes_replicatas(codigos: np.ndarray, distance_method: str, pesos: np.ndarray,
+                        memoria_max: int = MEMORIA_PADRAO) -> np.ndarray:
+    """Matrizes condensadas de várias replicatas de bootstrap de uma vez
+
+    Uma replicata reamostra as colunas com reposição, o que equivale a pesar cada coluna pelo número de vezes
+    em que foi sorteada. Para cada par, as contribuições por coluna (identidade, ou pontuação e máximos) são
+    calculadas uma vez e multiplicadas pela matriz de pesos de todas as replicatas: um produto de matrizes
+    por fatia de pares no lugar de B matrizes de distâncias.
+
+    Args:
+        codigos (np.ndarray): Alinhamento codificado (ver codificar), já com o corte de colunas
+        distance_method (str): Modelo do DistanceCalculator
+        pesos (np.ndarray): B x L, vezes em que cada coluna foi sorteada em cada replicata
+        memoria_max (int, optional): Bytes para os temporários. Defaults to MEMORIA_PADRAO.
+
+    Returns:
+        np.ndarray: B x n(n - 1)/2 (float32), uma matriz condensada por replicata
+    """
+    from Bio.Phylo.TreeConstruction import DistanceCalculator
+
+    calculator = DistanceCalculator(distance_method)
+    n, comprimento = codigos.shape
+    qtd = len(pesos)
+    pesos_t = np.ascontiguousarray(pesos.T, dtype=np.float32)  # L x B
+    saida = np.empty((qtd, n * (n - 1) // 2), dtype=np.float32)
+
+    if calculator.scoring_matrix is not None:
+        codigos, tabela, diagonal, validas = _tabela_pontuacao(calculator, codigos)
+        k = len(diagonal)
+
+    # Temporários por par: contribuições por coluna (float32) e o resultado por replicata
+    passo = max(memoria_max // (4 * (3 * comprimento + 3 * qtd)), 1)
+
+    for i in range(n - 1):
+        a = codigos[i]
+        if calculator.scoring_matrix is not None:
+            deslocamento = a.astype(np.intp) * k
+            diagonal_a, validas_a = diagonal[a], validas[a]
+        j0 = indice_condensado(i, i + 1, n)
+        for j in range(i + 1, n, passo):
+            b = codigos[j:j + passo]
+            if calculator.scoring_matrix is None:
+                iguais = (b == a).astype(np.float32) @ pesos_t
+                distancias = 1 - iguais / comprimento if comprimento else np.ones_like(iguais)
+            else:
+                pontuacao = tabela[deslocamento + b] @ pesos_t
+                maximo = np.maximum((validas[b] * diagonal_a) @ pesos_t, (diagonal[b] * validas_a) @ pesos_t)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    distancias = np.where(maximo == 0, 1.0, 1 - pontuacao / maximo)
+            saida[:, j0:j0 + len(b)] = distancias.T
+            j0 += len(b)
+
+    return saida
+
+
+def distance_matrix(nomes: list, condensada: np.ndarray):
+    """DistanceMatrix do Biopython a partir de uma matriz condensada, para o DistanceTreeConstructor"""
+    from Bio.Phylo.TreeConstruction import DistanceMatrix
+
+    n = len(nomes)
+
+    # Triangular inferior (linha i: distâncias a 0..i-1 e a diagonal)
+    linhas = []
+    for i in range(n):
+        j = np.arange(i)
+        linhas.append(condensada[indice_condensado(j, i, n)].astype(np.float64).tolist() + [0.0])
+
+    return DistanceMatrix(nomes, linhas)
+
+
+def matriz_distancias(alignment, distance_method: str = 'identity', memoria_max: int = MEMORIA_PADRAO,
+                      threads: int = None, colunas: np.ndarray = None, linhas: list = None):
+    """DistanceMatrix do Biopython a partir de matriz_condensada, para o DistanceTreeConstructor"""
+    return distance_matrix(*matriz_condensada(alignment, distance_method, memoria_max, threads, colunas, linhas))
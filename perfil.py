@@ -0,0 +1,169 @@
+"""Perfilamento opcional das etapas (python main.py --profile)
+
+Cada etapa gera, na pasta `perfil` da execução:
+- <etapa>.prof: estatísticas do cProfile (pstats), para snakeviz, flameprof ou gprof2dot;
+- <etapa>.txt: funções com maior tempo acumulado;
+- <etapa>_memoria.txt: locais com mais memória alocada durante a etapa (tracemalloc) e o pico.
+As etapas medidas são ligadas à Execucao da Tarefa pela tabela Perfil.
+
+Desativado, o Perfilador não faz nada além de chamar as funções.
+"""
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from functools import partial
+
+
+QTD_FUNCOES = 40
+QTD_ALOCACOES = 25
+QUADROS_TRACEMALLOC = 10
+
+
+def _executar_perfilado(pasta_partes: str, funcao, *args, **kwargs):
+    """Executa uma chamada sob o cProfile e grava o resultado em pasta_partes (uma parte por chamada).
+    Usado pelas etapas que rodam em threads ou em outros processos (ver Perfilador.envolver).
+    """
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        return funcao(*args, **kwargs)
+    finally:
+        perfil.disable()
+        os.makedirs(pasta_partes, exist_ok=True)
+        perfil.dump_stats(os.path.join(pasta_partes, f'{os.getpid()}_{threading.get_ident()}_{time.perf_counter_ns()}.prof'))
+
+
+class Perfilador:
+    """Perfilamento por etapa com cProfile e tracemalloc.
+
+    Args:
+        ativo (bool, optional): Sem isso as etapas só são executadas. Defaults to False.
+        memoria (bool, optional): Também registra as alocações (tracemalloc) das etapas do processo principal. Defaults to True.
+    """
+
+    def __init__(self, ativo: bool = False, memoria: bool = True):
+        self.ativo = ativo
+        self.memoria = memoria
+        self.etapas = {}  # nome -> {'perfil', 'segundos', 'pico_memoria', 'alocacoes'}
+        self._partes = None
+
+    @contextlib.contextmanager
+    def etapa(self, nome: str):
+        """Perfila o bloco (no processo e na thread atuais)"""
+        if not self.ativo:
+            yield
+            return
+
+        iniciou_tracemalloc = False
+        antes = None
+        if self.memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(QUADROS_TRACEMALLOC)
+                iniciou_tracemalloc = True
+            tracemalloc.reset_peak()
+            antes = tracemalloc.take_snapshot()
+
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        perfil.enable()
+        try:
+            yield
+        finally:
+            perfil.disable()
+            dados = {'perfil': perfil, 'segundos': time.perf_counter() - inicio, 'pico_memoria': None, 'alocacoes': None}
+
+            if self.memoria:
+                depois = tracemalloc.take_snapshot()
+                dados['pico_memoria'] = tracemalloc.get_traced_memory()[1]
+                dados['alocacoes'] = depois.compare_to(antes, 'lineno')[:QTD_ALOCACOES]
+                if iniciou_tracemalloc:
+                    tracemalloc.stop()
+
+            self.etapas[nome] = dados
+
+    def envolver(self, nome: str, funcao):
+        """Versão perfilada de uma função chamada item a item (etapas do PipelineArquivos). Cada chamada
+        grava uma parte; as partes de uma etapa são somadas em salvar(). Serializável se `funcao` for.
+        """
+        if not self.ativo:
+            return funcao
+
+        if self._partes is None:
+            self._partes = tempfile.mkdtemp(prefix='nmfstp_perfil_')
+
+        return partial(_executar_perfilado, os.path.join(self._partes, nome), funcao)
+
+    def salvar(self, pasta: str, id_execucao: int = None) -> list:
+        """Grava os artefatos das etapas em `pasta` e, com id_execucao, as linhas da tabela Perfil
+
+        Returns:
+            list: caminhos dos arquivos .prof
+        """
+        if not self.ativo:
+            return []
+
+        os.makedirs(pasta, exist_ok=True)
+        registros = []
+
+        for nome, dados in self.etapas.items():
+            path_prof = os.path.join(pasta, f'{nome}.prof')
+            dados['perfil'].dump_stats(path_prof)
+            self._resumo(pstats.Stats(path_prof), os.path.join(pasta, f'{nome}.txt'))
+
+            if dados['alocacoes'] is not None:
+                with open(os.path.join(pasta, f'{nome}_memoria.txt'), 'w') as f:
+                    f.write(f"Pico: {dados['pico_memoria'] / 2 ** 20:.1f} MiB\n\n")
+                    for estatistica in dados['alocacoes']:
+                        f.write(f"{estatistica}\n")
+
+            registros.append((nome, path_prof, dados['segundos'], dados['pico_memoria']))
+
+        # Etapas perfiladas por chamada (threads e processos): soma das partes
+        if self._partes is not None:
+            for nome in sorted(os.listdir(self._partes)):
+                pasta_partes = os.path.join(self._partes, nome)
+                partes = [os.path.join(pasta_partes, parte) for parte in os.listdir(pasta_partes)]
+                if not partes:
+                    continue
+
+                stats = pstats.Stats(*partes)
+                path_prof = os.path.join(pasta, f'{nome}.prof')
+                stats.dump_stats(path_prof)
+                self._resumo(pstats.Stats(path_prof), os.path.join(pasta, f'{nome}.txt'), f'{len(partes)} chamadas')
+                # Tempo somado das chamadas (CPU de todos os workers), não o tempo de parede da etapa
+                registros.append((nome, path_prof, stats.total_tt, None))
+
+            shutil.rmtree(self._partes, ignore_errors=True)
+            self._partes = None
+
+        if id_execucao is not None:
+            from tabelas import Session, Perfil
+
+            session = Session()
+            session.add_all([
+                Perfil(idExecucao=id_execucao, etapa=nome, arquivo=path_prof, segundos=segundos, picoMemoria=pico)
+                for nome, path_prof, segundos, pico in registros
+            ])
+            session.commit()
+            session.close()
+
+        self.etapas = {}
+
+        return [registro[1] for registro in registros]
+
+    @staticmethod
+    def _resumo(stats: pstats.Stats, path: str, cabecalho: str = '') -> None:
+        saida = io.StringIO()
+        stats.stream = saida
+        stats.sort_stats('cumulative').print_stats(QTD_FUNCOES)
+        with open(path, 'w') as f:
+            if cabecalho:
+                f.write(cabecalho + '\n')
+            f.write(saida.getvalue())
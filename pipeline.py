@@ -0,0 +1,125 @@
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from registro import configuracao_processo, configurar_processo, logger
+
+
+class Etapa:
+    """Etapa de um PipelineArquivos
+
+    Args:
+        nome (str): Nome da etapa (usado nos logs e nos erros)
+        funcao (callable): Recebe o resultado da etapa anterior (ou a entrada) e devolve o valor da próxima.
+            Devolver None descarta o item (ex.: alinhamento com erro).
+        workers (int, optional): Quantidade de itens processados em paralelo nessa etapa. Defaults to 1.
+        processos (bool, optional): Usa um pool de processos em vez de threads (para etapas que usam CPU em Python,
+            como a construção das árvores). A função precisa ser serializável (pickle). Defaults to False.
+    """
+
+    def __init__(self, nome: str, funcao, workers: int = 1, processos: bool = False):
+        self.nome = nome
+        self.funcao = funcao
+        self.workers = workers
+        self.processos = processos
+
+
+class PipelineArquivos:
+    """Executor em fluxo de dados: cada entrada passa pelas etapas assim que a etapa anterior termina,
+    em vez de cada etapa esperar todas as entradas da anterior (barreira).
+
+    Cada etapa tem seus próprios workers e as etapas são ligadas por filas limitadas (`tamanho_fila`),
+    de forma que uma etapa lenta segura as anteriores em vez de acumular resultados em memória.
+    A ordem de saída é a ordem de término, não a de entrada.
+    """
+
+    _FIM = object()
+
+    def __init__(self, etapas: list, tamanho_fila: int = 4):
+        self.etapas = etapas
+        self.tamanho_fila = tamanho_fila
+        self.erros = []  # (entrada, nome da etapa, exceção)
+
+    def executar(self, entradas):
+        """Processa as entradas
+
+        Args:
+            entradas (iterable): Entradas da primeira etapa (ex.: caminhos dos arquivos fasta)
+
+        Yields:
+            tuple: (posição da entrada, entrada, resultado da última etapa)
+        """
+        filas = [queue.Queue(maxsize=self.tamanho_fila) for _ in range(len(self.etapas) + 1)]
+        # 'spawn': um fork feito enquanto outra etapa dispara subprocessos herdaria os pipes internos do
+        # subprocess (o processo pai ficaria esperando o filho do pool fechar o pipe)
+        contexto = multiprocessing.get_context('spawn')
+        # Os processos enviam o log para a fila do processo principal (ver registro.py)
+        config_log = configuracao_processo()
+        pools = [
+            ProcessPoolExecutor(max_workers=etapa.workers, mp_context=contexto,
+                                initializer=configurar_processo if config_log else None, initargs=config_log or ())
+            if etapa.processos else None
+            for etapa in self.etapas
+        ]
+        threads = []
+
+        for i, etapa in enumerate(self.etapas):
+            restantes = [etapa.workers]
+            trava = threading.Lock()
+            for _ in range(etapa.workers):
+                t = threading.Thread(
+                    target=self._worker,
+                    args=(etapa, pools[i], filas[i], filas[i + 1], restantes, trava),
+                    daemon=True
+                )
+                t.start()
+                threads.append(t)
+
+        alimentador = threading.Thread(target=self._alimentar, args=(entradas, filas[0]), daemon=True)
+        alimentador.start()
+
+        terminou = False
+        try:
+            while (item := filas[-1].get()) is not self._FIM:
+                yield item
+            terminou = True
+        finally:
+            # Se o consumidor parou antes do fim, esvazia a última fila para as etapas não ficarem bloqueadas
+            while not terminou:
+                terminou = filas[-1].get() is self._FIM
+            alimentador.join()
+            for t in threads:
+                t.join()
+            for pool in pools:
+                if pool is not None:
+                    pool.shutdown()
+
+    def _alimentar(self, entradas, fila: queue.Queue) -> None:
+        for posicao, entrada in enumerate(entradas):
+            fila.put((posicao, entrada, entrada))
+        fila.put(self._FIM)
+
+    def _worker(self, etapa: Etapa, pool, entrada: queue.Queue, saida: queue.Queue, restantes: list, trava) -> None:
+        while (item := entrada.get()) is not self._FIM:
+            posicao, origem, valor = item
+            try:
+                if pool is not None:
+                    resultado = pool.submit(etapa.funcao, valor).result()
+                else:
+                    resultado = etapa.funcao(valor)
+            except Exception as e:
+                logger(etapa.nome).error(f"{origem}: {e}", exc_info=True)
+                self.erros.append((origem, etapa.nome, e))
+                continue
+
+            if resultado is not None:
+                saida.put((posicao, origem, resultado))
+
+        # Repassa o fim para os outros workers da etapa; o último a terminar avisa a próxima etapa
+        entrada.put(self._FIM)
+        with trava:
+            restantes[0] -= 1
+            ultimo = restantes[0] == 0
+        if ultimo:
+            saida.put(self._FIM)
@@ -0,0 +1,152 @@
+"""Logging em fila e relatório de progresso
+
+Os processos e threads só colocam os registros em uma fila (QueueHandler); uma thread do processo principal
+(QueueListener) grava no app.log e no terminal. Assim o loop que gera as mensagens não espera pelo disco nem
+pelo terminal, e os processos dos pools (pipeline.py) escrevem no mesmo log sem disputar o arquivo.
+
+Cada etapa usa o logger `nmfstp.<etapa>` (alinhamento, arvore, subarvores, comparacao, driver, fila, ...),
+com nível configurável por etapa:
+    NMFSTP_LOG_NIVEIS="arvore=DEBUG,alinhamento=WARNING" python main.py
+"""
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import threading
+import time
+
+
+FORMATO = "%(asctime)s [%(levelname)s] %(processName)s %(name)s: %(message)s"
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+
+_fila = None
+_niveis = {}
+
+
+def logger(etapa: str) -> logging.Logger:
+    return logging.getLogger(f'nmfstp.{etapa}')
+
+
+def niveis_do_ambiente(variavel: str = 'NMFSTP_LOG_NIVEIS') -> dict:
+    """Lê níveis por etapa no formato "etapa=NIVEL,etapa=NIVEL" """
+    niveis = {}
+    for item in os.environ.get(variavel, '').split(','):
+        if '=' in item:
+            etapa, nivel = item.split('=', 1)
+            niveis[etapa.strip()] = nivel.strip().upper()
+
+    return niveis
+
+
+def _aplicar_niveis(nivel, niveis: dict) -> None:
+    logging.getLogger('nmfstp').setLevel(nivel)
+    for etapa, nivel_etapa in niveis.items():
+        logger(etapa).setLevel(nivel_etapa)
+
+
+def configurar_logging(path: str = 'app.log', nivel=logging.INFO, niveis: dict = None, console: bool = True,
+                       nivel_console=logging.INFO) -> logging.handlers.QueueListener:
+    """Configura o logging do processo principal
+
+    Args:
+        path (str, optional): Arquivo de log. Defaults to 'app.log'.
+        nivel (optional): Nível padrão das etapas. Defaults to INFO.
+        niveis (dict, optional): Nível por etapa ({'arvore': 'DEBUG'}). Defaults to NMFSTP_LOG_NIVEIS.
+        console (bool, optional): Também mostra as mensagens no terminal. Defaults to True.
+        nivel_console (optional): Nível mínimo das mensagens no terminal. Defaults to INFO.
+
+    Returns:
+        QueueListener: já iniciado; chame .stop() no fim para gravar o que restou na fila
+    """
+    global _fila, _niveis
+
+    _niveis = niveis if niveis is not None else niveis_do_ambiente()
+    # Fila de multiprocessing: também é usada pelos processos dos pools (ver configurar_processo)
+    _fila = multiprocessing.get_context('spawn').Queue(-1)
+
+    formatador = logging.Formatter(FORMATO, FORMATO_DATA)
+    handlers = []
+
+    arquivo = logging.FileHandler(path)
+    arquivo.setFormatter(formatador)
+    handlers.append(arquivo)
+
+    if console:
+        terminal = logging.StreamHandler()
+        terminal.setFormatter(logging.Formatter("%(message)s"))
+        terminal.setLevel(nivel_console)
+        handlers.append(terminal)
+
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [logging.handlers.QueueHandler(_fila)]
+    raiz.setLevel(logging.WARNING)  # bibliotecas
+    _aplicar_niveis(nivel, _niveis)
+
+    listener = logging.handlers.QueueListener(_fila, *handlers, respect_handler_level=True)
+    listener.start()
+
+    return listener
+
+
+def configuracao_processo() -> tuple:
+    """Argumentos de configurar_processo para os processos filhos, ou None se o logging em fila não foi configurado"""
+    if _fila is None:
+        return None
+
+    return _fila, logging.getLogger('nmfstp').level, _niveis
+
+
+def configurar_processo(fila, nivel, niveis: dict) -> None:
+    """Initializer dos processos filhos: envia os registros para a fila do processo principal"""
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [logging.handlers.QueueHandler(fila)]
+    raiz.setLevel(logging.WARNING)
+    _aplicar_niveis(nivel, niveis)
+
+
+class Progresso:
+    """Relatório de progresso com limite de frequência, no lugar de um print por item.
+
+    Registra no máximo uma mensagem a cada `intervalo` segundos, com itens por segundo e, se o total
+    for conhecido, o tempo restante estimado. Pode ser usado por várias threads.
+
+    Args:
+        etapa (str): Nome da etapa (logger nmfstp.<etapa>)
+        total (int, optional): Quantidade de itens esperada. Defaults to None.
+        intervalo (float, optional): Segundos entre mensagens. Defaults to 5.
+    """
+
+    def __init__(self, etapa: str, total: int = None, intervalo: float = 5.0):
+        self.etapa = etapa
+        self.log = logger(etapa)
+        self.total = total
+        self.intervalo = intervalo
+        self.feitos = 0
+        self.inicio = time.perf_counter()
+        self._ultimo = self.inicio
+        self._trava = threading.Lock()
+
+    def _mensagem(self, agora: float) -> str:
+        decorrido = agora - self.inicio
+        taxa = self.feitos / decorrido if decorrido > 0 else 0.0
+        mensagem = f"{self.etapa}: {self.feitos}"
+        if self.total:
+            mensagem += f"/{self.total}"
+            if taxa > 0 and self.feitos < self.total:
+                mensagem += f" (ETA {(self.total - self.feitos) / taxa:.0f}s)"
+        return mensagem + f", {taxa:.1f} itens/s"
+
+    def avancar(self, n: int = 1) -> None:
+        with self._trava:
+            self.feitos += n
+            agora = time.perf_counter()
+            if agora - self._ultimo < self.intervalo:
+                return
+            self._ultimo = agora
+            mensagem = self._mensagem(agora)
+
+        self.log.info(mensagem)
+
+    def finalizar(self) -> None:
+        agora = time.perf_counter()
+        self.log.info(f"{self._mensagem(agora)}, {agora - self.inicio:.1f}s no total")
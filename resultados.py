@@ -0,0 +1,444 @@
+import heapq
+import os
+
+import numpy as np
+
+
+class ResultadoMAF:
+    """Substituto colunar do dict_maf_database.
+
+    Cada subárvore recebe um id inteiro (posição em `nomes`) e os pares são guardados em três arrays
+    paralelos (grau, origem, destino), em vez de um dicionário de dicionários de listas de caminhos.
+    """
+
+    def __init__(self, nomes: list):
+        self.nomes = list(nomes)
+        self.ids = {nome: i for i, nome in enumerate(self.nomes)}
+        self.max_maf = 0
+
+        # Blocos de arrays adicionados; concatenados sob demanda em _colunas
+        self._blocos = []
+        self._arrays = None
+
+    def registrar(self, nome) -> int:
+        """Devolve o id de `nome`, criando um novo id se ainda não existir"""
+        if nome not in self.ids:
+            self.ids[nome] = len(self.nomes)
+            self.nomes.append(nome)
+
+        return self.ids[nome]
+
+    def adicionar(self, grau, origem, destino) -> None:
+        """Adiciona um ou vários pares (escalares ou arrays de mesmo tamanho)"""
+        origem = np.ravel(origem).astype(np.int32)
+        destino = np.ravel(destino).astype(np.int32)
+        grau = np.broadcast_to(np.asarray(grau, dtype=np.int32), origem.shape).copy()
+
+        self._blocos.append((grau, origem, destino))
+        self._arrays = None
+
+    def _colunas(self) -> tuple:
+        if self._arrays is None:
+            if self._blocos:
+                self._arrays = tuple(np.concatenate(coluna) for coluna in zip(*self._blocos))
+            else:
+                self._arrays = tuple(np.empty(0, np.int32) for _ in range(3))
+            self._blocos = [self._arrays]
+
+        return self._arrays
+
+    @property
+    def grau(self) -> np.ndarray:
+        return self._colunas()[0]
+
+    @property
+    def origem(self) -> np.ndarray:
+        return self._colunas()[1]
+
+    @property
+    def destino(self) -> np.ndarray:
+        return self._colunas()[2]
+
+    def __len__(self):
+        return len(self.grau)
+
+    def graus(self) -> np.ndarray:
+        """Graus distintos presentes no resultado"""
+        return np.unique(self.grau)
+
+    def pares(self, grau: int) -> np.ndarray:
+        """Todos os pares (origem, destino) com o grau informado, como array Nx2 de ids"""
+        mascara = self.grau == grau
+        return np.column_stack((self.origem[mascara], self.destino[mascara]))
+
+    def parceiros(self, subarvore) -> tuple:
+        """Todas as subárvores pareadas com `subarvore` (id ou nome)
+
+        Returns:
+            tuple: (ids dos parceiros, graus)
+        """
+        if not isinstance(subarvore, (int, np.integer)):
+            subarvore = self.ids[subarvore]
+
+        mascara = self.origem == subarvore
+        return self.destino[mascara], self.grau[mascara]
+
+    def to_dict(self) -> dict:
+        """Converte para o formato antigo {grau: {nome: [nomes]}}"""
+        dict_maf_database = {}
+        for g, o, d in zip(self.grau.tolist(), self.origem.tolist(), self.destino.tolist()):
+            dict_maf_database.setdefault(g, {}).setdefault(self.nomes[o], []).append(self.nomes[d])
+
+        return dict_maf_database
+
+    def to_parquet(self, path: str) -> None:
+        """Exporta os pares para `path` e os nomes das subárvores para `<path>_subarvores.parquet`.
+        Requer o pyarrow (opcional).
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("A exportação em parquet requer o pacote pyarrow") from e
+
+        pq.write_table(pa.table({'grau': self.grau, 'origem': self.origem, 'destino': self.destino}), path)
+
+        base, ext = os.path.splitext(path)
+        pq.write_table(
+            pa.table({'id': np.arange(len(self.nomes), dtype=np.int32), 'nome': self.nomes}),
+            f'{base}_subarvores{ext or ".parquet"}'
+        )
+
+    def to_sql(self, id_tarefa: int, indice=None, chunk_size: int = 50_000) -> None:
+        """Grava as subárvores e os pares nas tabelas Subarvore e ParMAF do banco
+
+        Com o resultado indexado por assinatura (nomes são hashes), informe o `indice` para gravar também as
+        folhas de cada assinatura (FolhaSubarvore) e as subárvores que a compõem, com a árvore de origem
+        (MembroSubarvore): os arquivos das subárvores não são mantidos depois da execução.
+
+        Args:
+            id_tarefa (int): Tarefa
+            indice (IndiceAssinaturas, optional): Índice usado na comparação. Defaults to None.
+            chunk_size (int, optional): Linhas por insert. Defaults to 50_000.
+        """
+        from sqlalchemy import insert
+        from tabelas import Session, Subarvore, ParMAF, MembroSubarvore, FolhaSubarvore
+
+        session = Session()
+        session.execute(
+            insert(Subarvore),
+            [{'idLocal': i, 'nome': nome, 'idTarefa': id_tarefa} for i, nome in enumerate(self.nomes)]
+        )
+
+        grau, origem, destino = self._colunas()
+        for inicio in range(0, len(grau), chunk_size):
+            fim = inicio + chunk_size
+            session.execute(
+                insert(ParMAF),
+                [
+                    {'grau': g, 'origem': o, 'destino': d, 'idTarefa': id_tarefa}
+                    for g, o, d in zip(grau[inicio:fim].tolist(), origem[inicio:fim].tolist(), destino[inicio:fim].tolist())
+                ]
+            )
+
+        if indice is not None:
+            from arquivo_arvores import nome_arvore
+
+            nomes_folhas = list(indice.ids_folhas)
+            membros, folhas = [], []
+            for i, nome in enumerate(self.nomes):
+                if nome not in indice.membros:
+                    continue
+                membros += [{'idLocal': i, 'linha': linha, 'subarvore': nome_arvore(caminho), 'idTarefa': id_tarefa}
+                            for linha, caminho in indice.membros[nome]]
+                folhas += [{'idLocal': i, 'folha': nomes_folhas[folha], 'idTarefa': id_tarefa}
+                           for folha in sorted(indice.folhas[nome])]
+            for tabela, linhas in ((MembroSubarvore, membros), (FolhaSubarvore, folhas)):
+                for inicio in range(0, len(linhas), chunk_size):
+                    session.execute(insert(tabela), linhas[inicio:inicio + chunk_size])
+
+        session.commit()
+        session.close()
+
+
+def matriz_incidencia(indice, assinaturas: list) -> np.ndarray:
+    """Matriz booleana (assinaturas x folhas) com as folhas de cada assinatura"""
+    m = np.zeros((len(assinaturas), len(indice.ids_folhas)), dtype=np.float32)
+    for i, assinatura in enumerate(assinaturas):
+        m[i, list(indice.folhas[assinatura])] = 1
+
+    return m
+
+
+def compare_subtrees_colunar(indice, expandir: bool = False, bloco: int = 1024) -> ResultadoMAF:
+    """Compara as subárvores de um IndiceAssinaturas e devolve um ResultadoMAF.
+
+    Os graus de todos os pares de assinaturas são calculados por blocos de linhas com um produto
+    de matrizes de incidência (folhas em comum), limitando a memória a bloco x assinaturas.
+
+    Args:
+        indice (IndiceAssinaturas): Índice de subárvores
+        expandir (bool, optional): Se True os ids são os caminhos das subárvores (como em compare_subtrees);
+            se False são as assinaturas únicas. Defaults to False.
+        bloco (int, optional): Quantidade de assinaturas por bloco. Defaults to 1024.
+
+    Returns:
+        ResultadoMAF: pares com grau >= 1
+    """
+    assinaturas = list(indice.folhas)
+    resultado, membros = _novo_resultado(indice, assinaturas, expandir)
+
+    if not assinaturas:
+        return resultado
+
+    m = matriz_incidencia(indice, assinaturas)
+
+    # Linha única de cada assinatura (-1 se aparece em mais de uma árvore)
+    linha_unica = np.array(
+        [next(iter(indice.linhas[a])) if len(indice.linhas[a]) == 1 else -1 for a in assinaturas],
+        dtype=np.int64
+    )
+
+    for inicio in range(0, len(assinaturas), bloco):
+        fim = min(inicio + bloco, len(assinaturas))
+        graus = (m[inicio:fim] @ m.T).astype(np.int32)
+
+        # Pares em que todas as subárvores vêm da mesma árvore não são comparados (i != k em compare_subtrees)
+        mesma_linha = (linha_unica[inicio:fim, None] == linha_unica[None, :]) & (linha_unica[inicio:fim, None] != -1)
+        graus[mesma_linha] = 0
+        resultado.max_maf = max(resultado.max_maf, int(graus.max()))
+
+        a_idx, b_idx = np.nonzero(graus >= 1)
+        a_idx += inicio
+
+        if not expandir:
+            resultado.adicionar(graus[a_idx - inicio, b_idx], a_idx, b_idx)
+            continue
+
+        for a, b in zip(a_idx.tolist(), b_idx.tolist()):
+            _expandir_par(resultado, membros, a, b, graus[a - inicio, b])
+
+    return resultado
+
+
+class ComparadorIncremental:
+    """Compara as subárvores à medida que as árvores chegam (ver gerar_subarvores em main.py).
+
+    Produz o mesmo resultado de compare_subtrees_colunar(indice) sem precisar da matriz de subárvores:
+    a cada árvore só são calculados os pares que passaram a existir, ou seja
+    - assinaturas novas contra todas as assinaturas já vistas (via índice invertido folha -> assinaturas);
+    - assinaturas que só apareciam em uma árvore e agora aparecem em outra, contra as que só apareciam
+      naquela mesma árvore (pares antes descartados por serem da mesma árvore).
+    A memória fica proporcional ao índice e ao resultado.
+    """
+
+    def __init__(self, indice):
+        self.indice = indice
+        self.resultado = ResultadoMAF([])
+        self.postings = {}          # id da folha -> lista de ids de assinaturas que contêm a folha
+        self.unicas_por_linha = {}  # linha -> ids das assinaturas que só aparecem nessa linha
+
+    def _graus(self, folhas: frozenset) -> np.ndarray:
+        """Folhas em comum entre `folhas` e cada assinatura já registrada"""
+        listas = [self.postings[folha] for folha in folhas if folha in self.postings]
+        if not listas:
+            return np.zeros(len(self.resultado.nomes), dtype=np.int32)
+
+        return np.bincount(np.concatenate(listas), minlength=len(self.resultado.nomes)).astype(np.int32)
+
+    def _adicionar_pares(self, a: int, b, graus) -> None:
+        """Adiciona os pares (a, b) e (b, a) com grau >= 1 (a == b é adicionado uma única vez)"""
+        b = np.asarray(b, dtype=np.int32)
+        graus = np.asarray(graus, dtype=np.int32)
+        mascara = graus >= 1
+        b, graus = b[mascara], graus[mascara]
+
+        if len(graus):
+            self.resultado.max_maf = max(self.resultado.max_maf, int(graus.max()))
+
+        self.resultado.adicionar(graus, np.full(len(b), a), b)
+        outros = b != a
+        self.resultado.adicionar(graus[outros], b[outros], np.full(int(outros.sum()), a))
+
+    def consumir(self, registros: list) -> None:
+        """Processa os registros (RegistroSubarvore) de uma árvore"""
+        if not registros:
+            return
+
+        linha = registros[0].linha
+        indice = self.indice
+
+        novas = []
+        promovidas = {}  # linha anterior -> ids das assinaturas que deixam de ser exclusivas dela
+        for registro in registros:
+            assinatura = indice.assinatura(registro.folhas, registro.topologia)
+            existia = assinatura in indice.linhas
+            linhas_antes = set(indice.linhas[assinatura]) if existia else set()
+
+            indice.adicionar(registro.linha, registro.caminho, registro.folhas, registro.topologia)
+
+            if not existia:
+                if assinatura not in novas:
+                    novas.append(assinatura)
+            elif len(linhas_antes) == 1 and linha not in linhas_antes:
+                linha_antes = next(iter(linhas_antes))
+                promovidas.setdefault(linha_antes, set()).add(self.resultado.ids[assinatura])
+
+        # Assinaturas novas contra todas as anteriores (entre si são da mesma árvore)
+        n_anteriores = len(self.resultado.nomes)
+        ids_novas = []
+        for assinatura in novas:
+            graus = self._graus(indice.folhas[assinatura])[:n_anteriores]
+            a = self.resultado.registrar(assinatura)
+            ids_novas.append(a)
+            self._adicionar_pares(a, np.arange(n_anteriores), graus)
+
+        # Pares que deixam de ser da mesma árvore
+        for linha_antes, ids_promovidas in promovidas.items():
+            unicas = self.unicas_por_linha[linha_antes]
+            for a in ids_promovidas:
+                folhas_a = indice.folhas[self.resultado.nomes[a]]
+                for b in unicas:
+                    if b in ids_promovidas and b < a:
+                        continue  # par já adicionado a partir de b
+                    grau = len(folhas_a & indice.folhas[self.resultado.nomes[b]])
+                    self._adicionar_pares(a, [b], [grau])
+
+            unicas -= ids_promovidas
+
+        for a in ids_novas:
+            for folha in indice.folhas[self.resultado.nomes[a]]:
+                self.postings.setdefault(folha, []).append(a)
+
+        self.unicas_por_linha.setdefault(linha, set()).update(ids_novas)
+
+
+class ComparadorTop:
+    """Modo de consulta do ComparadorIncremental (mesma interface): as subárvores que chegam só são indexadas
+    e a comparação é feita no fim por compare_subtrees_top, guardando somente os k pares de maior grau e/ou os
+    pares com grau >= min_degree, sem montar o resultado completo.
+
+    Args:
+        indice (IndiceAssinaturas): Índice de subárvores
+        k (int, optional): Ver compare_subtrees_top. Defaults to None.
+        min_degree (int, optional): Ver compare_subtrees_top. Defaults to 1.
+    """
+
+    def __init__(self, indice, k: int = None, min_degree: int = 1):
+        self.indice = indice
+        self.k = k
+        self.min_degree = min_degree
+        self._resultado = None
+
+    def consumir(self, registros: list) -> None:
+        """Indexa os registros (RegistroSubarvore) de uma árvore"""
+        self.indice.adicionar_registros(registros)
+        self._resultado = None
+
+    @property
+    def resultado(self) -> ResultadoMAF:
+        if self._resultado is None:
+            self._resultado = compare_subtrees_top(self.indice, self.k, self.min_degree)
+
+        return self._resultado
+
+
+def compare_subtrees_top(indice, k: int = None, min_degree: int = 1, expandir: bool = False) -> ResultadoMAF:
+    """Modo de consulta de compare_subtrees: guarda somente os k pares de maior grau e/ou os pares com grau >= min_degree.
+
+    O grau de um par nunca passa de min(|A|, |B|) (tamanho dos conjuntos de folhas). As assinaturas são
+    percorridas da maior para a menor, e um par só é calculado se esse limite superior alcança o
+    menor grau que ainda entraria no resultado; assim que o limite fica abaixo, o restante é podado.
+    No modo top-k o resultado é mantido em um heap de tamanho k em vez do dicionário completo.
+
+    Args:
+        indice (IndiceAssinaturas): Índice de subárvores
+        k (int, optional): Quantidade de pares de assinaturas a manter. None mantém todos acima de min_degree. Defaults to None.
+        min_degree (int, optional): Grau mínimo dos pares. Defaults to 1.
+        expandir (bool, optional): Distribui os pares selecionados para os caminhos das subárvores
+            (ver compare_subtrees_colunar). O k se refere aos pares de assinaturas. Defaults to False.
+
+    Returns:
+        ResultadoMAF: pares selecionados, do maior para o menor grau
+    """
+    min_degree = max(min_degree, 1)
+    assinaturas = sorted(indice.folhas, key=lambda a: len(indice.folhas[a]), reverse=True)
+    resultado, membros = _novo_resultado(indice, assinaturas, expandir)
+
+    if not assinaturas or k == 0:
+        return resultado
+
+    m = matriz_incidencia(indice, assinaturas)
+    tamanhos = m.sum(axis=1).astype(np.int32)
+    linha_unica = np.array(
+        [next(iter(indice.linhas[a])) if len(indice.linhas[a]) == 1 else -1 for a in assinaturas],
+        dtype=np.int64
+    )
+
+    heap = []       # (grau, ordem, a, b) - min-heap com os k melhores pares
+    selecionados = []
+    ordem = 0
+
+    for a in range(len(assinaturas)):
+        limiar = min_degree
+        if k is not None and len(heap) == k:
+            limiar = max(limiar, heap[0][0] + 1)
+
+        if tamanhos[a] < limiar:
+            break  # as próximas assinaturas são menores ou iguais
+
+        # Candidatos: as assinaturas ordenadas são decrescentes, basta cortar no tamanho mínimo
+        n = int(np.searchsorted(-tamanhos, -limiar, side='right'))
+        graus = (m[a] @ m[:n].T).astype(np.int32)
+        if linha_unica[a] != -1:
+            graus[linha_unica[:n] == linha_unica[a]] = 0
+
+        for b in np.nonzero(graus >= limiar)[0].tolist():
+            grau = int(graus[b])
+
+            if k is None:
+                selecionados.append((grau, a, b))
+                continue
+
+            if len(heap) < k:
+                heapq.heappush(heap, (grau, ordem, a, b))
+            elif grau > heap[0][0]:
+                heapq.heapreplace(heap, (grau, ordem, a, b))
+            ordem += 1
+
+    if k is not None:
+        selecionados = [(grau, a, b) for grau, _, a, b in heap]
+
+    selecionados.sort(key=lambda par: par[0], reverse=True)
+    for grau, a, b in selecionados:
+        resultado.max_maf = max(resultado.max_maf, grau)
+
+        if expandir:
+            _expandir_par(resultado, membros, a, b, grau)
+        else:
+            resultado.adicionar(grau, a, b)
+
+    return resultado
+
+
+def _novo_resultado(indice, assinaturas: list, expandir: bool) -> tuple:
+    """Cria o ResultadoMAF e, quando expandir, os ids e linhas dos membros de cada assinatura"""
+    if not expandir:
+        return ResultadoMAF(assinaturas), None
+
+    resultado = ResultadoMAF([path for a in assinaturas for _, path in indice.membros[a]])
+    membros = [
+        (np.array([resultado.ids[path] for _, path in indice.membros[a]], dtype=np.int32),
+         np.array([linha for linha, _ in indice.membros[a]], dtype=np.int32))
+        for a in assinaturas
+    ]
+
+    return resultado, membros
+
+
+def _expandir_par(resultado: ResultadoMAF, membros: list, a: int, b: int, grau: int) -> None:
+    """Distribui o resultado do par de assinaturas para as subárvores de cada grupo"""
+    ids_1, linhas_1 = membros[a]
+    ids_2, linhas_2 = membros[b]
+    i, j = np.nonzero(linhas_1[:, None] != linhas_2[None, :])
+    resultado.adicionar(grau, ids_1[i], ids_2[j])
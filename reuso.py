@@ -0,0 +1,245 @@
+"""Reaproveitamento de alinhamentos idênticos entre Tarefas
+
+Combinações diferentes de parâmetros do alinhador (ex.: flags como quiet ou v) produzem muitas vezes o mesmo
+alinhamento para a mesma entrada. Logo depois do alinhamento, o .aln normalizado (ver normalizar_alinhamento) e
+os parâmetros da árvore viram um hash, gravado na tabela AlinhamentoTarefa. Com ele:
+- a árvore de um alinhamento que uma Tarefa concluída já processou é copiada da pasta promovida dessa Tarefa,
+  em vez de ser construída de novo (ReusoAlinhamentos.reaproveitar_arvore);
+- se todos os alinhamentos da Tarefa são iguais aos de uma Tarefa já comparada, a comparação das subárvores
+  não é refeita: a Tarefa nova é gravada normalmente e ligada aos resultados (Subarvore, ParMAF) da outra pelo
+  parâmetro CHAVE_REUSO (ver ComparacaoReaproveitavel).
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+
+from arquivo_arvores import ARQUIVO_ARVORES, abrir, e_arquivo, existe, ler_arvore, referencia, separar
+from checkpoint import PARAMETROS_COMPARACAO
+from tabelas import Session, AlinhamentoTarefa, Checkpoint, Parametros
+
+
+# Parâmetro (Parametros) da Tarefa cujos resultados de comparação são os de outra Tarefa (Valor = id da origem)
+CHAVE_REUSO = 'reaproveita'
+
+
+def normalizar_alinhamento(path: str) -> bytes:
+    """Nome e sequência de cada linha de um alinhamento clustal, na ordem do arquivo
+
+    Ignora o cabeçalho (versão do alinhador), a quebra em blocos, a linha de conservação e os contadores de
+    resíduos. Um arquivo em outro formato é usado inteiro, só sem as diferenças de fim de linha.
+    """
+    with open(path, 'rb') as f:
+        linhas = f.read().splitlines()
+
+    sequencias = {}
+    for linha in linhas[1:]:
+        if not linha.strip() or linha[:1].isspace():
+            continue
+        partes = linha.split()
+        if len(partes) < 2:
+            return b'\n'.join(linha.rstrip() for linha in linhas)
+        sequencias[partes[0]] = sequencias.get(partes[0], b'') + partes[1]
+
+    return b'\n'.join(nome + b'\t' + sequencia for nome, sequencia in sequencias.items())
+
+
+def chave_alinhamento(path_aln: str, d_parametros_arvore: dict) -> str:
+    """Hash do alinhamento normalizado com os parâmetros da árvore (que mudam a árvore de um mesmo alinhamento)"""
+    h = hashlib.sha256(normalizar_alinhamento(path_aln))
+    # Retomadas trazem os valores como texto (ver carregar_parametros)
+    h.update(json.dumps({chave: str(valor) for chave, valor in d_parametros_arvore.items()}, sort_keys=True).encode())
+
+    return h.hexdigest()
+
+
+class ReusoAlinhamentos:
+    """Registra o hash de cada alinhamento de uma Tarefa e copia as árvores já construídas por outras Tarefas
+
+    Só guarda caminhos e parâmetros, então pode ser passado para as etapas que rodam em outro processo (pipeline.py).
+
+    Args:
+        pasta_execucoes (str): Raiz das execuções, com as árvores promovidas em tarefa_<id>/Trees (ver AreaTrabalho)
+        d_parametros_arvore (dict): Parâmetros de construir_arvore da Tarefa
+    """
+
+    def __init__(self, pasta_execucoes: str, d_parametros_arvore: dict):
+        self.pasta_execucoes = pasta_execucoes
+        self.d_parametros_arvore = dict(d_parametros_arvore)
+
+    def registrar(self, id_tarefa: int, path_aln: str) -> str:
+        """Grava o hash do alinhamento recém-produzido e o devolve"""
+        chave = chave_alinhamento(path_aln, self.d_parametros_arvore)
+        self._gravar(id_tarefa, Path(path_aln).stem, hash=chave)
+
+        return chave
+
+    def _gravar(self, id_tarefa: int, entrada: str, **valores) -> None:
+        session = Session()
+        alinhamento = session.query(AlinhamentoTarefa).filter_by(idTarefa=id_tarefa, entrada=entrada).first()
+        if alinhamento is None:
+            session.add(AlinhamentoTarefa(idTarefa=id_tarefa, entrada=entrada, **valores))
+        else:
+            for coluna, valor in valores.items():
+                setattr(alinhamento, coluna, valor)
+        session.commit()
+        session.close()
+
+    def _chave(self, id_tarefa: int, path_aln: str) -> str:
+        session = Session()
+        chave = session.query(AlinhamentoTarefa.hash).filter_by(idTarefa=id_tarefa, entrada=Path(path_aln).stem).scalar()
+        session.close()
+
+        return chave or self.registrar(id_tarefa, path_aln)
+
+    def arvore_anterior(self, id_tarefa: int, chave: str, nome: str) -> tuple:
+        """Árvore promovida de outra Tarefa com o mesmo alinhamento
+
+        Returns:
+            tuple: (id da Tarefa de origem, caminho ou referência da árvore) ou (None, None)
+        """
+        session = Session()
+        origens = [id_origem for id_origem, in session.query(AlinhamentoTarefa.idTarefa)
+                   .filter(AlinhamentoTarefa.hash == chave, AlinhamentoTarefa.idTarefa != id_tarefa,
+                           AlinhamentoTarefa.arvore == nome)
+                   .order_by(AlinhamentoTarefa.idTarefa.desc())]
+        session.close()
+
+        for id_origem in origens:
+            pasta_trees = os.path.join(self.pasta_execucoes, f'tarefa_{id_origem}', 'Trees')
+            for caminho in (os.path.join(pasta_trees, nome), referencia(os.path.join(pasta_trees, ARQUIVO_ARVORES), nome)):
+                if existe(caminho):
+                    return id_origem, caminho
+
+        return None, None
+
+    def _nome_arvore(self, path_aln: str) -> str:
+        """Nome da árvore do alinhamento, como em construir_arvore"""
+        return f'tree_{Path(path_aln).stem}.{self.d_parametros_arvore.get("output_format", "nexus")}'
+
+    def reaproveitar_arvore(self, id_tarefa: int, path_aln: str, path_out_tree: str) -> str:
+        """Copia para `path_out_tree` a árvore de um alinhamento idêntico já processado por outra Tarefa
+
+        Returns:
+            str: caminho (ou referência) da árvore copiada ou None se ela precisa ser construída
+        """
+        output_format = self.d_parametros_arvore.get('output_format', 'nexus')
+        nome = self._nome_arvore(path_aln)
+        id_origem, origem = self.arvore_anterior(id_tarefa, self._chave(id_tarefa, path_aln), nome)
+        if origem is None:
+            return None
+
+        if e_arquivo(path_out_tree):
+            caminho = abrir(path_out_tree).gravar(nome, ler_arvore(origem, output_format))
+        elif separar(origem)[1] is None:
+            caminho = shutil.copyfile(origem, os.path.join(path_out_tree, nome))
+        else:
+            from Bio import Phylo
+            caminho = os.path.join(path_out_tree, nome)
+            Phylo.write(ler_arvore(origem), caminho, output_format)
+
+        self._gravar(id_tarefa, Path(path_aln).stem, arvore=nome, idTarefaOrigem=id_origem)
+
+        return caminho
+
+    def arvore_construida(self, id_tarefa: int, path_aln: str) -> None:
+        """Registra a árvore construída para o alinhamento, para que outras Tarefas possam copiá-la"""
+        self._gravar(id_tarefa, Path(path_aln).stem, arvore=self._nome_arvore(path_aln))
+
+
+def tarefas_candidatas(id_tarefa: int, completa: bool = False) -> list:
+    """Tarefas comparadas (e que não são elas mesmas um reuso nem uma comparação parcial) com todos os alinhamentos já registrados da Tarefa
+
+    Args:
+        id_tarefa (int): Tarefa atual
+        completa (bool, optional): Exige também que a candidata não tenha outros alinhamentos. Defaults to False.
+
+    Returns:
+        list: ids das Tarefas, da mais recente para a mais antiga
+    """
+    atual = aliased(AlinhamentoTarefa)
+    outra = aliased(AlinhamentoTarefa)
+
+    session = Session()
+    total = session.query(func.count(AlinhamentoTarefa.id)).filter_by(idTarefa=id_tarefa).scalar()
+    if not total:
+        session.close()
+        return []
+
+    comparadas = session.query(Checkpoint.idTarefa).filter_by(etapa='comparacao', chave='resultado')
+    reusos = session.query(Parametros.idTarefa).filter_by(Chave=CHAVE_REUSO)
+    # As comparações em modo de consulta (top-k, grau mínimo) são parciais
+    parciais = session.query(Parametros.idTarefa).filter(Parametros.Chave.in_(PARAMETROS_COMPARACAO))
+    candidatas = [
+        id_outra for id_outra, in session.query(outra.idTarefa)
+        .join(atual, (atual.entrada == outra.entrada) & (atual.hash == outra.hash))
+        .filter(atual.idTarefa == id_tarefa, outra.idTarefa != id_tarefa,
+                outra.idTarefa.in_(comparadas), outra.idTarefa.notin_(reusos), outra.idTarefa.notin_(parciais))
+        .group_by(outra.idTarefa)
+        .having(func.count(outra.id) == total)
+        .order_by(outra.idTarefa.desc())
+    ]
+
+    if completa:
+        candidatas = [
+            id_outra for id_outra in candidatas
+            if session.query(func.count(AlinhamentoTarefa.id)).filter_by(idTarefa=id_outra).scalar() == total
+        ]
+    session.close()
+
+    return candidatas
+
+
+def marcar_reuso(id_tarefa: int, id_origem: int) -> None:
+    """Marca a Tarefa como reuso dos resultados de comparação de `id_origem`"""
+    session = Session()
+    session.add(Parametros(Chave=CHAVE_REUSO, Valor=str(id_origem), idTarefa=id_tarefa))
+    session.commit()
+    session.close()
+
+
+class ComparacaoReaproveitavel:
+    """Adia a comparação das subárvores enquanto os alinhamentos da Tarefa forem iguais aos de outra Tarefa
+
+    Os registros (RegistroSubarvore) de cada árvore ficam guardados enquanto houver uma Tarefa candidata
+    (ver tarefas_candidatas). Se uma árvore deixa de ter candidata, os guardados e os próximos seguem para o
+    comparador; se no fim todos os alinhamentos são iguais aos de uma candidata, nada é comparado.
+
+    Args:
+        id_tarefa (int): Tarefa atual
+        comparador (ComparadorIncremental): Recebe os registros quando a comparação precisa ser feita
+    """
+
+    def __init__(self, id_tarefa: int, comparador):
+        self.id_tarefa = id_tarefa
+        self.comparador = comparador
+        self.pendentes = []
+
+    def consumir(self, registros: list) -> None:
+        if self.pendentes is not None and tarefas_candidatas(self.id_tarefa):
+            self.pendentes.append(registros)
+            return
+
+        self._liberar()
+        self.comparador.consumir(registros)
+
+    def _liberar(self) -> None:
+        if self.pendentes:
+            for registros in self.pendentes:
+                self.comparador.consumir(registros)
+        self.pendentes = None
+
+    def finalizar(self) -> int:
+        """Tarefa cujos resultados são reaproveitados ou None (e os registros guardados são comparados)"""
+        if self.pendentes is not None:
+            candidatas = tarefas_candidatas(self.id_tarefa, completa=True)
+            if candidatas:
+                self.pendentes = None
+                return candidatas[0]
+
+        self._liberar()
+        return None
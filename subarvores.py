@@ -0,0 +1,231 @@
+import hashlib
+from collections import namedtuple
+
+from arquivo_arvores import ler_arvore
+
+
+# Uma subárvore gerada por sub_tree_registros: árvore de origem (linha), arquivo, folhas e topologia canônica (opcional)
+RegistroSubarvore = namedtuple('RegistroSubarvore', ['linha', 'caminho', 'folhas', 'topologia'], defaults=[None])
+
+
+def folhas_subarvore(path: str, data_format: str) -> list:
+    """Lista os nomes das folhas (terminais) de um arquivo de subárvore
+
+    Args:
+        path (str): Caminho do arquivo da subárvore (ou referência a um arquivo único, ver arquivo_arvores.py)
+        data_format (str): Formato do arquivo ("nexus", "newick", ...)
+
+    Returns:
+        list: nomes das folhas
+    """
+    subtree = ler_arvore(path, data_format)
+    return [i.name for i in subtree.get_terminals()]
+
+
+def topologia_canonica(clade) -> str:
+    """Monta uma representação newick da topologia de uma clade, sem comprimentos de ramo
+    e com os filhos ordenados, de forma que duas clades com a mesma topologia gerem a mesma string.
+
+    Args:
+        clade (Clade): Clade do Bio.Phylo
+
+    Returns:
+        str: topologia canônica
+    """
+    if clade.is_terminal():
+        return str(clade.name)
+
+    filhos = sorted(topologia_canonica(filho) for filho in clade.clades)
+    return '(' + ','.join(filhos) + ')'
+
+
+class No:
+    """Nó da ArvoreCompacta: índices do pai e dos filhos e o intervalo das suas folhas"""
+
+    __slots__ = ('nome', 'comprimento', 'pai', 'filhos', 'inicio', 'fim', 'mascara')
+
+    def __init__(self, nome: str, comprimento: float, pai: int):
+        self.nome = nome
+        self.comprimento = comprimento
+        self.pai = pai
+        self.filhos = []
+        self.inicio = 0   # folhas do nó: ArvoreCompacta.folhas[inicio:fim]
+        self.fim = 0
+        self.mascara = 0  # bitset das folhas (ids de `ids`)
+
+    @property
+    def n_folhas(self) -> int:
+        return self.fim - self.inicio
+
+
+class ArvoreCompacta:
+    """Árvore do Bio.Phylo em nós indexados, montada uma vez por árvore lida.
+
+    Os nós ficam em pré-ordem (a mesma de tree.find_clades()), então as folhas de cada clado são um
+    intervalo contíguo de `folhas` e os filhos sempre têm índice maior que o pai. Uma passada de trás para
+    frente (pós-ordem) calcula o intervalo de folhas e o bitset de cada clado em O(n), no lugar de percorrer
+    a subárvore de novo a cada clado (count_terminals/get_terminals).
+
+    Args:
+        tree (Tree): Árvore do Bio.Phylo
+        ids (dict, optional): nome da folha -> id do bit, compartilhado entre árvores para que os bitsets
+            sejam comparáveis (novos nomes são acrescentados). Defaults to um dicionário só desta árvore.
+    """
+
+    __slots__ = ('nos', 'clados', 'folhas', 'ids')
+
+    def __init__(self, tree, ids: dict = None):
+        self.nos = []
+        self.clados = []  # clado do Bio.Phylo de cada nó, para gravar as subárvores
+        self.folhas = []
+        self.ids = ids if ids is not None else {}
+
+        pilha = [(tree.root, -1)]
+        while pilha:
+            clade, pai = pilha.pop()
+            i = len(self.nos)
+            self.nos.append(No(clade.name, clade.branch_length, pai))
+            self.clados.append(clade)
+            if pai >= 0:
+                self.nos[pai].filhos.append(i)
+            if not clade.clades:
+                self.folhas.append(clade.name)
+            pilha.extend((filho, i) for filho in reversed(clade.clades))
+
+        k = len(self.folhas)
+        for no in reversed(self.nos):
+            if no.filhos:
+                primeiro, ultimo = self.nos[no.filhos[0]], self.nos[no.filhos[-1]]
+                no.inicio, no.fim = primeiro.inicio, ultimo.fim
+                for filho in no.filhos:
+                    no.mascara |= self.nos[filho].mascara
+            else:
+                # Folhas visitadas de trás para frente
+                k -= 1
+                no.inicio, no.fim = k, k + 1
+                no.mascara = 1 << self.ids.setdefault(no.nome, len(self.ids))
+
+    @classmethod
+    def ler(cls, path: str, data_format: str, ids: dict = None) -> 'ArvoreCompacta':
+        """Lê um arquivo de árvore ou uma referência a um arquivo único (ver arquivo_arvores.py)"""
+        return cls(ler_arvore(path, data_format), ids)
+
+    def __len__(self):
+        return len(self.nos)
+
+    def folhas_clado(self, i: int) -> list:
+        no = self.nos[i]
+        return self.folhas[no.inicio:no.fim]
+
+    def topologias(self) -> list:
+        """Topologia canônica de todos os clados (como topologia_canonica), de baixo para cima"""
+        topologias = [None] * len(self.nos)
+        for i in range(len(self.nos) - 1, -1, -1):
+            no = self.nos[i]
+            if no.filhos:
+                topologias[i] = '(' + ','.join(sorted(topologias[filho] for filho in no.filhos)) + ')'
+            else:
+                topologias[i] = str(no.nome)
+
+        return topologias
+
+
+def assinatura_subarvore(folhas: list, topologia: str = None) -> str:
+    """Gera a assinatura canônica de uma subárvore a partir do conjunto de folhas.
+    Duas subárvores com o mesmo conjunto de folhas (e, se informada, a mesma topologia) têm a mesma assinatura.
+
+    Args:
+        folhas (list): Nomes das folhas da subárvore
+        topologia (str, optional): Topologia canônica (ver topologia_canonica). Defaults to None.
+
+    Returns:
+        str: hash hexadecimal da subárvore
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update('\x00'.join(sorted(folhas)).encode())
+
+    if topologia is not None:
+        h.update(b'\x01')
+        h.update(topologia.encode())
+
+    return h.hexdigest()
+
+
+class IndiceAssinaturas:
+    """Agrupa subárvores idênticas pela assinatura do conjunto de folhas.
+
+    Os nomes das folhas são internados (cada nome recebe um inteiro) e cada assinatura guarda
+    o conjunto de ids das folhas, as linhas (árvores) em que aparece e os caminhos das subárvores.
+    """
+
+    def __init__(self, topologia: bool = False):
+        self.topologia = topologia
+        self.ids_folhas = {}    # nome da folha -> id inteiro
+        self.folhas = {}        # assinatura -> frozenset com os ids das folhas
+        self.membros = {}       # assinatura -> lista de (linha, caminho)
+        self.linhas = {}        # assinatura -> set com as linhas em que aparece
+        self.assinaturas = {}   # caminho -> assinatura
+
+    def internar(self, nome: str) -> int:
+        if nome not in self.ids_folhas:
+            self.ids_folhas[nome] = len(self.ids_folhas)
+
+        return self.ids_folhas[nome]
+
+    def assinatura(self, folhas: list, topologia: str = None) -> str:
+        """Assinatura de uma subárvore segundo a configuração do índice"""
+        return assinatura_subarvore(folhas, topologia if self.topologia else None)
+
+    def adicionar(self, linha: int, path: str, folhas: list, topologia: str = None) -> str:
+        """Adiciona uma subárvore ao índice
+
+        Args:
+            linha (int): Linha da matriz de subárvores (árvore de origem)
+            path (str): Caminho do arquivo da subárvore
+            folhas (list): Nomes das folhas
+            topologia (str, optional): Topologia canônica, usada somente se o índice considerar topologia
+
+        Returns:
+            str: assinatura da subárvore
+        """
+        assinatura = self.assinatura(folhas, topologia)
+
+        if assinatura not in self.folhas:
+            self.folhas[assinatura] = frozenset(self.internar(nome) for nome in folhas)
+            self.membros[assinatura] = []
+            self.linhas[assinatura] = set()
+
+        self.membros[assinatura].append((linha, path))
+        self.linhas[assinatura].add(linha)
+        self.assinaturas[path] = assinatura
+
+        return assinatura
+
+    def adicionar_registros(self, registros) -> None:
+        """Adiciona ao índice os registros (RegistroSubarvore) de gerar_subarvores / sub_tree_registros"""
+        for registro in registros:
+            self.adicionar(registro.linha, registro.caminho, registro.folhas, registro.topologia)
+
+    def adicionar_arquivo(self, linha: int, path: str, data_format: str) -> str:
+        tree = ler_arvore(path, data_format)
+        folhas = [i.name for i in tree.get_terminals()]
+        topologia = topologia_canonica(tree.root) if self.topologia else None
+
+        return self.adicionar(linha, path, folhas, topologia)
+
+    @classmethod
+    def from_matrix(cls, matrix_subtree: list, data_format: str = 'nexus', topologia: bool = False):
+        """Monta o índice a partir da matriz de subárvores gerada por make_matrix.
+        Cada arquivo de subárvore é lido uma única vez. Células None (preenchimento) são ignoradas.
+        """
+        indice = cls(topologia)
+
+        for linha, row in enumerate(matrix_subtree):
+            for path in row:
+                if path is not None:
+                    indice.adicionar_arquivo(linha, path, data_format)
+
+        return indice
+
+    def __len__(self):
+        return len(self.folhas)
@@ -1,9 +1,13 @@
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy import Column, Integer, String, Float, ForeignKey, create_engine
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
 import time
+import os
 
-engine = create_engine('sqlite:///dados.db')
+# NMFSTP_DB permite apontar vários hosts para o mesmo banco (ex.: postgresql://...)
+url_banco = os.environ.get('NMFSTP_DB', 'sqlite:///dados.db')
+# Vários workers (ver fila.py) escrevem ao mesmo tempo: o sqlite espera o lock em vez de falhar em 5s
+engine = create_engine(url_banco, connect_args={'timeout': 30} if url_banco.startswith('sqlite') else {})
 Base = declarative_base()
 Session = sessionmaker(bind=engine)
 
@@ -56,11 +60,118 @@ class Parametros(Base):
     Valor = Column(String(50))
     idTarefa = Column(Integer, ForeignKey('Tarefa.id'))
 
-class Tarefas_Entradas():
+class Subarvore(Base):
+    __tablename__ = 'Subarvore'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idLocal = Column(Integer, nullable=False)  # id da subárvore dentro do ResultadoMAF
+    nome = Column(String(256), nullable=False)  # caminho do arquivo ou assinatura
+    idTarefa = Column(Integer, ForeignKey('Tarefa.id'))
+
+class ParMAF(Base):
+    __tablename__ = 'ParMAF'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    grau = Column(Integer, nullable=False)
+    origem = Column(Integer, nullable=False)  # Subarvore.idLocal
+    destino = Column(Integer, nullable=False)  # Subarvore.idLocal
+    idTarefa = Column(Integer, ForeignKey('Tarefa.id'))
+
+class MembroSubarvore(Base):
+    __tablename__ = 'MembroSubarvore'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idLocal = Column(Integer, nullable=False)  # Subarvore.idLocal (assinatura)
+    linha = Column(Integer, nullable=False)  # árvore de origem (linha da matriz de subárvores)
+    subarvore = Column(String(256), nullable=False)  # tree_<entrada>_<clado>.<formato>: árvore promovida e clado
+    idTarefa = Column(Integer, ForeignKey('Tarefa.id'))
+
+class FolhaSubarvore(Base):
+    __tablename__ = 'FolhaSubarvore'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idLocal = Column(Integer, nullable=False)  # Subarvore.idLocal (assinatura)
+    folha = Column(String(256), nullable=False)
+    idTarefa = Column(Integer, ForeignKey('Tarefa.id'))
+
+class Tarefas_Entradas(Base):
     __tablename__ = 'Tarefas_Entradas'
 
+    id = Column(Integer, primary_key=True, autoincrement=True)
     idTarefa = Column(Integer, ForeignKey('Tarefa.id'))
     idEntrada = Column(Integer, ForeignKey('Entrada.id'))
+    idExecucao = Column(Integer, ForeignKey('Execucao.id'))  # Tempo do alinhamento dessa entrada
+
+class Fila(Base):
+    __tablename__ = 'Fila'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    entrada = Column(String(256), nullable=False)  # Caminho do fasta
+    algoritmo = Column(String(50), nullable=False)
+    parametros = Column(String(1024))  # JSON com tags e params do alinhador
+    prioridade = Column(Float, default=0)
+    estado = Column(String(20), nullable=False, default='pendente')  # pendente, executando, concluido, falhou
+    tentativas = Column(Integer, nullable=False, default=0)
+    maxTentativas = Column(Integer, nullable=False, default=3)
+    worker = Column(String(100))
+    token = Column(String(36))
+    leaseAte = Column(Float)
+    heartbeat = Column(Float)
+    erro = Column(String(1024))
+    idTarefa = Column(Integer, ForeignKey('Tarefa.id'))
+
+class Checkpoint(Base):
+    __tablename__ = 'Checkpoint'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idTarefa = Column(Integer, ForeignKey('Tarefa.id'), nullable=False)
+    etapa = Column(String(30), nullable=False)  # alinhamento, arvore, comparacao, retomada
+    chave = Column(String(256), nullable=False)  # unidade da etapa (ex.: arquivo de entrada)
+    artefato = Column(String(512))  # arquivo produzido pela unidade
+    hora = Column(Float)
+
+class Perfil(Base):
+    __tablename__ = 'Perfil'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idExecucao = Column(Integer, ForeignKey('Execucao.id'), nullable=False)
+    etapa = Column(String(50), nullable=False)
+    arquivo = Column(String(512))  # .prof (pstats); resumo em .txt e alocações em _memoria.txt ao lado
+    segundos = Column(Float)
+    picoMemoria = Column(Float)  # bytes (tracemalloc)
+
+class DistanciaArvore(Base):
+    __tablename__ = 'DistanciaArvore'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idTarefaA = Column(Integer, ForeignKey('Tarefa.id'), nullable=False)
+    idTarefaB = Column(Integer, ForeignKey('Tarefa.id'), nullable=False)
+    entrada = Column(String(256), nullable=False)  # árvores da mesma entrada (tree_<entrada>)
+    rf = Column(Integer)  # Robinson–Foulds (bipartições não triviais)
+    rfNormalizado = Column(Float)  # rf / 2(n - 3)
+    rfPonderado = Column(Float)  # soma das diferenças de comprimento de ramo
+
+class CalibracaoHost(Base):
+    __tablename__ = 'CalibracaoHost'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idHost = Column(Integer, ForeignKey('Host.id'), nullable=False, unique=True)
+    teraflops = Column(Float)  # produto de matrizes float64 (NumPy)
+    bandaMemoria = Column(Float)  # MB/s, cópia de vetor
+    texto = Column(Float)  # MB/s, leitura de fasta em um núcleo
+    latenciaSubprocesso = Column(Float)  # ms
+    fator = Column(Float)  # velocidade em relação ao host de referência (ver calibracao.py)
+    hora = Column(Float)
+
+class AlinhamentoTarefa(Base):
+    __tablename__ = 'AlinhamentoTarefa'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    idTarefa = Column(Integer, ForeignKey('Tarefa.id'), nullable=False)
+    entrada = Column(String(256), nullable=False)  # nome do alinhamento (sem extensão)
+    hash = Column(String(64), nullable=False)  # alinhamento normalizado + parâmetros da árvore (ver reuso.py)
+    arvore = Column(String(256))  # nome da árvore (tree_<entrada>.<formato>)
+    idTarefaOrigem = Column(Integer, ForeignKey('Tarefa.id'))  # Tarefa de onde a árvore foi copiada
 
 def create_or_retrieve(obj, Classe, atributos):
     session = Session()
@@ -81,6 +192,20 @@ def create_or_retrieve(obj, Classe, atributos):
     
     return instancia
 
+def criar_tabelas():
+    """Cria as tabelas que ainda não existem no banco (as existentes não são alteradas)"""
+    # Outro processo (ex.: workers da fila iniciados juntos) pode criar uma tabela entre a verificação e o
+    # CREATE TABLE: cada falha quer dizer que mais uma tabela já existe, então basta tentar de novo
+    for tentativa in range(len(Base.metadata.tables) + 1):
+        try:
+            Base.metadata.create_all(engine)
+            return
+        except OperationalError:
+            if tentativa == len(Base.metadata.tables):
+                raise
+
+# Único ponto de criação das tabelas: quem usa o banco importa este módulo
+criar_tabelas()
+
 if __name__ == '__main__':
-    print("Criando Tabelas")
-    Base.metadata.create_all(engine) # Cria as tabelas de acordo com as classes
+    print(f"Tabelas criadas em {url_banco}")
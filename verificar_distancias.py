@@ -0,0 +1,85 @@
+"""Confere o cálculo de RF de distancias.py contra o DendroPy em árvores aleatórias geradas com semente fixa
+
+Para cada tamanho, gera árvores aleatórias (nomes e comprimentos de ramo sorteados), calcula as matrizes com
+comparar_arvores e compara cada par com treecompare.symmetric_difference (RF) e
+treecompare.weighted_robinson_foulds_distance (RF ponderada) do DendroPy, como árvores não enraizadas.
+Termina com código 1 se algum par divergir. O DendroPy só é necessário aqui.
+
+Uso:
+    python verificar_distancias.py
+    python verificar_distancias.py --taxa 5 12 30 200 --arvores 8 --semente 3
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+
+def arvore_aleatoria(rng: random.Random, nomes: list) -> str:
+    """Newick de uma árvore binária aleatória: junta pares de clados sorteados até sobrar um"""
+    clados = [f'{nome}:{rng.uniform(0.01, 1):.6f}' for nome in rng.sample(nomes, len(nomes))]
+    while len(clados) > 2:
+        a, b = sorted(rng.sample(range(len(clados)), 2), reverse=True)
+        novo = f'({clados.pop(a)},{clados.pop(b)}):{rng.uniform(0.01, 1):.6f}'
+        clados.append(novo)
+
+    return f'({",".join(clados)});'
+
+
+def verificar(taxa: list, n_arvores: int, semente: int, tolerancia: float = 1e-6) -> int:
+    """Quantidade de pares em que distancias.py e o DendroPy divergem"""
+    import dendropy
+    from dendropy.calculate import treecompare
+    from distancias import comparar_arvores
+
+    rng = random.Random(semente)
+    pasta = tempfile.mkdtemp(prefix='verificar_rf_')
+    divergencias = 0
+
+    try:
+        for n in taxa:
+            nomes = [f'T{i}' for i in range(n)]
+            newicks = [arvore_aleatoria(rng, nomes) for _ in range(n_arvores)]
+            paths = []
+            for i, newick in enumerate(newicks):
+                paths.append(os.path.join(pasta, f'{n}_{i}.nwk'))
+                with open(paths[-1], 'w') as f:
+                    f.write(newick + '\n')
+
+            rf, _, rf_ponderada, _ = comparar_arvores(paths, 'newick')
+
+            namespace = dendropy.TaxonNamespace()
+            arvores = [dendropy.Tree.get(data=newick, schema='newick', taxon_namespace=namespace, rooting='force-unrooted')
+                       for newick in newicks]
+            for arvore in arvores:
+                arvore.encode_bipartitions()
+
+            for i in range(n_arvores):
+                for j in range(i + 1, n_arvores):
+                    esperado = treecompare.symmetric_difference(arvores[i], arvores[j])
+                    esperado_ponderado = treecompare.weighted_robinson_foulds_distance(arvores[i], arvores[j])
+                    if rf[i, j] != esperado or abs(rf_ponderada[i, j] - esperado_ponderado) > tolerancia:
+                        divergencias += 1
+                        print(f'{n} taxa, árvores {i} e {j}: RF {rf[i, j]} (DendroPy {esperado}), '
+                              f'ponderada {rf_ponderada[i, j]:.6f} (DendroPy {esperado_ponderado:.6f})', file=sys.stderr)
+
+            print(f'{n:>5} taxa: {n_arvores * (n_arvores - 1) // 2} pares conferidos')
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    return divergencias
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Confere a RF de distancias.py contra o DendroPy')
+    parser.add_argument('--taxa', type=int, nargs='+', default=[5, 12, 30, 120], help='Tamanhos das árvores')
+    parser.add_argument('--arvores', type=int, default=6, help='Árvores por tamanho')
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args()
+
+    divergencias = verificar(args.taxa, args.arvores, args.semente)
+    if divergencias:
+        print(f'{divergencias} pares divergentes', file=sys.stderr)
+    sys.exit(1 if divergencias else 0)
@@ -0,0 +1,66 @@
+"""Confere o tempo de import dos pontos de entrada contra ORCAMENTO_IMPORTACAO
+
+Cada módulo é importado em um interpretador novo, em uma pasta vazia: além do tempo, o import não pode criar
+arquivos (banco, log) no diretório atual. Termina com código 1 se algum limite for ultrapassado, para rodar
+depois de mudanças nos imports (ou em um CI):
+    python verificar_importacao.py
+    python verificar_importacao.py --repeticoes 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+# Tempo máximo de import (segundos) dos módulos carregados por scripts curtos e pelos processos dos pools
+ORCAMENTO_IMPORTACAO = {
+    'main': 0.25,
+    'pipeline': 0.1,
+    'subarvores': 0.1,
+}
+
+
+def tempo_importacao(modulo: str, repeticoes: int = 5) -> tuple:
+    """Tempo de import de um módulo em um interpretador novo (melhor de `repeticoes`, pelo -X importtime),
+    rodando em uma pasta vazia para detectar arquivos criados no import (banco, log)
+
+    Returns:
+        tuple: (segundos, arquivos criados)
+    """
+    tempos = []
+    criados = set()
+    ambiente = dict(os.environ, PYTHONPATH=RAIZ)
+
+    for _ in range(repeticoes):
+        with tempfile.TemporaryDirectory() as pasta:
+            saida = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+                                   cwd=pasta, env=ambiente, capture_output=True, text=True, check=True).stderr
+            criados.update(os.listdir(pasta))
+
+        linha = [l for l in saida.splitlines() if l.startswith('import time:') and l.split('|')[-1].strip() == modulo][-1]
+        tempos.append(int(linha.split('|')[1]) / 1e6)
+
+    return min(tempos), sorted(criados)
+
+
+def verificar_importacao(orcamento: dict = ORCAMENTO_IMPORTACAO, repeticoes: int = 5) -> bool:
+    """Mostra o tempo de cada módulo e devolve False se algum passar do limite ou criar arquivos"""
+    ok = True
+    for modulo, limite in orcamento.items():
+        segundos, criados = tempo_importacao(modulo, repeticoes)
+        dentro = segundos <= limite and not criados
+        ok = ok and dentro
+        print(f"{modulo:<12} {segundos * 1000:7.1f} ms (limite {limite * 1000:.0f} ms)"
+              f"{' cria ' + ', '.join(criados) if criados else ''} {'ok' if dentro else 'FALHOU'}")
+
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Confere o tempo de import dos pontos de entrada')
+    parser.add_argument('--repeticoes', type=int, default=5, help='Imports por módulo (vale o mais rápido)')
+    args = parser.parse_args()
+
+    sys.exit(0 if verificar_importacao(repeticoes=args.repeticoes) else 1)
@@ -0,0 +1,258 @@
+"""Confere as execuções com vários workers contra a execução sequencial
+
+Quatro verificações, com dados gerados a partir de uma semente, em uma pasta temporária (banco incluído):
+- PipelineArquivos (pipeline.py) com etapas sintéticas em threads e em processos (spawn), com vários workers,
+  contra a aplicação sequencial das mesmas funções, inclusive itens descartados (None) e erros;
+- pipeline_arquivos com os alinhadores simulados (alinhador_simulado.py), vários alinhamentos simultâneos e as
+  árvores em processos, contra files_align -> construir_arvores -> gerar_subarvores: mesmos alinhamentos,
+  árvores e subárvores;
+- a fila de alinhamentos (fila.py) com vários processos worker sobre o mesmo banco SQLite: todos os jobs
+  concluídos uma única vez, e os que falham na primeira tentativa concluídos na segunda;
+- o modo de consulta de executar (top_k e min_grau, ver ComparadorTop): os pares gravados no banco contra os
+  da comparação completa das mesmas entradas, filtrados pelo grau ou com os k maiores graus.
+Termina com código 1 se alguma verificação falhar.
+
+Uso:
+    python verificar_pipeline.py
+    python verificar_pipeline.py --arquivos 10 --workers 4 --semente 3
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+
+def _filtrar(valor: int) -> int:
+    """Etapa sintética: descarta os múltiplos de 7 e falha nos múltiplos de 11"""
+    if valor % 7 == 0:
+        return None
+    if valor % 11 == 0:
+        raise ValueError(f'{valor} é múltiplo de 11')
+
+    return valor * 3
+
+
+def _resumir(valor: int) -> str:
+    """Etapa sintética (em processo): trabalho de CPU com resultado determinístico"""
+    h = str(valor).encode()
+    for _ in range(2000):
+        h = hashlib.sha256(h).digest()
+
+    return h.hex()
+
+
+def _tamanho(valor: str) -> tuple:
+    return valor[:8], len(valor)
+
+
+def verificar_etapas_sinteticas(n: int, workers: int) -> bool:
+    from pipeline import Etapa, PipelineArquivos
+
+    esperado, erros_esperados = {}, set()
+    for i in range(n):
+        try:
+            valor = _filtrar(i)
+        except ValueError:
+            erros_esperados.add(i)
+            continue
+        if valor is not None:
+            esperado[i] = _tamanho(_resumir(valor))
+
+    executor = PipelineArquivos([
+        Etapa('filtrar', _filtrar, workers),
+        Etapa('resumir', _resumir, workers, processos=True),
+        Etapa('tamanho', _tamanho, workers),
+    ], tamanho_fila=2)
+    obtido = {posicao: resultado for posicao, _, resultado in executor.executar(range(n))}
+    erros = {entrada for entrada, _, _ in executor.erros}
+
+    ok = obtido == esperado and erros == erros_esperados
+    print(f'etapas sintéticas: {len(obtido)} resultados, {len(erros)} erros {"ok" if ok else "FALHOU"}')
+
+    return ok
+
+
+def _conteudos(pasta: str) -> dict:
+    conteudos = {}
+    for nome in os.listdir(pasta):
+        with open(os.path.join(pasta, nome), 'rb') as f:
+            conteudos[nome] = f.read()
+
+    return conteudos
+
+
+def _subarvores(lotes) -> set:
+    from arquivo_arvores import nome_arvore
+
+    return {(nome_arvore(registro.caminho), tuple(sorted(registro.folhas))) for lote in lotes for registro in lote}
+
+
+def verificar_pipeline_arquivos(pasta: str, n_arquivos: int, workers: int, semente: int) -> bool:
+    import main
+    from alinhador_simulado import PARAMETROS_CLUSTAL, simulados
+    from benchmark import escrever_fasta, gerar_sequencias
+
+    rng = random.Random(semente)
+    pastas = {nome: os.path.join(pasta, nome) for nome in ('fasta', 'aln', 'trees', 'subtrees',
+                                                          'aln_fluxo', 'trees_fluxo', 'subtrees_fluxo')}
+    for p in pastas.values():
+        os.makedirs(p, exist_ok=True)
+    for i in range(n_arquivos):
+        escrever_fasta(os.path.join(pastas['fasta'], f'SINT{i}'), gerar_sequencias(rng, rng.randint(5, 12), rng.randint(40, 120)))
+
+    algoritmo = 'muscle'
+    args, kwargs = PARAMETROS_CLUSTAL[algoritmo]
+    d_parametros_arvore = {'evolutionary_model': 'nj', 'output_format': 'nexus', 'distance_method': 'identity'}
+
+    # Tempos variados: os alinhamentos terminam fora da ordem de entrada
+    with simulados(segundos=0.05, variacao=0.9, semente=semente):
+        main.files_align(algoritmo, pastas['fasta'], pastas['aln'], *args, **kwargs)
+        main.construir_arvores(pastas['aln'], pastas['trees'], **d_parametros_arvore)
+        sequencial = _subarvores(main.gerar_subarvores(pastas['trees'], pastas['subtrees'], 'nexus'))
+
+        fluxo = _subarvores(main.pipeline_arquivos(algoritmo, pastas['fasta'], pastas['aln_fluxo'], pastas['trees_fluxo'],
+                                                   pastas['subtrees_fluxo'], d_parametros_arvore, *args,
+                                                   workers_alinhamento=workers, workers_arvore=2, workers_subarvore=2,
+                                                   **kwargs))
+
+    verificacoes = {
+        'alinhamentos': _conteudos(pastas['aln']) == _conteudos(pastas['aln_fluxo']),
+        'árvores': _conteudos(pastas['trees']) == _conteudos(pastas['trees_fluxo']),
+        'subárvores': sequencial == fluxo and len(fluxo) > 0,
+    }
+    ok = all(verificacoes.values())
+    print(f'pipeline_arquivos: {n_arquivos} arquivos, {len(fluxo)} subárvores '
+          f'{"ok" if ok else "FALHOU: " + ", ".join(nome for nome, v in verificacoes.items() if not v)}')
+
+    return ok
+
+
+def _job_sintetico(job) -> int:
+    """Job da fila: falha na primeira tentativa dos ids múltiplos de 5"""
+    time.sleep(0.01)
+    if job.id % 5 == 0 and job.tentativas == 1:
+        raise RuntimeError('falha na primeira tentativa')
+
+    return job.id
+
+
+def _worker_fila(_) -> int:
+    from fila import executar_worker
+
+    return executar_worker(_job_sintetico, lease=30, espera=0.05)
+
+
+def verificar_fila(n_jobs: int, workers: int) -> bool:
+    from fila import enfileirar
+    from registro import configuracao_processo, configurar_processo
+    from tabelas import Session, Fila
+
+    enfileirar([f'entrada_{i}' for i in range(n_jobs)], 'muscle')
+    # Os workers enviam o log para a fila do processo principal, como os pools do pipeline
+    with multiprocessing.get_context('spawn').Pool(workers, configurar_processo, configuracao_processo()) as pool:
+        concluidos = pool.map(_worker_fila, range(workers))
+
+    session = Session()
+    jobs = session.query(Fila).all()
+    session.close()
+
+    ok = (sum(concluidos) == n_jobs
+          and all(job.estado == 'concluido' and job.idTarefa == job.id for job in jobs)
+          and all(job.tentativas == (2 if job.id % 5 == 0 else 1) for job in jobs))
+    print(f'fila: {n_jobs} jobs em {workers} processos, concluídos por worker {concluidos} {"ok" if ok else "FALHOU"}')
+
+    return ok
+
+
+def _pares_gravados(id_tarefa: int) -> list:
+    """Pares (ParMAF) de uma Tarefa como (assinatura de origem, assinatura de destino, grau)"""
+    from sqlalchemy.orm import aliased
+    from tabelas import Session, ParMAF, Subarvore
+
+    origem, destino = aliased(Subarvore), aliased(Subarvore)
+    session = Session()
+    pares = (
+        session.query(origem.nome, destino.nome, ParMAF.grau)
+            .join(origem, (origem.idLocal == ParMAF.origem) & (origem.idTarefa == ParMAF.idTarefa))
+            .join(destino, (destino.idLocal == ParMAF.destino) & (destino.idTarefa == ParMAF.idTarefa))
+            .filter(ParMAF.idTarefa == id_tarefa)
+            .all()
+    )
+    session.close()
+
+    return sorted(tuple(par) for par in pares)
+
+
+def verificar_consulta(pasta: str, n_arquivos: int, top_k: int, min_grau: int, semente: int) -> bool:
+    import main
+    from sqlalchemy import func
+    from alinhador_simulado import simulados
+    from benchmark import escrever_fasta, gerar_sequencias
+    from tabelas import Session, Tarefa
+
+    rng = random.Random(semente)
+    pasta_fasta = os.path.join(pasta, 'fasta_consulta')
+    os.makedirs(pasta_fasta, exist_ok=True)
+    for i in range(n_arquivos):
+        escrever_fasta(os.path.join(pasta_fasta, f'CONS{i}'), gerar_sequencias(rng, rng.randint(5, 12), rng.randint(40, 120)))
+
+    # O alinhamento simulado só depende das sequências: as três Tarefas comparam as mesmas árvores
+    tarefas = []
+    with simulados(segundos=0.01, semente=semente):
+        for consulta in ({}, {'top_k': top_k}, {'min_grau': min_grau}):
+            main.executar(1, 'muscle', pasta_fasta, reaproveitar=False, **consulta)
+            session = Session()
+            tarefas.append(session.query(func.max(Tarefa.id)).scalar())
+            session.close()
+
+    completo, top, minimo = (_pares_gravados(id_tarefa) for id_tarefa in tarefas)
+    verificacoes = {
+        'top_k': (set(top) <= set(completo)
+                  and sorted(grau for *_, grau in top) == sorted(grau for *_, grau in completo)[-top_k:]),
+        'min_grau': minimo == [par for par in completo if par[2] >= min_grau],
+    }
+    ok = len(completo) > top_k and all(verificacoes.values())
+    print(f'consulta: {len(completo)} pares, top {top_k} e {len(minimo)} com grau >= {min_grau} '
+          f'{"ok" if ok else "FALHOU: " + ", ".join(nome for nome, v in verificacoes.items() if not v)}')
+
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Confere as execuções com vários workers contra a sequencial')
+    parser.add_argument('--arquivos', type=int, default=6, help='Arquivos fasta sintéticos do pipeline')
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--semente', type=int, default=0)
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix='verificar_pipeline_')
+    cwd = os.getcwd()
+    # Banco, log e pastas de dados ficam na pasta temporária (os processos herdam o ambiente)
+    os.environ['NMFSTP_DB'] = f'sqlite:///{os.path.join(pasta, "dados.db")}'
+    os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [RAIZ, os.environ.get('PYTHONPATH')]))
+    sys.path.insert(0, RAIZ)
+    os.chdir(pasta)
+
+    from registro import configurar_logging
+    # Os erros das etapas e dos jobs sintéticos são esperados: vão só para o log da pasta temporária
+    listener = configurar_logging(console=False)
+    try:
+        resultados = [
+            verificar_etapas_sinteticas(60, args.workers),
+            verificar_pipeline_arquivos(pasta, args.arquivos, args.workers, args.semente),
+            verificar_fila(4 * args.arquivos, args.workers),
+            verificar_consulta(pasta, args.arquivos, 10, 4, args.semente),
+        ]
+    finally:
+        listener.stop()
+        os.chdir(cwd)
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    sys.exit(0 if all(resultados) else 1)